@@ -0,0 +1,174 @@
+"""
+Lote de acciones del mesero en una sola transacción.
+
+Liberar varias mesas, confirmar llegadas y cambiar capacidades seguidas eran
+un POST cada una, con su commit y su ronda de avisos. Aquí llegan todas
+juntas (p. ej. una tablet con wifi intermitente que guardó acciones mientras
+no tenía conexión): se aplican en orden con las mismas funciones de mesas.py
+y cocina.py y, si alguna falla, no se aplica ninguna. La ruta hace un solo
+commit, una sola ronda de emisiones y un solo recálculo de la cola.
+
+Si la tablet reintenta un lote que ya se aplicó (se cortó la respuesta), el
+mismo `id_lote` devuelve la respuesta guardada en vez de aplicarlo otra vez.
+El registro de lotes vive en memoria de cada proceso por VIGENCIA_LOTE.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import cocina
+import locales
+import mesas
+from mesas import TransicionInvalida
+from models import Cliente, Mesa
+
+MAXIMO_ACCIONES = 50
+VIGENCIA_LOTE = 600  # segundos
+MAXIMO_LOTES = 500
+
+
+class AccionFallida(TransicionInvalida):
+    """Una acción del lote no se pudo aplicar; `indice` es su posición (desde 0)"""
+
+    def __init__(self, indice, accion, mensaje, status=None):
+        super().__init__(f"Acción {indice + 1} ({accion}): {mensaje}", status)
+        self.indice = indice
+
+
+def _mesa_id(datos):
+    try:
+        return int(datos['mesa_id'])
+    except (KeyError, TypeError, ValueError):
+        raise TransicionInvalida("Falta mesa_id", 400)
+
+
+def _liberar(datos, lote):
+    resultado = mesas.liberar(_mesa_id(datos))
+    lote['asignaciones'] += resultado['asignaciones']
+    lote['cola'] = True
+    return resultado
+
+
+def _confirmar_llegada(datos, lote):
+    mesa_id = _mesa_id(datos)
+    resultado = mesas.confirmar_llegada(mesa_id)
+    # Con el comensal en la mesa, su orden previa pasa a cocina/bar
+    lote['pedidos'] += cocina.pedidos_de_orden_previa(mesa_id)
+    if resultado['cliente_id']:
+        lote['llegadas'].append(resultado['cliente_id'])
+    return resultado
+
+
+def _cambiar_capacidad(datos, lote):
+    return mesas.cambiar_capacidad(_mesa_id(datos), datos.get('capacidad'))
+
+
+def _reservar(datos, lote):
+    return mesas.reservar(_mesa_id(datos))
+
+
+def _cancelar_reserva(datos, lote):
+    resultado = mesas.cancelar_reserva(_mesa_id(datos))
+    lote['asignaciones'] += resultado['asignaciones']
+    lote['cola'] = True
+    return resultado
+
+
+def _desocupar(datos, lote):
+    reservar = bool(datos.get('reservar'))
+    resultado = mesas.desocupar(_mesa_id(datos), reservar=reservar)
+    lote['asignaciones'] += resultado['asignaciones']
+    lote['cola'] = lote['cola'] or not reservar
+    return resultado
+
+
+def _ocupar(datos, lote):
+    return mesas.ocupar(_mesa_id(datos))
+
+
+# nombre -> función(datos de la acción, acumulado del lote)
+ACCIONES = {
+    'liberar': _liberar,
+    'confirmar_llegada': _confirmar_llegada,
+    'cambiar_capacidad': _cambiar_capacidad,
+    'reservar': _reservar,
+    'cancelar_reserva': _cancelar_reserva,
+    'desocupar': _desocupar,
+    'ocupar': _ocupar,
+}
+
+
+def aplicar(lista):
+    """Aplica las acciones en orden dentro de la transacción actual (sin commit).
+
+    Devuelve lo que la ruta necesita para avisar después del commit:
+    resultados por acción, clientes asignados [(mesa_id, Cliente)], pedidos
+    nuevos, clientes que llegaron y si cambió la cola. Si una acción falla
+    lanza AccionFallida y la ruta hace rollback de todo el lote.
+    """
+    if not isinstance(lista, list) or not lista:
+        raise TransicionInvalida("Se espera una lista de acciones", 400)
+    if len(lista) > MAXIMO_ACCIONES:
+        raise TransicionInvalida(f"Máximo {MAXIMO_ACCIONES} acciones por lote", 400)
+
+    lote = {'resultados': [], 'asignaciones': [], 'pedidos': [], 'llegadas': [], 'cola': False}
+    for indice, datos in enumerate(lista):
+        nombre = datos.get('accion') if isinstance(datos, dict) else None
+        funcion = ACCIONES.get(nombre)
+        if funcion is None:
+            raise AccionFallida(indice, nombre, "acción desconocida", 400)
+        asignadas_antes = len(lote['asignaciones'])
+        try:
+            resultado = funcion(datos, lote) or {}
+        except TransicionInvalida as e:
+            raise AccionFallida(indice, nombre, e.mensaje, e.status or 409)
+        lote['resultados'].append({
+            'accion': nombre,
+            'mesa_id': datos.get('mesa_id'),
+            'mesas': resultado.get('mesas') or [resultado.get('mesa', datos.get('mesa_id'))],
+            'asignados': [{'mesa_id': mesa_id, 'cliente_id': cliente.id}
+                          for mesa_id, cliente in lote['asignaciones'][asignadas_antes:]],
+        })
+    return lote
+
+
+def estado(local=None):
+    """Estado de las mesas y largo de la fila del local, para responder al lote"""
+    local = local or locales.actual()
+    filas = Mesa.query.filter_by(local=local).order_by(Mesa.id).all()
+    en_cola = Cliente.query.filter_by(local=local, assigned_table=None).count()
+    return {
+        'mesas': [{'id': m.id, 'estado': mesas.estado_mesa(m), 'capacidad': m.capacidad,
+                   'cliente_id': m.cliente_id} for m in filas],
+        'en_cola': en_cola,
+    }
+
+
+class RegistroLotes:
+    """Respuestas recientes por (local, id_lote), para que un reintento no se aplique dos veces"""
+
+    def __init__(self, vigencia=VIGENCIA_LOTE, maximo=MAXIMO_LOTES):
+        self.vigencia = vigencia
+        self.maximo = maximo
+        self._respuestas = OrderedDict()  # clave -> (vence, respuesta)
+        self._lock = threading.Lock()
+        self.repetidos = 0
+
+    def buscar(self, clave):
+        ahora = time.monotonic()
+        with self._lock:
+            guardado = self._respuestas.get(clave)
+            if guardado and guardado[0] > ahora:
+                self.repetidos += 1
+                return guardado[1]
+            return None
+
+    def guardar(self, clave, respuesta):
+        with self._lock:
+            self._respuestas[clave] = (time.monotonic() + self.vigencia, respuesta)
+            self._respuestas.move_to_end(clave)
+            while len(self._respuestas) > self.maximo:
+                self._respuestas.popitem(last=False)
+
+
+registro = RegistroLotes()
@@ -0,0 +1,300 @@
+"""
+Analítica histórica de ocupación y rotación de mesas.
+
+Cada tabla se lee con UNA consulta que trae solo las columnas necesarias (con
+las fechas ya convertidas a segundos epoch por la base de datos, sin crear un
+datetime por fila) y se pasa a arreglos de NumPy; todo el cálculo es
+vectorizado:
+
+- ocupacion: mapa día de la semana x hora (hora de Chile) con el promedio de
+  mesas ocupadas y el % de ocupación del local.
+- rotacion: por mesa, cantidad de usos, usos por día y duración promedio.
+- espera: distribución del tiempo en la fila (joined_at -> atendido_at):
+  percentiles e histograma.
+- no_show: clientes llamados a una mesa que se liberó sin que llegaran, y
+  turnos cancelados en la fila. Sale de EventoCola porque los turnos
+  cancelados se eliminan de cliente.
+
+Los resultados se guardan por (local, desde, hasta). Un rango ya cerrado no
+cambia y queda en caché hasta que se desaloja (LRU); uno que incluye hoy se
+recalcula pasados TTL_RANGO_ABIERTO segundos.
+
+NumPy se importa en el primer cálculo, no al arrancar la aplicación.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+from sqlalchemy import case, func, or_, select
+
+import eventos
+import locales
+from models import db, Cliente, EventoCola, Mesa, UsoMesa
+from tiempo import ZONA_CHILE, ahora_chile, inicio_dia_utc
+
+DIAS_POR_DEFECTO = 90
+DIAS_MAXIMOS = 3 * 366
+TTL_RANGO_ABIERTO = 60  # segundos
+MAXIMO_EN_CACHE = 64
+# Un uso más largo (mesa que quedó ocupada por olvido) se recorta al repartirlo por hora
+DURACION_MAXIMA = 24 * 3600
+# Bordes del histograma de espera, en minutos (el último tramo es "90 o más")
+TRAMOS_ESPERA = (0, 5, 10, 15, 20, 30, 45, 60, 90)
+PERCENTILES = (50, 75, 90, 95)
+# Tras el fin del rango se siguen leyendo eventos para ver si el cliente llamado llegó
+MARGEN_NO_SHOW = timedelta(hours=6)
+
+_CODIGOS = {eventos.ASIGNACION: 0, eventos.LLEGADA: 1, eventos.LIBERACION: 2,
+            eventos.INGRESO: 3, eventos.CANCELACION: 4}
+
+
+def rango(desde=None, hasta=None):
+    """Fechas 'YYYY-MM-DD' (hora de Chile, ambas inclusive) -> (date, date).
+
+    Sin `hasta` es hoy; sin `desde`, DIAS_POR_DEFECTO días antes. Lanza
+    ValueError con un mensaje para el usuario si el rango no es válido.
+    """
+    try:
+        fin = date.fromisoformat(hasta) if hasta else ahora_chile().date()
+        inicio = date.fromisoformat(desde) if desde else fin - timedelta(days=DIAS_POR_DEFECTO - 1)
+    except ValueError:
+        raise ValueError("Fecha no válida, se espera YYYY-MM-DD")
+    if inicio > fin:
+        raise ValueError("'desde' es posterior a 'hasta'")
+    if (fin - inicio).days >= DIAS_MAXIMOS:
+        raise ValueError(f"El rango no puede superar {DIAS_MAXIMOS} días")
+    return inicio, fin
+
+
+def _epoch(columna):
+    """Segundos epoch calculados por la base de datos (sin pasar por FechaUTC)"""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # SQLite guarda la hora UTC sin offset como texto
+        return (func.julianday(columna) - 2440587.5) * 86400.0
+    return func.extract('epoch', columna)
+
+
+def _columnas(np, consulta, n_columnas):
+    """Ejecuta la consulta y devuelve una matriz float64 (filas x columnas)"""
+    filas = db.session.execute(consulta).all()
+    if not filas:
+        return np.empty((0, n_columnas))
+    return np.array(filas, dtype=np.float64)
+
+
+@lru_cache(maxsize=65536)
+def _offset_horas(hora_epoch):
+    """Offset de Chile (en horas, -3 o -4) en esa hora epoch UTC"""
+    instante = datetime.fromtimestamp(hora_epoch * 3600, ZONA_CHILE)
+    return int(instante.utcoffset().total_seconds() // 3600)
+
+
+def _a_hora_chile(np, horas_epoch):
+    """Horas epoch UTC -> horas epoch en hora de Chile (respeta el cambio de horario)"""
+    unicas, inversa = np.unique(horas_epoch, return_inverse=True)
+    offsets = np.fromiter((_offset_horas(h) for h in unicas.tolist()), dtype=np.int64, count=len(unicas))
+    return (unicas + offsets)[inversa]
+
+
+def _ocupacion(np, inicio, fin, total_mesas, dias):
+    """Mapa 7x24 (lunes=0) con el promedio de mesas ocupadas en cada hora.
+
+    Cada uso [inicio, fin) se reparte en las horas que toca: se repite una vez
+    por hora cubierta y se le asigna la parte de esa hora que ocupó.
+    """
+    h0 = inicio // 3600
+    h1 = (fin - 1) // 3600
+    n = h1 - h0 + 1
+    offsets = np.repeat(np.cumsum(n) - n, n)
+    horas = np.repeat(h0, n) + (np.arange(n.sum()) - offsets)
+    segundos = (np.minimum(np.repeat(fin, n), (horas + 1) * 3600)
+                - np.maximum(np.repeat(inicio, n), horas * 3600))
+
+    locales_h = _a_hora_chile(np, horas)
+    dia_semana = (locales_h // 24 + 3) % 7  # el día epoch 0 fue jueves
+    celda = dia_semana * 24 + locales_h % 24
+    mesa_horas = np.bincount(celda, weights=segundos, minlength=7 * 24) / 3600.0
+
+    # Cuántas veces aparece cada día de la semana en el rango
+    veces = np.bincount((dias + 3) % 7, minlength=7)
+    promedio = (mesa_horas.reshape(7, 24) / np.maximum(veces, 1)[:, None])
+    porcentaje = promedio / total_mesas * 100 if total_mesas else np.zeros_like(promedio)
+    return {
+        'mesas_promedio': np.round(promedio, 2).tolist(),
+        'porcentaje': np.round(porcentaje, 1).tolist(),
+        'total_mesas': int(total_mesas),
+    }
+
+
+def _rotacion(np, mesa_usos, duraciones, ids_mesas, n_dias):
+    """Usos, usos por día y duración promedio de cada mesa del local"""
+    ids_mesas = np.asarray(ids_mesas, dtype=np.int64)
+    posicion = np.searchsorted(ids_mesas, mesa_usos)
+    posicion = np.minimum(posicion, max(len(ids_mesas) - 1, 0))
+    validos = (ids_mesas[posicion] == mesa_usos) if len(ids_mesas) else np.zeros(len(mesa_usos), bool)
+    usos = np.bincount(posicion[validos], minlength=len(ids_mesas))
+    total = np.bincount(posicion[validos], weights=duraciones[validos], minlength=len(ids_mesas))
+    promedio = np.divide(total, usos, out=np.zeros(len(ids_mesas)), where=usos > 0)
+    return [
+        {'mesa_id': mesa_id, 'usos': u, 'usos_por_dia': round(u / n_dias, 2),
+         'duracion_promedio_min': round(p / 60, 1), 'horas_ocupada': round(t / 3600, 1)}
+        for mesa_id, u, p, t in zip(ids_mesas.tolist(), usos.tolist(), promedio.tolist(), total.tolist())
+    ]
+
+
+def _espera(np, esperas):
+    """Percentiles, promedio e histograma de la espera en la fila (minutos)"""
+    minutos = esperas / 60.0
+    bordes = np.array(TRAMOS_ESPERA + (np.inf,))
+    conteo, _ = np.histogram(minutos, bins=bordes)
+    tramos = [f'{a}-{b}' for a, b in zip(TRAMOS_ESPERA, TRAMOS_ESPERA[1:])] + [f'{TRAMOS_ESPERA[-1]}+']
+    resultado = {
+        'clientes': int(len(minutos)),
+        'promedio_min': round(float(minutos.mean()), 1) if len(minutos) else 0,
+        'percentiles_min': {},
+        'histograma': [{'tramo': t, 'clientes': c} for t, c in zip(tramos, conteo.tolist())],
+    }
+    if len(minutos):
+        valores = np.percentile(minutos, PERCENTILES)
+        resultado['percentiles_min'] = {f'p{p}': round(float(v), 1) for p, v in zip(PERCENTILES, valores)}
+    return resultado
+
+
+def _no_show(np, codigos, clientes, instantes, fin_rango):
+    """Clientes llamados que no llegaron y turnos cancelados en la fila.
+
+    Un cliente llamado cuenta cuando su asignación ya se resolvió: llegó, o
+    se liberó la mesa. Si se liberó sin que llegara, es un no-show.
+    """
+    en_rango = instantes < fin_rango
+    asignados = np.unique(clientes[(codigos == 0) & en_rango & (clientes >= 0)])
+    llegaron = clientes[codigos == 1]
+    resueltos = asignados[np.isin(asignados, np.concatenate([llegaron, clientes[codigos == 2]]))]
+    no_llegaron = int((~np.isin(resueltos, llegaron)).sum())
+    ingresos = int(((codigos == 3) & en_rango).sum())
+    cancelados = int(((codigos == 4) & en_rango).sum())
+    return {
+        'llamados': int(len(resueltos)),
+        'no_llegaron': no_llegaron,
+        'tasa_no_show': round(no_llegaron / len(resueltos), 3) if len(resueltos) else 0,
+        'ingresos': ingresos,
+        'cancelados': cancelados,
+        'tasa_cancelacion': round(cancelados / ingresos, 3) if ingresos else 0,
+    }
+
+
+def calcular(desde, hasta, local=None):
+    """Ocupación, rotación, espera y no-show del local entre dos fechas (sin caché)"""
+    import numpy as np
+
+    local = local or locales.actual()
+    inicio_utc = inicio_dia_utc(desde)
+    fin_utc = inicio_dia_utc(hasta + timedelta(days=1))
+    fin_epoch = fin_utc.timestamp()
+    n_dias = (hasta - desde).days + 1
+    dias = np.arange(desde.toordinal(), hasta.toordinal() + 1) - date(1970, 1, 1).toordinal()
+
+    ids_mesas = db.session.execute(
+        select(Mesa.id).where(Mesa.local == local).order_by(Mesa.id)
+    ).scalars().all()
+
+    # UsoMesa: mesa, duración y fin del uso (índice local, timestamp)
+    usos = _columnas(np, select(UsoMesa.mesa_id, func.coalesce(UsoMesa.duracion, 0), _epoch(UsoMesa.timestamp))
+                     .where(UsoMesa.local == local, UsoMesa.timestamp >= inicio_utc,
+                            UsoMesa.timestamp < fin_utc), 3)
+    mesa_usos = usos[:, 0].astype(np.int64)
+    duraciones = np.maximum(usos[:, 1], 0)
+    fin = usos[:, 2].astype(np.int64)
+    con_duracion = duraciones > 0
+    inicio = fin - np.minimum(duraciones, DURACION_MAXIMA).astype(np.int64)
+
+    # Cliente: espera en la fila de los atendidos (sin los grupos manuales, que no hacen fila)
+    clientes = _columnas(np, select(_epoch(Cliente.joined_at), _epoch(Cliente.atendido_at))
+                         .where(Cliente.local == local, Cliente.atendido_at >= inicio_utc,
+                                Cliente.atendido_at < fin_utc, Cliente.joined_at.isnot(None),
+                                or_(Cliente.telefono.is_(None), Cliente.telefono != 'manual')), 2)
+    esperas = clientes[:, 1] - clientes[:, 0]
+
+    # EventoCola: asignaciones (sin las de grupos ya sentados), llegadas, liberaciones, ingresos y cancelaciones
+    codigo = case(_CODIGOS, value=EventoCola.tipo)
+    eventos_cola = _columnas(np, select(codigo, func.coalesce(EventoCola.cliente_id, -1), _epoch(EventoCola.created_at))
+                             .where(EventoCola.local == local, EventoCola.tipo.in_(list(_CODIGOS)),
+                                    EventoCola.created_at >= inicio_utc,
+                                    EventoCola.created_at < fin_utc + MARGEN_NO_SHOW,
+                                    or_(EventoCola.tipo != eventos.ASIGNACION, EventoCola.datos.is_(None),
+                                        ~EventoCola.datos.contains('"llego_comensal": true'))), 3)
+
+    return {
+        'local': local,
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'ocupacion': _ocupacion(np, inicio[con_duracion], fin[con_duracion], len(ids_mesas), dias),
+        'rotacion': _rotacion(np, mesa_usos, duraciones, ids_mesas, n_dias),
+        'espera': _espera(np, esperas[esperas >= 0]),
+        'no_show': _no_show(np, eventos_cola[:, 0].astype(np.int64), eventos_cola[:, 1].astype(np.int64),
+                            eventos_cola[:, 2], fin_epoch),
+    }
+
+
+class CacheAnalitica:
+    """LRU de resultados por (local, desde, hasta)"""
+
+    def __init__(self, maximo=MAXIMO_EN_CACHE, ttl_abierto=TTL_RANGO_ABIERTO):
+        self.maximo = maximo
+        self.ttl_abierto = ttl_abierto
+        self._datos = OrderedDict()  # clave -> (vence, resultado); vence=None si el rango está cerrado
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.calculos = 0
+        self.ultimo_calculo_ms = None
+
+    def obtener(self, clave, calcular, cerrado):
+        ahora = time.monotonic()
+        with self._lock:
+            guardado = self._datos.get(clave)
+            if guardado and (guardado[0] is None or guardado[0] > ahora):
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return guardado[1]
+
+        inicio = time.perf_counter()
+        resultado = calcular()
+        duracion_ms = round((time.perf_counter() - inicio) * 1000, 1)
+
+        with self._lock:
+            self.calculos += 1
+            self.ultimo_calculo_ms = duracion_ms
+            self._datos[clave] = (None if cerrado else ahora + self.ttl_abierto, resultado)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+        return resultado
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def metricas(self):
+        with self._lock:
+            return {
+                'en_cache': len(self._datos),
+                'aciertos': self.aciertos,
+                'calculos': self.calculos,
+                'ultimo_calculo_ms': self.ultimo_calculo_ms,
+            }
+
+
+cache = CacheAnalitica()
+
+
+def resumen(desde, hasta, local=None):
+    """Igual que calcular(), pero guardado por rango"""
+    local = local or locales.actual()
+    cerrado = hasta < ahora_chile().date()
+    return cache.obtener((local, desde, hasta), lambda: calcular(desde, hasta, local), cerrado)
+
+
+def metricas():
+    return cache.metricas()
@@ -1,52 +1,40 @@
 import os
-import json
-from flask import Flask, render_template, request, jsonify
+import click
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO, emit, join_room
 from functools import wraps
-from models import UsoMesa, db, Cliente, Mesa, PushSubscription
+from werkzeug.middleware.proxy_fix import ProxyFix
+from models import UsoMesa, db, Cliente, Mesa, PushSubscription, Pedidos, normalizar_telefono
+import mesas
+import clientes
+import acciones
+import sincronizacion
+from estado_cliente import estados, calcular_tiempo_espera_promedio, ESPERA_MAXIMA
+import cocina
+import analitica
+import exportacion
+import suscripciones
+from avisos import avisos
+import codigos_qr
+import eventos
+import locales
+import replicas
+from replicas import solo_lectura
+from emisiones import emisor, SALA_TRABAJADORES, SALA_CLIENTES, sala_cocina
+from tiempo import ahora_utc, a_chile, iso_utc, datetime_to_js_timestamp
+import serializacion
+import estaticos
+import imagenes
+from mesas import TransicionInvalida
+from limites import Limitador, LimitadorSocket, leer_presupuestos, limitar, limitar_socket, ip_cliente
 from datetime import datetime, timedelta
-import pytz
-import statistics
-from flask_migrate import Migrate
 from flask import render_template, request, redirect, url_for, session, flash
 from models import Trabajador
 import secrets
 # from flask_wtf.csrf import CSRFProtect
 
-# 🔔 Imports para notificaciones push
-from pywebpush import webpush, WebPushException
-import base64
-
-def get_chile_time():
-    santiago_tz = pytz.timezone('America/Santiago')
-    return datetime.now(santiago_tz)
-
-def convert_to_chile_time(dt):
-    if dt is None:
-        return None
-    santiago_tz = pytz.timezone('America/Santiago')
-    # Si el datetime no tiene zona horaria, asumimos que está en hora de Chile
-    if dt.tzinfo is None:
-        return santiago_tz.localize(dt)
-    return dt.astimezone(santiago_tz)
-
-def buscar_siguiente_cliente_en_orden():
-    """Busca al PRIMER cliente en la fila (sin saltar a nadie por capacidad)"""
-    try:
-        # Siempre tomar el primer cliente en orden de llegada
-        primer_cliente = Cliente.query.filter_by(assigned_table=None).order_by(Cliente.joined_at).first()
-        return primer_cliente
-        
-    except Exception as e:
-        print(f"Error buscando primer cliente: {e}")
-        return None
-
-def puede_asignar_cliente_a_mesa(cliente, mesa):
-    """Verifica si un cliente específico puede ser asignado a una mesa específica"""
-    if not cliente or not mesa or not cliente.cantidad_comensales:
-        return False
-    return cliente.cantidad_comensales <= mesa.capacidad
+# 🔔 pywebpush (y cryptography) se importan al enviar la primera notificación, no al arrancar
 
 def worker_required(f):
     """Decorador para proteger endpoints que requieren sesión de trabajador"""
@@ -61,122 +49,28 @@ def worker_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# Rate limiting básico para login (diccionario simple para desarrollo)
-login_attempts = {}
+# 🛡️ Rate limiting con memoria acotada (ventana deslizante por IP, ver limites.py)
+limite_login = Limitador('login', maximo=5, ventana=15 * 60)
+limite_qr_landing = Limitador('qr_landing', maximo=30, ventana=60)
+# Eventos de Socket.IO: fichas por SID y por sesión (SOCKET_LIMITES="heartbeat:8/60,registrar_cliente:6/60")
+limite_sockets = LimitadorSocket(leer_presupuestos(os.environ.get('SOCKET_LIMITES')))
 
-def check_rate_limit(ip_address, max_attempts=5, window_minutes=15):
-    """Rate limiting básico para prevenir ataques de fuerza bruta"""
-    now = get_chile_time()
-    window_start = now - timedelta(minutes=window_minutes)
-    
-    # Limpiar intentos antiguos
-    if ip_address in login_attempts:
-        login_attempts[ip_address] = [
-            attempt for attempt in login_attempts[ip_address] 
-            if attempt > window_start
-        ]
-    else:
-        login_attempts[ip_address] = []
-    
-    # Verificar si se excedió el límite
-    if len(login_attempts[ip_address]) >= max_attempts:
-        return False
-    
-    return True
+app = Flask(__name__)
 
-def record_login_attempt(ip_address):
-    """Registrar un intento de login"""
-    if ip_address not in login_attempts:
-        login_attempts[ip_address] = []
-    login_attempts[ip_address].append(get_chile_time())
-
-def calcular_tiempo_espera_promedio():
-    """Calcula el TIEMPO MÍNIMO de espera entre los últimos 6 clientes atendidos.
-    Mantiene el mismo contrato del endpoint (segundos), pero ahora retorna el mínimo.
-    Si hay menos de 3 clientes con datos, retorna 15 minutos por defecto.
-    Aplica límites de 2 a 60 minutos para evitar valores extremos.
-    """
-    try:
-        clientes_recientes = (
-            Cliente.query
-            .filter(Cliente.atendido_at.isnot(None))
-            .order_by(Cliente.atendido_at.desc())
-            .limit(6)
-            .all()
-        )
-
-        if len(clientes_recientes) < 3:
-            return 15 * 60
-
-        tiempos_espera = []
-        for cliente in clientes_recientes:
-            if cliente.joined_at and cliente.atendido_at:
-                try:
-                    inicio = convert_to_chile_time(cliente.joined_at)
-                    fin = convert_to_chile_time(cliente.atendido_at)
-                    diff = (fin - inicio).total_seconds()
-                    if diff >= 0:
-                        tiempos_espera.append(diff)
-                except Exception:
-                    continue
+# 🌐 IP real detrás del proxy de Render: ProxyFix toma de X-Forwarded-For solo las
+# entradas agregadas por los PROXIES_CONFIABLES últimos saltos (las anteriores las
+# escribe el cliente). Sin proxy delante, PROXIES_CONFIABLES=0.
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.environ.get('PROXIES_CONFIABLES', 1)))
 
-        if not tiempos_espera:
-            return 15 * 60
+# ⚡ JSON rápido (orjson si está disponible) con fechas serializadas en UTC
+serializacion.init_app(app)
 
-        minimo = min(tiempos_espera)
-        return max(120, min(3600, minimo))
+# 📦 Estáticos con hash y precomprimidos (manifiesto generado por build_static.py)
+estaticos.init_app(app)
+imagenes.init_app(app)
 
-    except Exception as e:
-        print(f"Error calculando tiempo de espera (mínimo): {e}")
-        return 15 * 60
-
-def datetime_to_js_timestamp(dt):
-    """Convierte un datetime a timestamp compatible con JavaScript"""
-    if dt is None:
-        return None
-    # Asegurar que esté en hora de Chile
-    chile_time = convert_to_chile_time(dt)
-    # Retornar timestamp en milisegundos para JavaScript
-    return int(chile_time.timestamp() * 1000)
-
-def formatear_orden_previa(orden_json_str):
-    """Convierte una orden_previa (JSON en texto) a un texto legible para Mesa.orden.
-    Soporta lista de personas o dict con clave 'personas'.
-    """
-    if not orden_json_str:
-        return None
-    try:
-        data = json.loads(orden_json_str)
-        personas = []
-        if isinstance(data, dict) and isinstance(data.get('personas'), list):
-            personas = data['personas']
-        elif isinstance(data, list):
-            personas = data
-        else:
-            return orden_json_str
-        lineas = []
-        for idx, p in enumerate(personas, start=1):
-            if not isinstance(p, dict):
-                continue
-            comida = p.get('comida') or p.get('plato') or ''
-            bebida = p.get('bebida') or p.get('trago') or ''
-            notas = p.get('notas') or p.get('comentarios') or ''
-            partes = []
-            if comida:
-                partes.append(f"Comida: {comida}")
-            if bebida:
-                partes.append(f"Bebida: {bebida}")
-            if notas:
-                partes.append(f"Notas: {notas}")
-            contenido = ' | '.join(partes) if partes else '(sin detalles)'
-            lineas.append(f"Persona {idx}: {contenido}")
-        if not lineas:
-            return orden_json_str
-        return "Orden previa ingresada por el cliente:\n" + "\n".join(lineas)
-    except Exception:
-        return orden_json_str
-
-app = Flask(__name__)
+# 🏬 Locales (sucursales) que atiende este proceso: variable LOCALES, p. ej. "principal:26,centro:18"
+locales.init_app(app)
 
 # Configuración de base de datos
 if os.environ.get('DATABASE_URL'):
@@ -187,10 +81,10 @@ if os.environ.get('DATABASE_URL'):
         database_url = database_url.replace('postgres://', 'postgresql://', 1)
     
     app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-    # Configurar zona horaria para PostgreSQL
+    # Las fechas se guardan en UTC (TIMESTAMP WITH TIME ZONE); la sesión también trabaja en UTC
     app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
         'connect_args': {
-            'options': '-c timezone=America/Santiago'
+            'options': '-c timezone=UTC'
         }
     }
 else:
@@ -215,6 +109,7 @@ MIGHAgEAMBMGByqGSM49AgEGCCqGSM49AwEHBG0wawIBAQQgm8TC3OWohRPCqBJr
 
 VAPID_PUBLIC_KEY = "BKu0Dg213Uep-ADkCqf2mh5Zl4jJVQvYKSQkiellgpZRJUmaY1hfSeEpR-mRxx-81DL41_-MBDc7inLtW7sh7SU"
 VAPID_EMAIL = "mailto:admin@restaurante-alleria.com"
+avisos.init_app(app, VAPID_PRIVATE_KEY, VAPID_EMAIL)
 
 # Configuración de cookies seguras
 app.config['SESSION_COOKIE_SECURE'] = os.environ.get('FLASK_ENV') == 'production'
@@ -222,6 +117,9 @@ app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=8)  # Expiración de 8 horas
 
+# Dominio que codifican los QR de las mesas (sin definir: el host de la petición)
+app.config['URL_PUBLICA'] = os.environ.get('URL_PUBLICA')
+
 # Inicializar protección CSRF (deshabilitado temporalmente para desarrollo)
 # csrf = CSRFProtect(app)
 
@@ -233,7 +131,70 @@ app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=8)  # Expiración de
 # csrf.exempt('/registro')
 
 db.init_app(app)
-migrate = Migrate(app, db)
+# 📖 Réplica de lectura opcional (DATABASE_REPLICA_URL) para las rutas de solo lectura
+replicas.init_app(app, db)
+# Flask-Migrate arrastra alembic (~100 ms al importar). Solo se registra cuando
+# hace falta: al ejecutar un comando `flask db ...` o al arrancar el servidor (create_app).
+migrate = None
+
+def configurar_migraciones():
+    global migrate
+    if migrate is None:
+        from flask_migrate import Migrate
+        migrate = Migrate(app, db)
+    return migrate
+
+class ComandosMigracion(click.Group):
+    """Grupo `flask db` que carga Flask-Migrate recién cuando se usa"""
+
+    def make_context(self, info_name, args, parent=None, **extra):
+        # El contexto (y por lo tanto la invocación) es del grupo real de Flask-Migrate
+        configurar_migraciones()
+        from flask_migrate.cli import db as grupo_db
+        return grupo_db.make_context(info_name, args, parent=parent, **extra)
+
+app.cli.add_command(ComandosMigracion('db', help='Migraciones de base de datos (Flask-Migrate).'))
+
+@app.cli.command('hoja-qr')
+@click.option('--salida', default='mesas_qr.pdf', show_default=True, help='Archivo PDF a generar.')
+@click.option('--url-base', envvar='URL_PUBLICA', default=codigos_qr.URL_DEFECTO, show_default=True,
+              help='Dominio público que codifican los QR (o variable URL_PUBLICA).')
+@click.option('--procesos', type=int, default=None, help='Procesos para renderizar (por defecto, uno por CPU).')
+@click.option('--local', 'local', default=None, help='Local (sucursal); por defecto, el primero de LOCALES.')
+def hoja_qr(salida, url_base, procesos, local):
+    """Hoja imprimible con el QR de la entrada y de todas las mesas de un local."""
+    local = local or locales.principal()
+    mesa_ids = [fila.id for fila in Mesa.query.with_entities(Mesa.id).filter_by(local=local).order_by(Mesa.id)]
+    paginas = codigos_qr.hoja(url_base, mesa_ids, salida, procesos=procesos, local=local)
+    print(f"✅ {salida}: {len(mesa_ids)} mesas + entrada del local '{local}' en {paginas} página(s)")
+    print(f"🌐 URL base: {url_base}")
+
+@app.cli.command('exportar')
+@click.argument('tabla', type=click.Choice(list(exportacion.TABLAS)))
+@click.option('--formato', type=click.Choice(list(exportacion.FORMATOS)), default='csv', show_default=True,
+              help='parquet y arrow necesitan pyarrow.')
+@click.option('--salida', default=None, help='Archivo a generar (por defecto <tabla>_<local>.<extensión>).')
+@click.option('--desde', default=None, help='Fecha inicial YYYY-MM-DD (hora de Chile, inclusive).')
+@click.option('--hasta', default=None, help='Fecha final YYYY-MM-DD (hora de Chile, inclusive).')
+@click.option('--local', 'local', default=None, help='Local (sucursal); por defecto, el primero de LOCALES.')
+def exportar_historial(tabla, formato, salida, desde, hasta, local):
+    """Exporta clientes, usos de mesa o suscripciones push por lotes (memoria constante)."""
+    try:
+        exportar = exportacion.Exportacion(tabla, formato, desde, hasta, local or locales.principal())
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    salida = salida or exportar.nombre_archivo
+    with open(salida, 'wb') as archivo:
+        for trozo in exportar:
+            archivo.write(trozo.encode('utf-8') if isinstance(trozo, str) else trozo)
+    print(f"✅ {salida}: {exportar.filas} filas de {tabla} del local '{exportar.local}'")
+eventos.init_app(app)
+
+@app.cli.command('purgar-suscripciones')
+def purgar_suscripciones():
+    """Borra las suscripciones push de clientes atendidos, cancelados o inactivas hace tiempo."""
+    borradas = suscripciones.purgar()
+    print(f"✅ Suscripciones borradas: {borradas}")
 
 def run_migrations():
     """Ejecutar migraciones automáticamente en producción"""
@@ -244,12 +205,14 @@ def run_migrations():
             with app.app_context():
                 try:
                     # Verificar si las tablas principales existen
-                    from models import Cliente, Mesa, PushSubscription
+                    from models import Cliente, Mesa, PushSubscription, EventoCola, Pedidos
                     
                     # Intentar consultar cada tabla para verificar que existe
                     Cliente.query.limit(1).all()
                     Mesa.query.limit(1).all() 
                     PushSubscription.query.limit(1).all()
+                    EventoCola.query.limit(1).all()
+                    Pedidos.query.limit(1).all()
                     
                     print("✅ Todas las tablas necesarias ya existen en la base de datos")
                     print("✅ Tabla PushSubscription encontrada - notificaciones push habilitadas")
@@ -280,8 +243,10 @@ def run_migrations():
         print(f"⚠️ Error general en verificación de base de datos: {e}")
         print("🔄 Continuando con inicialización de la aplicación...")
 
-# Registrar función para usar en templates
+# Registrar funciones para usar en templates (conversión a hora de Chile solo al mostrar)
 app.jinja_env.globals['datetime_to_js_timestamp'] = datetime_to_js_timestamp
+app.jinja_env.globals['iso_utc'] = iso_utc
+app.jinja_env.filters['hora_chile'] = lambda dt, formato='%H:%M': a_chile(dt).strftime(formato) if dt else ''
 
 # 🔥 CONFIGURACIÓN ROBUSTA DE SOCKET.IO PARA PRODUCCIÓN
 socketio = SocketIO(
@@ -300,6 +265,7 @@ socketio = SocketIO(
     
     # 📊 Configuraciones de escalabilidad
     max_http_buffer_size=1000000,  # Buffer HTTP máximo
+    json=serializacion,            # Mismo serializador que las respuestas Flask
     
     # 🔒 Seguridad
     cors_allowed_origins="*",  # Ajustar según necesidades
@@ -310,7 +276,11 @@ socketio = SocketIO(
     reconnection_delay=2,     # Delay entre reconexiones
 )
 
+# 📡 Emisiones agrupadas: eventos de trabajadores solo a su sala, sin ráfagas repetidas
+emisor.init_app(app, socketio)
+
 # 📈 DICCIONARIOS PARA TRACKING DE CLIENTES EN MEMORIA
+# (los ids de cliente son únicos entre locales; cada socket guarda además su 'local')
 clientes_conectados = {}  # {client_id: socket_id}
 sockets_activos = {}      # {socket_id: client_info}
 
@@ -330,13 +300,14 @@ def safe_emit(event, data, room=None, to=None):
         return False
 
 # 🎯 FUNCIONES OPTIMIZADAS PARA EMISIÓN SELECTIVA
-def emit_to_workers_only(event, data):
-    """Emite eventos solo a trabajadores (meseros)"""
-    return safe_emit(event, data, room='workers')
+def emit_to_workers_only(event, data=None, local=None):
+    """Emite eventos solo a trabajadores (meseros) del local, agrupando ráfagas idénticas"""
+    emisor.emitir(event, data or None, room=locales.sala(local or locales.actual(), SALA_TRABAJADORES))
+    return True
 
-def emit_to_clients_only(event, data):
-    """Emite eventos solo a clientes"""
-    return safe_emit(event, data, room='clients')
+def emit_to_clients_only(event, data, local=None):
+    """Emite eventos solo a clientes del local"""
+    return safe_emit(event, data, room=locales.sala(local or locales.actual(), SALA_CLIENTES))
 
 def emit_to_specific_client(event, data, client_id):
     """Emite evento a un cliente específico"""
@@ -402,6 +373,7 @@ def handle_connect():
             'client_ip': client_ip,
             'user_agent': user_agent,
             'transport': transport,
+            'local': locales.actual(),
             'client_id': None  # Se llenará cuando se registre el cliente
         }
     except Exception as e:
@@ -431,6 +403,7 @@ def handle_disconnect():
         
         # Limpiar todas las referencias con manejo de errores
         limpiar_cliente_desconectado(sid)
+        limite_sockets.olvidar(sid)
     except Exception as e:
         print(f"❌ Error en handle_disconnect: {e}")
         # Intentar limpiar de todas formas
@@ -478,19 +451,20 @@ def initialize_tables():
             db.create_all()
             print("✅ Tablas inicializadas con create_all()")
         
-        # Inicializar mesas si es necesario
+        # Inicializar mesas de cada local si es necesario (cantidad según LOCALES)
         try:
-            mesas_existentes = db.session.query(db.func.count(Mesa.id)).scalar() or 0
-            mesas_deseadas = 26
-            
-            if mesas_existentes < mesas_deseadas:
-                for i in range(mesas_existentes, mesas_deseadas):
-                    nueva_mesa = Mesa(capacidad=4)
-                    db.session.add(nueva_mesa)
-                db.session.commit()
-                print(f"Inicializadas {mesas_deseadas - mesas_existentes} mesas nuevas")
-            else:
-                print(f"Ya existen {mesas_existentes} mesas en la base de datos")
+            existentes = dict(
+                db.session.query(Mesa.local, db.func.count(Mesa.id)).group_by(Mesa.local).all()
+            )
+            for local, mesas_deseadas in locales.configurados().items():
+                mesas_existentes = existentes.get(local, 0)
+                if mesas_existentes < mesas_deseadas:
+                    for i in range(mesas_existentes, mesas_deseadas):
+                        db.session.add(Mesa(capacidad=4, local=local))
+                    print(f"Local '{local}': inicializadas {mesas_deseadas - mesas_existentes} mesas nuevas")
+                else:
+                    print(f"Local '{local}': ya existen {mesas_existentes} mesas en la base de datos")
+            db.session.commit()
         except Exception as mesa_error:
             print(f"⚠️ Error inicializando mesas: {mesa_error}")
             db.session.rollback()
@@ -499,51 +473,36 @@ def initialize_tables():
         print(f"Error general inicializando tablas: {e}")
         db.session.rollback()
 
-# Solo inicializar si se ejecuta directamente, no en producción
+# Se llama desde create_app(), no al importar el módulo
 def init_app_data():
     """Inicializar datos de la aplicación si es necesario"""
     with app.app_context():  # Agregar contexto de aplicación
         # Siempre inicializar tablas básicas, tanto en desarrollo como producción
         initialize_tables()
 
-# En producción, inicializar solo si es necesario
-try:
-    with app.app_context():
-        # Verificar si las tablas existen
-        Mesa.query.first()
-except Exception:
-    # Las tablas no existen, inicializar
-    with app.app_context():
-        initialize_tables()
-
 @app.route('/cliente')
 def cliente(nombre=None, cantidad_comensales=None, telefono=None):
     # Verificar si ya existe un cliente_id en la sesión
     if 'cliente_id' in session:
         # Obtener el cliente existente
-        cliente_existente = Cliente.query.get(session['cliente_id'])
+        cliente_existente = mesas.del_local(Cliente.query.get(session['cliente_id']))
         if cliente_existente:
             # Si ya tiene mesa asignada y pasaron > 5 minutos desde la asignación, cerrar sesión automáticamente
             try:
                 if cliente_existente.mesa_asignada_at:
-                    ahora = get_chile_time()
-                    asignada = convert_to_chile_time(cliente_existente.mesa_asignada_at)
-                    if (ahora - asignada) > timedelta(minutes=5):
+                    if (ahora_utc() - cliente_existente.mesa_asignada_at) > timedelta(minutes=5):
                         session.pop('cliente_id', None)
                         return redirect(url_for('qr_landing'))
             except Exception:
                 # Si falla cálculo de tiempo, continuar flujo normal
                 pass
-            llegada_cola_iso = cliente_existente.joined_at.isoformat() if cliente_existente.joined_at else None
-            try:
-                llegada_cola_fmt = convert_to_chile_time(cliente_existente.joined_at).strftime('%d/%m %H:%M') if cliente_existente.joined_at else None
-            except Exception:
-                llegada_cola_fmt = cliente_existente.joined_at.strftime('%d/%m %H:%M') if cliente_existente.joined_at else None
+            llegada_cola_iso = iso_utc(cliente_existente.joined_at)
+            llegada_cola_fmt = a_chile(cliente_existente.joined_at).strftime('%d/%m %H:%M') if cliente_existente.joined_at else None
             return render_template(
                 'client.html',
                 numero=cliente_existente.id,
                 nombre=cliente_existente.nombre,
-                mesa_asignada_at=cliente_existente.mesa_asignada_at.isoformat() if cliente_existente.mesa_asignada_at else None,
+                mesa_asignada_at=iso_utc(cliente_existente.mesa_asignada_at),
                 mesa_asignada=cliente_existente.assigned_table,
                 llegada_cola=llegada_cola_iso,
                 llegada_cola_str=llegada_cola_fmt,
@@ -559,39 +518,25 @@ def cliente(nombre=None, cantidad_comensales=None, telefono=None):
     
     # Solo crear nuevo cliente si venimos del formulario
     if nombre and cantidad_comensales and telefono:
-        # 1) Intentar reutilizar un cliente ya ASIGNADO recientemente para este nombre
+        # El turno en espera de este teléfono si ya es de esta sesión, o uno nuevo
         try:
-            candidato = Cliente.query.filter_by(nombre=nombre).order_by(Cliente.id.desc()).first()
-            if candidato and candidato.mesa_asignada_at:
-                # Si fue asignado en los últimos 15 minutos, reutilizarlo
-                try:
-                    ahora_cl = get_chile_time()
-                    asignado_cl = convert_to_chile_time(candidato.mesa_asignada_at)
-                    if (ahora_cl - asignado_cl) <= timedelta(minutes=15):
-                        session['cliente_id'] = candidato.id
-                        # Importante: limpiar la URL para evitar recreaciones al refrescar
-                        return redirect(url_for('cliente'))
-                except Exception:
-                    # Si hay cualquier problema de timezone/None, ignorar y seguir flujo normal
-                    pass
-        except Exception as e:
-            print(f"Advertencia al intentar reutilizar cliente existente: {e}")
-
-        # 2) Crear un nuevo cliente (y luego redirigir a URL limpia sin querystring)
-        nuevo = Cliente(
-            joined_at=get_chile_time(),
-            nombre=nombre,
-            telefono=telefono,
-            cantidad_comensales=int(cantidad_comensales) if str(cantidad_comensales).isdigit() else cantidad_comensales
-        )
-        db.session.add(nuevo)
-        db.session.commit()
+            cliente_id, nuevo = clientes.ingresar(
+                nombre,
+                int(cantidad_comensales) if str(cantidad_comensales).isdigit() else cantidad_comensales,
+                telefono,
+                propio=session.get('cliente_id')
+            )
+            db.session.commit()
+        except TransicionInvalida as e:
+            db.session.rollback()
+            return render_template('qr_landing.html', error=e.mensaje), e.status or 409
         # Guardar el ID del cliente en la sesión
-        session['cliente_id'] = nuevo.id
+        session['cliente_id'] = cliente_id
         
-        emit_to_workers_only('actualizar_cola', {})
-        emit_to_workers_only('actualizar_lista_clientes', {})
-        enviar_estado_cola()
+        emit_to_workers_only('actualizar_lista_clientes')
+        if nuevo:
+            emit_to_workers_only('actualizar_cola')
+            enviar_estado_cola()
         # Redirigir a URL limpia para evitar re-creación al refrescar
         return redirect(url_for('cliente'))
     
@@ -601,9 +546,11 @@ def cliente(nombre=None, cantidad_comensales=None, telefono=None):
 @app.route('/trabajador',methods=['GET',"POST"])
 @login_required
 def trabajador():
-    current_time = get_chile_time()
-    clientes = Cliente.query.filter_by(assigned_table=None).order_by(Cliente.joined_at).all()
-    mesas = Mesa.query.order_by(Mesa.id).all()  # Ordenar por ID para mantener orden consistente
+    local = locales.actual()
+    # La versión se lee antes que las mesas (ver sincronizacion.py)
+    version_estado = sincronizacion.version(local)
+    clientes = Cliente.query.filter_by(local=local, assigned_table=None).order_by(Cliente.joined_at).all()
+    mesas = Mesa.query.filter_by(local=local).order_by(Mesa.id).all()  # Ordenar por ID para mantener orden consistente
     
     # Determinar qué mesas están recién asignadas
     for mesa in mesas:
@@ -612,98 +559,41 @@ def trabajador():
         else:
             mesa.recien_asignada = False
             
-    return render_template('worker.html', clientes=clientes, mesas=mesas)
+    return render_template('worker.html', clientes=clientes, mesas=mesas, version_estado=version_estado)
 
 
-def enviar_estado_cola():
-    clientes = Cliente.query.filter_by(assigned_table=None).order_by(Cliente.joined_at).all()
-    if clientes:
-        primero = clientes[0].id
-    else:
-        primero = None
-    # Para cada cliente en cola, emitimos a su SID la posición y el primero
-    for idx, cliente in enumerate(clientes):
+def enviar_estado_cola(local=None):
+    """La fila del local cambió: sube su versión (despierta los long-polls de /estado_cliente) y
+    programa el envío del estado a cada cliente en la fila; varias llamadas seguidas se agrupan en una"""
+    local = local or locales.actual()
+    estados.cambio(local)
+    emisor.programar('estado_cliente', lambda: enviar_estado_cola_inmediato(local), clave=local)
+
+
+def enviar_estado_cola_inmediato(local):
+    foto = estados.fila(local)
+    # Cada cliente en la fila recibe en su SID su posición, el primero, el tiempo estimado y la versión
+    for indice, cliente in enumerate(foto['clientes']):
         if cliente.sid:
-            socketio.emit('actualizar_posicion', {
-                'primero': primero,
-                'posicion': idx + 1,  # 1-based index
-                'total': len(clientes)
-            }, to=cliente.sid)
+            socketio.emit('estado_cliente', estados.de_fila(foto, indice), to=cliente.sid)
 
 
 # 🔔 FUNCIONES PARA NOTIFICACIONES PUSH REALES
 
 def enviar_notificacion_push(cliente_id, mensaje_data):
     """
-    Envía una notificación push real al cliente especificado
+    Encola una notificación push para el cliente en el carril de su prioridad
+    (ver avisos.py: Urgency, TTL y Topic según mensaje_data['priority'] y 'type').
+    Retorna True si quedó encolada, no si se entregó (eso se ve en /api/metricas).
     
     Args:
         cliente_id (int): ID del cliente
         mensaje_data (dict): Datos del mensaje con keys: type, title, body, mesa, etc.
     """
     try:
-        print(f"🔔 === ENVIANDO NOTIFICACIÓN PUSH ===")
-        print(f"📱 Cliente ID: {cliente_id}")
-        print(f"📦 Datos: {mensaje_data}")
-        
-        # Buscar suscripciones activas del cliente
-        suscripciones = PushSubscription.query.filter_by(
-            cliente_id=cliente_id, 
-            is_active=True
-        ).all()
-        
-        if not suscripciones:
-            print(f"⚠️ No hay suscripciones push activas para cliente {cliente_id}")
-            return False
-        
-        # Configurar headers VAPID
-        vapid_headers = {
-            "Crypto-Key": f"p256ecdsa={VAPID_PUBLIC_KEY}",
-            "Authorization": f"WebPush {VAPID_EMAIL}"
-        }
-        
-        enviadas_exitosamente = 0
-        
-        # Enviar a todas las suscripciones del cliente
-        for suscripcion in suscripciones:
-            try:
-                # Preparar payload
-                payload = json.dumps(mensaje_data)
-                
-                print(f"📡 Enviando push a endpoint: {suscripcion.endpoint[:50]}...")
-                
-                # Enviar notificación push
-                response = webpush(
-                    subscription_info={
-                        "endpoint": suscripcion.endpoint,
-                        "keys": {
-                            "p256dh": suscripcion.p256dh_key,
-                            "auth": suscripcion.auth_key
-                        }
-                    },
-                    data=payload,
-                    vapid_private_key=VAPID_PRIVATE_KEY,
-                    vapid_claims={"sub": VAPID_EMAIL}
-                )
-                
-                print(f"✅ Push enviado exitosamente - Status: {response.status_code}")
-                enviadas_exitosamente += 1
-                
-            except WebPushException as e:
-                print(f"❌ Error WebPush para suscripción {suscripcion.id}: {e}")
-                
-                # Si el endpoint ya no es válido, desactivar la suscripción
-                if e.response and e.response.status_code in [410, 404]:
-                    print(f"🗑️ Desactivando suscripción inválida: {suscripcion.id}")
-                    suscripcion.is_active = False
-                    db.session.commit()
-                    
-            except Exception as e:
-                print(f"❌ Error general enviando push a suscripción {suscripcion.id}: {e}")
-        
-        print(f"📊 Resumen: {enviadas_exitosamente}/{len(suscripciones)} notificaciones enviadas")
-        return enviadas_exitosamente > 0
-        
+        carril = avisos.encolar(cliente_id, mensaje_data)
+        print(f"🔔 Push {mensaje_data.get('type')} para cliente {cliente_id} en carril '{carril}'")
+        return True
     except Exception as e:
         print(f"❌ Error en enviar_notificacion_push: {e}")
         return False
@@ -722,7 +612,7 @@ def notificar_turno_listo(cliente_id, mesa):
         "title": "🎉 ¡ES TU TURNO!",
         "body": f"Tu mesa {mesa} está lista. Tienes 10 minutos para llegar.",
         "mesa": mesa,
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": ahora_utc(),
         "priority": "high"
     }
     
@@ -743,7 +633,7 @@ def notificar_preaviso_turno(cliente_id, minutos_restantes):
         "title": "⏳ Tu turno se acerca",
         "body": f"Faltan aproximadamente {minutos_restantes} minutos para tu turno.",
         "minutos": minutos_restantes,
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": ahora_utc(),
         "priority": "medium"
     }
     
@@ -764,7 +654,7 @@ def notificar_llamada_mesa(cliente_id, mesa):
         "title": "📞 Te están llamando",
         "body": f"El mesero está llamando a tu mesa {mesa}. ¡Acércate!",
         "mesa": mesa,
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": ahora_utc(),
         "priority": "high"
     }
     
@@ -772,111 +662,62 @@ def notificar_llamada_mesa(cliente_id, mesa):
     return enviar_notificacion_push(cliente_id, mensaje_data)
 
 
+def notificar_turno(cliente, mesas_ids):
+    """Avisa al cliente (socket + push) que ya tiene mesa asignada"""
+    if cliente.sid:
+        emit_to_specific_client("es_tu_turno", {
+            "mesa": mesas_ids[0],
+            "mesas_adicionales": list(mesas_ids[1:]),
+            "asignada_at": cliente.mesa_asignada_at
+        }, cliente.id)
+
+    # 🔔 ENVIAR NOTIFICACIÓN PUSH REAL
+    notificar_turno_listo(cliente.id, mesas_ids[0])
+
+
+def notificar_asignaciones(asignaciones):
+    """Notifica a cada cliente reasignado automáticamente al liberar mesas"""
+    for mesa_id, cliente in asignaciones:
+        notificar_turno(cliente, [mesa_id])
+
+
+def notificar_cocina(pedidos):
+    """Envía solo los pedidos que cambiaron a la sala general de cocina del local y a la de su estación"""
+    if not pedidos:
+        return
+    local = pedidos[0].local  # Los pedidos de una acción son de una misma mesa
+    datos = [cocina.pedido_a_dict(p) for p in pedidos]
+    emisor.emitir('pedidos_actualizados', {'pedidos': datos}, room=sala_cocina(local))
+    for estacion in {p['estacion'] for p in datos}:
+        emisor.emitir('pedidos_actualizados', {
+            'pedidos': [p for p in datos if p['estacion'] == estacion]
+        }, room=sala_cocina(local, estacion))
+
+
 @app.route('/liberar_mesa/<int:mesa_id>', methods=['POST'])
 @worker_required
 def liberar_mesa(mesa_id):
     try:
-        mesa = db.session.get(Mesa, mesa_id)
-        if not mesa or not mesa.is_occupied:
-            return jsonify({"success": False, "error": "Mesa no encontrada o no está ocupada"})
-        
-        # Obtener el cliente_id antes de limpiar la mesa
-        cliente_id = mesa.cliente_id
-
-        # IMPORTANTE: Si la mesa fue ocupada manualmente, cliente_id será None.
-        # En ese caso, NO debemos liberar todas las mesas con cliente_id NULL, solo esta mesa.
-        if cliente_id is None:
-            mesas_del_cliente = [mesa]
-            print(f"Liberando SOLO la mesa {mesa_id} (ocupación manual, cliente_id=None)")
-        else:
-            # Buscar TODAS las mesas asignadas al mismo cliente (grupo)
-            mesas_del_cliente = Mesa.query.filter_by(cliente_id=cliente_id, is_occupied=True).all()
-            print(f"Liberando mesa {mesa_id} del cliente {cliente_id}. Total mesas del cliente: {len(mesas_del_cliente)}")
-        
-        # Liberar TODAS las mesas del cliente
-        for mesa_cliente in mesas_del_cliente:
-            # Calcular tiempo usado para cada mesa
-            if mesa_cliente.start_time:
-                start_time_chile = convert_to_chile_time(mesa_cliente.start_time)
-                current_time_chile = get_chile_time()
-                tiempo_usado = (current_time_chile - start_time_chile).total_seconds()
-            else:
-                tiempo_usado = 0
-            
-            # Crear registro de uso para cada mesa
-            uso = UsoMesa(mesa_id=mesa_cliente.id, duracion=tiempo_usado)
-            db.session.add(uso)
-            
-            # Limpiar cada mesa
-            mesa_cliente.is_occupied = False
-            mesa_cliente.start_time = None
-            mesa_cliente.cliente_id = None
-            mesa_cliente.llego_comensal = False
-            mesa_cliente.orden = None
-            
-            print(f"Mesa {mesa_cliente.id} liberada automáticamente")
-        
-        # Ahora procesar asignaciones automáticas para cada mesa liberada
-        mesas_asignadas = []
-        for mesa_liberada in mesas_del_cliente:
-            # Solo procesar si la mesa no está reservada
-            if not mesa_liberada.reservada:
-                siguiente = buscar_siguiente_cliente_en_orden()
-                
-                # Verificar si el primer cliente PUEDE ser asignado a esta mesa
-                if siguiente and puede_asignar_cliente_a_mesa(siguiente, mesa_liberada):
-                    # El primer cliente SÍ cabe en la mesa - asignar automáticamente
-                    siguiente.assigned_table = mesa_liberada.id
-                    siguiente.atendido_at = get_chile_time()
-                    siguiente.mesa_asignada_at = get_chile_time()  # Timestamp para cronómetro
-                    mesa_liberada.is_occupied = True
-                    mesa_liberada.start_time = get_chile_time()
-                    mesa_liberada.cliente_id = siguiente.id
-                    mesa_liberada.llego_comensal = False
-                    # Propagar orden previa si existe
-                    if siguiente.orden_previa:
-                        try:
-                            mesa_liberada.orden = formatear_orden_previa(siguiente.orden_previa)
-                        except Exception:
-                            mesa_liberada.orden = siguiente.orden_previa
-                    
-                # Mantener la sesión del cliente; no limpiar para soportar recargas sin duplicados
-                    
-                    mesas_asignadas.append((mesa_liberada.id, siguiente))
-                    print(f"Mesa {mesa_liberada.id} (capacidad {mesa_liberada.capacidad}) reasignada automáticamente a primer cliente {siguiente.id} ({siguiente.cantidad_comensales} comensales)")
-                elif siguiente:
-                    # El primer cliente NO cabe - reservar mesa para asignación manual
-                    mesa_liberada.reservada = True
-                    print(f"Mesa {mesa_liberada.id} (capacidad {mesa_liberada.capacidad}) - primer cliente {siguiente.id} ({siguiente.cantidad_comensales} comensales) no cabe. Mesa queda RESERVADA para asignación manual")
-                else:
-                    # No hay clientes en espera
-                    print(f"Mesa {mesa_liberada.id} (capacidad {mesa_liberada.capacidad}) - no hay clientes en espera. Mesa queda disponible")
-        
-        # Hacer commit una sola vez al final
+        resultado = mesas.liberar(mesa_id)
         db.session.commit()
-        
+
         # Notificar clientes asignados después del commit exitoso
-        for mesa_id_asignada, cliente_asignado in mesas_asignadas:
-            if cliente_asignado.sid:
-                emit_to_specific_client("es_tu_turno", {
-                    "mesa": mesa_id_asignada,
-                    "asignada_at": cliente_asignado.mesa_asignada_at.isoformat() if cliente_asignado.mesa_asignada_at else None
-                }, cliente_asignado.id)
-            
-            # 🔔 ENVIAR NOTIFICACIÓN PUSH REAL
-            notificar_turno_listo(cliente_asignado.id, mesa_id_asignada)
-        
+        notificar_asignaciones(resultado['asignaciones'])
+
         # Emitir actualizaciones
-        socketio.emit('actualizar_mesas')
-        socketio.emit('actualizar_lista_clientes')
+        emit_to_workers_only('actualizar_mesas')
+        emit_to_workers_only('actualizar_lista_clientes')
         enviar_estado_cola()
-        
+
         return jsonify({
-            "success": True, 
-            "mesas_liberadas": [m.id for m in mesas_del_cliente],
-            "mensaje": f"Se liberaron {len(mesas_del_cliente)} mesa(s) del cliente {cliente_id}"
+            "success": True,
+            "mesas_liberadas": resultado['mesas'],
+            "mensaje": f"Se liberaron {len(resultado['mesas'])} mesa(s) del cliente {resultado['cliente_id']}"
         })
-        
+
+    except TransicionInvalida as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": e.mensaje})
     except Exception as e:
         db.session.rollback()
         print(f"Error en liberar_mesa: {e}")
@@ -890,85 +731,30 @@ def asignar_cliente_a_mesas():
         data = request.get_json()
         cliente_id = data.get('cliente_id')
         mesas_ids = data.get('mesas_ids', [])
-        
+
         if not cliente_id or not mesas_ids:
             return jsonify({"success": False, "error": "Datos incompletos"})
-        
-        cliente = db.session.get(Cliente, cliente_id)
-        if not cliente or cliente.assigned_table is not None:
-            return jsonify({"success": False, "error": "Cliente no encontrado o ya asignado"})
-        
-        # Verificar que todas las mesas estén disponibles
-        mesas = Mesa.query.filter(Mesa.id.in_(mesas_ids)).all()
-        if len(mesas) != len(mesas_ids):
-            return jsonify({"success": False, "error": "Algunas mesas no fueron encontradas"})
-        
-        for mesa in mesas:
-            if mesa.is_occupied:
-                return jsonify({"success": False, "error": f"Mesa {mesa.id} ya está ocupada"})
-        
-        # Verificar capacidad total
-        capacidad_total = sum(m.capacidad for m in mesas)
-        if capacidad_total < cliente.cantidad_comensales:
-            return jsonify({
-                "success": False, 
-                "error": f"Capacidad insuficiente. Necesitas {cliente.cantidad_comensales} personas, tienes {capacidad_total}"
-            })
-        
-        # Asignar el cliente a las mesas
-        mesa_principal = mesas[0]
-        mesa_principal.is_occupied = True
-        mesa_principal.reservada = False
-        mesa_principal.start_time = get_chile_time()
-        mesa_principal.cliente_id = cliente.id
-        mesa_principal.llego_comensal = False
-        
-        # Quitar al cliente de la cola y registrar cuándo fue atendido
-        cliente.assigned_table = mesa_principal.id
-        cliente.atendido_at = get_chile_time()
-        cliente.mesa_asignada_at = get_chile_time()  # Timestamp para cronómetro
-        
-        # Marcar las mesas adicionales como ocupadas (parte del mismo grupo)
-        for mesa in mesas[1:]:
-            mesa.is_occupied = True
-            mesa.reservada = False
-            mesa.start_time = get_chile_time()
-            mesa.cliente_id = cliente.id  # Mismo cliente en todas las mesas del grupo
-            mesa.llego_comensal = False
-        
-        # Si hay orden previa, colocarla en la mesa principal
-        if cliente.orden_previa:
-            try:
-                mesa_principal.orden = formatear_orden_previa(cliente.orden_previa)
-            except Exception:
-                mesa_principal.orden = cliente.orden_previa
 
+        resultado = mesas.asignar_cliente_a_mesas(cliente_id, mesas_ids)
         db.session.commit()
-        
-    # Mantener la sesión del cliente; no limpiar para soportar recargas sin duplicados
-        
-        # Notificar al cliente con función optimizada
-        mesas_asignadas = [m.id for m in mesas]
-        emit_to_specific_client("es_tu_turno", {
-            "mesa": mesa_principal.id,
-            "mesas_adicionales": mesas_asignadas[1:] if len(mesas_asignadas) > 1 else [],
-            "asignada_at": cliente.mesa_asignada_at.isoformat() if cliente.mesa_asignada_at else None
-        }, cliente.id)
-        
-        # 🔔 ENVIAR NOTIFICACIÓN PUSH REAL
-        notificar_turno_listo(cliente.id, mesa_principal.id)
-        
-        socketio.emit('actualizar_mesas')
-        socketio.emit('actualizar_lista_clientes')
+
+        cliente = resultado['cliente']
+        notificar_turno(cliente, resultado['mesas'])
+
+        emit_to_workers_only('actualizar_mesas')
+        emit_to_workers_only('actualizar_lista_clientes')
         enviar_estado_cola()
-        
+
         return jsonify({
-            "success": True, 
-            "mesa_principal": mesa_principal.id,
-            "mesas_totales": [m.id for m in mesas],
+            "success": True,
+            "mesa_principal": resultado['mesas'][0],
+            "mesas_totales": resultado['mesas'],
             "cliente_nombre": cliente.nombre
         })
-        
+
+    except TransicionInvalida as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": e.mensaje})
     except Exception as e:
         db.session.rollback()
         return jsonify({"success": False, "error": str(e)})
@@ -978,28 +764,18 @@ def asignar_cliente_a_mesas():
 def cambiar_capacidad(mesa_id):
     """Cambia la capacidad de una mesa"""
     try:
-        data = request.get_json()
-        nueva_capacidad = int(data.get('capacidad', 4))
-        
-        if nueva_capacidad < 1 or nueva_capacidad > 20:
-            return jsonify({"success": False, "error": "La capacidad debe estar entre 1 y 20 personas"})
-        
-        mesa = db.session.get(Mesa, mesa_id)
-        if not mesa:
-            return jsonify({"success": False, "error": "Mesa no encontrada"})
-        
-        if mesa.is_occupied:
-            return jsonify({"success": False, "error": "No se puede cambiar la capacidad de una mesa ocupada"})
-        
-        mesa.capacidad = nueva_capacidad
+        data = request.get_json() or {}
+        resultado = mesas.cambiar_capacidad(mesa_id, data.get('capacidad', 4))
         db.session.commit()
         
-        socketio.emit('actualizar_mesas')
-        return jsonify({"success": True, "nueva_capacidad": nueva_capacidad})
+        emit_to_workers_only('actualizar_mesas')
+        return jsonify({"success": True, "nueva_capacidad": resultado['capacidad']})
         
-    except (ValueError, TypeError):
-        return jsonify({"success": False, "error": "Capacidad inválida"})
+    except TransicionInvalida as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": e.mensaje})
     except Exception as e:
+        db.session.rollback()
         return jsonify({"success": False, "error": str(e)})
 
 @app.route('/asignar_cliente_multiple/<int:cliente_id>', methods=['POST'])
@@ -1007,76 +783,24 @@ def cambiar_capacidad(mesa_id):
 def asignar_cliente_multiple(cliente_id):
     """Asigna un cliente a múltiples mesas reservadas"""
     try:
-        cliente = db.session.get(Cliente, cliente_id)
-        if not cliente or cliente.assigned_table is not None:
-            return jsonify({"success": False, "error": "Cliente no encontrado o ya asignado"})
-        
-        # Buscar mesas reservadas para este cliente (basado en capacidad necesaria)
-        mesas_reservadas = Mesa.query.filter_by(reservada=True, is_occupied=False).all()
-        
-        if not mesas_reservadas:
-            return jsonify({"success": False, "error": "No hay mesas reservadas disponibles"})
-        
-        # Verificar si las mesas reservadas tienen capacidad suficiente
-        capacidad_total = sum(m.capacidad for m in mesas_reservadas)
-        
-        if capacidad_total < cliente.cantidad_comensales:
-            return jsonify({"success": False, "error": "Las mesas reservadas no tienen capacidad suficiente"})
-        
-        # Asignar el cliente a la primera mesa y marcar las demás como ocupadas también
-        mesa_principal = mesas_reservadas[0]
-        mesa_principal.is_occupied = True
-        mesa_principal.reservada = False
-        mesa_principal.start_time = get_chile_time()
-        mesa_principal.cliente_id = cliente.id
-        mesa_principal.llego_comensal = False
-        
-        # Quitar al cliente de la cola y registrar cuándo fue atendido
-        cliente.assigned_table = mesa_principal.id
-        cliente.atendido_at = get_chile_time()
-        cliente.mesa_asignada_at = get_chile_time()  # Timestamp para cronómetro
-        
-        # Marcar las mesas adicionales como ocupadas (parte del mismo grupo)
-        for mesa in mesas_reservadas[1:]:
-            mesa.is_occupied = True
-            mesa.reservada = False
-            mesa.start_time = get_chile_time()
-            mesa.cliente_id = cliente.id  # Mismo cliente en todas las mesas del grupo
-            mesa.llego_comensal = False
-        
-        # Si hay orden previa, colocarla en la mesa principal
-        if cliente.orden_previa:
-            try:
-                mesa_principal.orden = formatear_orden_previa(cliente.orden_previa)
-            except Exception:
-                mesa_principal.orden = cliente.orden_previa
-
+        resultado = mesas.asignar_a_reservadas(cliente_id)
         db.session.commit()
-        
-    # Mantener la sesión del cliente; no limpiar para soportar recargas sin duplicados
-        
-        # Notificar al cliente después del commit exitoso
-        if cliente.sid:
-            mesas_asignadas = [m.id for m in mesas_reservadas]
-            emit_to_specific_client("es_tu_turno", {
-                "mesa": mesa_principal.id,
-                "mesas_adicionales": mesas_asignadas[1:] if len(mesas_asignadas) > 1 else [],
-                "asignada_at": cliente.mesa_asignada_at.isoformat() if cliente.mesa_asignada_at else None
-            }, cliente.id)
-        
-        # 🔔 ENVIAR NOTIFICACIÓN PUSH REAL
-        notificar_turno_listo(cliente.id, mesa_principal.id)
-        
-        socketio.emit('actualizar_mesas')
-        socketio.emit('actualizar_lista_clientes')
+
+        notificar_turno(resultado['cliente'], resultado['mesas'])
+
+        emit_to_workers_only('actualizar_mesas')
+        emit_to_workers_only('actualizar_lista_clientes')
         enviar_estado_cola()
-        
+
         return jsonify({
-            "success": True, 
-            "mesa_principal": mesa_principal.id,
-            "mesas_totales": [m.id for m in mesas_reservadas]
+            "success": True,
+            "mesa_principal": resultado['mesas'][0],
+            "mesas_totales": resultado['mesas']
         })
-        
+
+    except TransicionInvalida as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": e.mensaje})
     except Exception as e:
         db.session.rollback()
         print(f"Error en asignar_cliente_multiple: {e}")
@@ -1085,25 +809,19 @@ def asignar_cliente_multiple(cliente_id):
 @app.route('/ocupar_mesa/<int:mesa_id>', methods=['POST'])
 @worker_required
 def ocupar_mesa(mesa_id):
-    mesa = db.session.get(Mesa, mesa_id)
-    if mesa and not mesa.is_occupied:
-        mesa.is_occupied = True
-        mesa.start_time = get_chile_time()
-        mesa.cliente_id = None
-        # Mesa libre ocupada manualmente: el comensal ya está presente
-        mesa.llego_comensal = True
-        db.session.commit()
-        socketio.emit('actualizar_mesas')
-        return jsonify({"success": True})
-    return jsonify({"success": False})
+    try:
+        mesas.ocupar(mesa_id)
+    except TransicionInvalida:
+        return jsonify({"success": False})
+    db.session.commit()
+    emit_to_workers_only('actualizar_mesas')
+    return jsonify({"success": True})
 
 @app.route('/ocupar_multiples_mesas', methods=['POST'])
 @worker_required
 def ocupar_multiples_mesas():
     """Ocupa varias mesas libres como un grupo manual (sin cliente en cola).
     Espera JSON: { "mesa_principal": int, "mesas_adicionales": [int, ...] }
-    Crea un cliente 'manual' efímero para linkear las mesas bajo un mismo cliente_id,
-    de modo que liberar y confirmar llegada propaguen entre las mesas del grupo.
     """
     try:
         data = request.get_json() or {}
@@ -1113,52 +831,19 @@ def ocupar_multiples_mesas():
         if not mesa_principal_id or not isinstance(adicionales, list):
             return jsonify({"success": False, "error": "Datos inválidos"}), 400
 
-        # Obtener mesas y validar que estén libres
-        todas_ids = [mesa_principal_id] + [mid for mid in adicionales if mid != mesa_principal_id]
-        mesas = Mesa.query.filter(Mesa.id.in_(todas_ids)).with_for_update().all()
-        mesa_por_id = {m.id: m for m in mesas}
-        faltantes = [mid for mid in todas_ids if mid not in mesa_por_id]
-        if faltantes:
-            return jsonify({"success": False, "error": f"Mesas inexistentes: {faltantes}"}), 404
-
-        # Validar estado libre
-        no_libres = [m.id for m in mesas if m.is_occupied or m.reservada]
-        if no_libres:
-            return jsonify({"success": False, "error": f"Mesas no disponibles: {no_libres}"}), 409
-
-        # Crear un 'cliente' manual para agrupar
-        cliente_manual = Cliente(
-            nombre='Manual',
-            telefono='manual',
-            cantidad_comensales=sum(m.capacidad for m in mesas),
-            joined_at=get_chile_time(),
-            assigned_table=mesa_principal_id,  # marcar como ya asignado para que no aparezca en la cola
-            atendido_at=get_chile_time(),
-            mesa_asignada_at=get_chile_time(),
-            sid=None
-        )
-        db.session.add(cliente_manual)
-        db.session.flush()  # para obtener cliente_manual.id
-
-        # Ocupar todas bajo el mismo cliente_id
-        ahora = get_chile_time()
-        for m in mesas:
-            m.is_occupied = True
-            m.start_time = ahora
-            m.cliente_id = cliente_manual.id
-            # Ocupación manual desde estado libre: ya están presentes
-            m.llego_comensal = True
-            m.reservada = False
-
+        resultado = mesas.ocupar_grupo_manual(mesa_principal_id, adicionales)
         db.session.commit()
 
-        socketio.emit('actualizar_mesas')
+        emit_to_workers_only('actualizar_mesas')
         return jsonify({
             "success": True,
             "mesa_principal": mesa_principal_id,
-            "mesas_totales": todas_ids,
-            "cliente_manual_id": cliente_manual.id
+            "mesas_totales": resultado['mesas'],
+            "cliente_manual_id": resultado['cliente_manual_id']
         })
+    except TransicionInvalida as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": e.mensaje}), e.status
     except Exception as e:
         db.session.rollback()
         print(f"Error en ocupar_multiples_mesas: {e}")
@@ -1167,45 +852,27 @@ def ocupar_multiples_mesas():
 @app.route('/reservar_mesa/<int:mesa_id>', methods=['POST'])
 @worker_required
 def reservar_mesa(mesa_id):
-    mesa = db.session.get(Mesa, mesa_id)
-    if mesa and not mesa.reservada:
-        mesa.reservada = True
-        db.session.commit()
-        socketio.emit('actualizar_mesas')
-        return jsonify({"success": True})
-    return jsonify({"success": False})
+    try:
+        mesas.reservar(mesa_id)
+    except TransicionInvalida:
+        return jsonify({"success": False})
+    db.session.commit()
+    emit_to_workers_only('actualizar_mesas')
+    return jsonify({"success": True})
 
 @app.route('/desocupar_y_reservar/<int:mesa_id>', methods=['POST'])
 @worker_required
 def desocupar_y_reservar(mesa_id):
     """Desocupa una mesa ocupada y la deja marcada como reservada para evitar auto-asignación."""
     try:
-        mesa = db.session.get(Mesa, mesa_id)
-        if not mesa or not mesa.is_occupied:
-            return jsonify({"success": False, "error": "Mesa no encontrada o no está ocupada"}), 400
-
-        # Registrar uso si corresponde
-        if mesa.start_time:
-            start_time_chile = convert_to_chile_time(mesa.start_time)
-            current_time_chile = get_chile_time()
-            tiempo_usado = (current_time_chile - start_time_chile).total_seconds()
-        else:
-            tiempo_usado = 0
-        uso = UsoMesa(mesa_id=mesa.id, duracion=tiempo_usado)
-        db.session.add(uso)
-
-        # Desocupar y reservar
-        mesa.is_occupied = False
-        mesa.start_time = None
-        mesa.llego_comensal = False
-        mesa.orden = None
-        mesa.cliente_id = None
-        mesa.reservada = True
-
+        mesas.desocupar(mesa_id, reservar=True)
         db.session.commit()
 
-        socketio.emit('actualizar_mesas')
+        emit_to_workers_only('actualizar_mesas')
         return jsonify({"success": True})
+    except TransicionInvalida as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": e.mensaje}), e.status
     except Exception as e:
         db.session.rollback()
         print(f"Error en desocupar_y_reservar: {e}")
@@ -1215,67 +882,27 @@ def desocupar_y_reservar(mesa_id):
 @worker_required
 def cancelar_reserva(mesa_id):
     try:
-        mesa = db.session.get(Mesa, mesa_id)
-        if not mesa or not mesa.reservada:
-            return jsonify({"success": False, "error": "Mesa no encontrada o no está reservada"})
-        
-        # Cancelar la reserva
-        mesa.reservada = False
-        
-        # Buscar el PRIMER cliente en la fila (respetando orden de llegada)
-        siguiente = buscar_siguiente_cliente_en_orden()
-        
-        # Verificar si el primer cliente PUEDE ser asignado a esta mesa
-        if siguiente and puede_asignar_cliente_a_mesa(siguiente, mesa):
-            # El primer cliente SÍ cabe en esta mesa - asignar automáticamente
-            siguiente.assigned_table = mesa.id
-            siguiente.atendido_at = get_chile_time()
-            siguiente.mesa_asignada_at = get_chile_time()  # Timestamp para cronómetro
-            mesa.is_occupied = True
-            mesa.start_time = get_chile_time()
-            mesa.cliente_id = siguiente.id
-            mesa.llego_comensal = False
-            # Si el cliente tiene orden previa, propagar a la mesa
-            if siguiente.orden_previa:
-                try:
-                    mesa.orden = formatear_orden_previa(siguiente.orden_previa)
-                except Exception:
-                    mesa.orden = siguiente.orden_previa
-            
-            # Limpiar sesión si corresponde
-            if 'cliente_id' in session and session['cliente_id'] == siguiente.id:
+        resultado = mesas.cancelar_reserva(mesa_id)
+
+        # Limpiar sesión si corresponde
+        for _, asignado in resultado['asignaciones']:
+            if session.get('cliente_id') == asignado.id:
                 session.pop('cliente_id', None)
-            
-            print(f"Mesa {mesa_id} (capacidad {mesa.capacidad}) reserva cancelada y asignada automáticamente a primer cliente {siguiente.id} ({siguiente.cantidad_comensales} comensales)")
-        elif siguiente:
-            # El primer cliente NO cabe - volver a reservar mesa para asignación manual
-            mesa.reservada = True
-            print(f"Mesa {mesa_id} (capacidad {mesa.capacidad}) reserva cancelada - primer cliente {siguiente.id} ({siguiente.cantidad_comensales} comensales) no cabe. Mesa queda RESERVADA para asignación manual")
-            siguiente = None  # No notificar automáticamente
-        else:
-            # No hay clientes en espera - mesa queda libre
-            print(f"Mesa {mesa_id} (capacidad {mesa.capacidad}) reserva cancelada - no hay clientes en espera. Mesa queda disponible")
-        
-        # Hacer commit una sola vez
+
         db.session.commit()
-        
+
         # Notificar al cliente después del commit exitoso
-        if siguiente and siguiente.sid:
-            socketio.emit("es_tu_turno", {
-                "mesa": mesa.id,
-                "asignada_at": siguiente.mesa_asignada_at.isoformat() if siguiente.mesa_asignada_at else None
-            }, to=siguiente.sid)
-        
-        # 🔔 ENVIAR NOTIFICACIÓN PUSH REAL
-        if siguiente:
-            notificar_turno_listo(siguiente.id, mesa.id)
-        
-        socketio.emit('actualizar_mesas')
-        socketio.emit('actualizar_lista_clientes')
+        notificar_asignaciones(resultado['asignaciones'])
+
+        emit_to_workers_only('actualizar_mesas')
+        emit_to_workers_only('actualizar_lista_clientes')
         enviar_estado_cola()
-        
+
         return jsonify({"success": True})
-        
+
+    except TransicionInvalida as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": e.mensaje})
     except Exception as e:
         db.session.rollback()
         print(f"Error en cancelar_reserva: {e}")
@@ -1288,77 +915,90 @@ def desocupar_y_cancelar(mesa_id):
     Luego la deja disponible; si el primer cliente en la fila cabe, se asigna automáticamente.
     """
     try:
-        mesa = db.session.get(Mesa, mesa_id)
-        if not mesa or not mesa.is_occupied:
-            return jsonify({"success": False, "error": "Mesa no encontrada o no está ocupada"}), 400
-
-        # Registrar uso si corresponde
-        if mesa.start_time:
-            start_time_chile = convert_to_chile_time(mesa.start_time)
-            current_time_chile = get_chile_time()
-            tiempo_usado = (current_time_chile - start_time_chile).total_seconds()
-        else:
-            tiempo_usado = 0
-        db.session.add(UsoMesa(mesa_id=mesa.id, duracion=tiempo_usado))
-
-        # Desocupar y cancelar reserva
-        mesa.is_occupied = False
-        mesa.start_time = None
-        mesa.llego_comensal = False
-        mesa.orden = None
-        mesa.cliente_id = None
-        mesa.reservada = False
-
-        # Intentar asignar al primer cliente si cabe; si no cabe, se deja libre sin reservar
-        siguiente = buscar_siguiente_cliente_en_orden()
-        cliente_notificado = None
-        if siguiente and puede_asignar_cliente_a_mesa(siguiente, mesa):
-            siguiente.assigned_table = mesa.id
-            siguiente.atendido_at = get_chile_time()
-            siguiente.mesa_asignada_at = get_chile_time()
-            mesa.is_occupied = True
-            mesa.start_time = get_chile_time()
-            mesa.cliente_id = siguiente.id
-            mesa.llego_comensal = False
-            # Propagar orden previa si existe
-            if siguiente.orden_previa:
-                try:
-                    mesa.orden = formatear_orden_previa(siguiente.orden_previa)
-                except Exception:
-                    mesa.orden = siguiente.orden_previa
-            # Limpiar sesión si corresponde
-            if 'cliente_id' in session and session['cliente_id'] == siguiente.id:
+        resultado = mesas.desocupar(mesa_id, reservar=False)
+
+        # Limpiar sesión si corresponde
+        for _, asignado in resultado['asignaciones']:
+            if session.get('cliente_id') == asignado.id:
                 session.pop('cliente_id', None)
-            cliente_notificado = siguiente
 
         db.session.commit()
 
         # Notificar al cliente asignado, si corresponde
-        if cliente_notificado and cliente_notificado.sid:
-            socketio.emit("es_tu_turno", {
-                "mesa": mesa.id,
-                "asignada_at": cliente_notificado.mesa_asignada_at.isoformat() if cliente_notificado.mesa_asignada_at else None
-            }, to=cliente_notificado.sid)
-
-        # 🔔 ENVIAR NOTIFICACIÓN PUSH REAL
-        if cliente_notificado:
-            notificar_turno_listo(cliente_notificado.id, mesa.id)
-
-        socketio.emit('actualizar_mesas')
-        socketio.emit('actualizar_lista_clientes')
+        notificar_asignaciones(resultado['asignaciones'])
+
+        emit_to_workers_only('actualizar_mesas')
+        emit_to_workers_only('actualizar_lista_clientes')
         enviar_estado_cola()
 
-        return jsonify({"success": True, "mesa": mesa.id, "asignada": bool(cliente_notificado)})
+        return jsonify({"success": True, "mesa": mesa_id, "asignada": bool(resultado['asignaciones'])})
+    except TransicionInvalida as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": e.mensaje}), e.status
     except Exception as e:
         db.session.rollback()
         print(f"Error en desocupar_y_cancelar: {e}")
         return jsonify({"success": False, "error": f"Error interno: {str(e)}"}), 500
 
 
+@app.route('/acciones_lote', methods=['POST'])
+@worker_required
+def acciones_lote():
+    """Aplica varias acciones de mesas en una sola transacción, con una sola ronda de avisos.
+    Espera JSON: { "id_lote": "opcional", "acciones": [{"accion": "liberar", "mesa_id": 3},
+    {"accion": "cambiar_capacidad", "mesa_id": 5, "capacidad": 6}, ...] }
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"success": False, "error": "Se espera un objeto JSON con 'acciones'"}), 400
+    clave = (locales.actual(), str(data['id_lote'])) if data.get('id_lote') else None
+    if clave:
+        anterior = acciones.registro.buscar(clave)
+        if anterior:
+            return jsonify({**anterior, "repetido": True})
+
+    try:
+        lote = acciones.aplicar(data.get('acciones'))
+
+        # Limpiar sesión si corresponde
+        for _, asignado in lote['asignaciones']:
+            if session.get('cliente_id') == asignado.id:
+                session.pop('cliente_id', None)
+
+        db.session.commit()
+    except acciones.AccionFallida as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": e.mensaje, "indice": e.indice}), e.status
+    except TransicionInvalida as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": e.mensaje}), e.status or 400
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error en acciones_lote: {e}")
+        return jsonify({"success": False, "error": f"Error interno: {str(e)}"}), 500
+
+    # Avisos después del commit exitoso, una sola vez por lote
+    notificar_asignaciones(lote['asignaciones'])
+    notificar_cocina(lote['pedidos'])
+    for cliente_id in lote['llegadas']:
+        cliente = db.session.get(Cliente, cliente_id)
+        if cliente and cliente.sid:
+            socketio.emit('cerrar_sesion_cliente', {"motivo": "llego"}, to=cliente.sid)
+
+    emit_to_workers_only('actualizar_mesas')
+    if lote['cola']:
+        emit_to_workers_only('actualizar_lista_clientes')
+        enviar_estado_cola()
+
+    respuesta = {"success": True, "resultados": lote['resultados'], **acciones.estado()}
+    if clave:
+        acciones.registro.guardar(clave, respuesta)
+    return jsonify(respuesta)
 
 @app.route('/estadisticas')
+@solo_lectura
 def estadisticas():
-    usos = UsoMesa.query.all()  # Trae todos los registros históricos
+    usos = UsoMesa.query.filter_by(local=locales.actual()).all()  # Registros históricos del local
 
     if not usos:
         promedio = 0
@@ -1367,7 +1007,116 @@ def estadisticas():
         promedio = total_segundos / len(usos)
     return jsonify({"promedio_tiempo_uso": promedio})
 
+@app.route('/api/analitica')
+@worker_required
+@solo_lectura
+def api_analitica():
+    """Ocupación por día y hora, rotación por mesa, esperas y no-show de un rango
+    de fechas (?desde=YYYY-MM-DD&hasta=YYYY-MM-DD, hora de Chile)"""
+    try:
+        desde, hasta = analitica.rango(request.args.get('desde'), request.args.get('hasta'))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    try:
+        return jsonify({"success": True, **analitica.resumen(desde, hasta)})
+    except Exception as e:
+        print(f"Error en api_analitica: {e}")
+        return jsonify({"success": False, "error": "Error interno"}), 500
+
+@app.route('/api/metricas')
+@worker_required
+def metricas():
+    """Contadores internos (emisiones evitadas, historial de eventos, rate limiting)"""
+    return jsonify({
+        "emisiones": emisor.metricas(),
+        "eventos": eventos.registro.metricas(),
+        "limites": {
+            "login": limite_login.metricas(),
+            "qr_landing": limite_qr_landing.metricas(),
+            "sockets": limite_sockets.metricas()
+        },
+        "qr": codigos_qr.metricas(),
+        "replica": replicas.replicas.metricas(),
+        "estado_cliente": estados.metricas(),
+        "analitica": analitica.metricas(),
+        "suscripciones": suscripciones.metricas(),
+        "push": avisos.metricas(),
+        "locales": {
+            local: sum(1 for info in list(sockets_activos.values()) if info.get('local') == local)
+            for local in locales.configurados()
+        }
+    })
+
+@app.route('/api/exportar/<tabla>')
+@worker_required
+@solo_lectura
+def exportar_tabla(tabla):
+    """Descarga clientes, usos o suscripciones del local en streaming
+    (?formato=csv|parquet|arrow&desde=YYYY-MM-DD&hasta=YYYY-MM-DD)"""
+    try:
+        exportar = exportacion.Exportacion(tabla, request.args.get('formato', 'csv'),
+                                           request.args.get('desde'), request.args.get('hasta'))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        print(f"Error en exportar_tabla: {e}")
+        return jsonify({"success": False, "error": "Error interno"}), 500
+    return Response(
+        stream_with_context(exportar),
+        mimetype=exportar.mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{exportar.nombre_archivo}"'}
+    )
+
+@app.route('/api/eventos')
+@worker_required
+def listar_eventos():
+    """Historial de eventos de cola/mesas a partir de un id (paginado por id)"""
+    try:
+        desde_id = request.args.get('desde', 0, type=int)
+        limite = min(request.args.get('limite', 500, type=int), 5000)
+        tipos = request.args.getlist('tipo') or None
+        lista = list(eventos.eventos_desde(desde_id, tipos=tipos, limite=limite))
+        return jsonify({
+            "success": True,
+            "eventos": lista,
+            "ultimo_id": lista[-1]['id'] if lista else desde_id
+        })
+    except Exception as e:
+        print(f"Error en listar_eventos: {e}")
+        return jsonify({"success": False, "error": "Error interno"}), 500
+
+@app.route('/api/eventos/estado')
+@worker_required
+def estado_desde_eventos():
+    """Estado de cola y mesas reconstruido solo a partir del historial"""
+    try:
+        estado = eventos.reconstruir_estado()
+        cola = sorted(estado['cola'].items(), key=lambda item: item[1]['joined_at'] or ahora_utc())
+        return jsonify({
+            "success": True,
+            "ultimo_id": estado['ultimo_id'],
+            "cola": [
+                {
+                    "cliente_id": cliente_id,
+                    "cantidad_comensales": info['cantidad_comensales'],
+                    "joined_at": info['joined_at']
+                } for cliente_id, info in cola
+            ],
+            "mesas": {
+                mesa_id: {
+                    "cliente_id": info.get('cliente_id'),
+                    "llego_comensal": info.get('llego_comensal', False),
+                    "reservada": info.get('reservada', False)
+                } for mesa_id, info in estado['mesas'].items()
+            },
+            "conteo": eventos.contar_por_tipo()
+        })
+    except Exception as e:
+        print(f"Error en estado_desde_eventos: {e}")
+        return jsonify({"success": False, "error": "Error interno"}), 500
+
 @socketio.on("registrar_cliente")
+@limitar_socket(limite_sockets, "registrar_cliente")
 def registrar_cliente(data):
     """Registro robusto de clientes con tracking completo"""
     sid = request.sid
@@ -1386,8 +1135,8 @@ def registrar_cliente(data):
             emit('error', {'message': 'No autorizado'})
             return False
         
-        # ✔️ Verificar cliente en BD
-        cliente = db.session.get(Cliente, cliente_id)
+        # ✔️ Verificar cliente en BD (y que sea del local de la sesión)
+        cliente = mesas.del_local(db.session.get(Cliente, cliente_id))
         if not cliente:
             print(f"❌ Cliente {cliente_id} NO ENCONTRADO en BD")
             emit('error', {'message': 'Cliente no encontrado'})
@@ -1407,32 +1156,34 @@ def registrar_cliente(data):
         # Actualizar info del socket
         if sid in sockets_activos:
             sockets_activos[sid]['client_id'] = cliente_id
+            sockets_activos[sid]['local'] = cliente.local
             sockets_activos[sid]['registered_at'] = datetime.now()
         
         db.session.commit()
         
-        # 🏠 Unirse a salas (personal y general de clientes)
+        # 🏠 Unirse a salas (personal y general de clientes del local)
+        sala_clientes = locales.sala(cliente.local, SALA_CLIENTES)
         join_room(f"cliente_{cliente_id}")
-        join_room("clients")  # Sala para todos los clientes
+        join_room(sala_clientes)  # Sala para todos los clientes del local
         
         print(f"✨ Cliente {cliente_id} registrado exitosamente:")
         print(f"  🆔 SID: {sid}")
         print(f"  📊 Clientes conectados: {len(clientes_conectados)}")
-        print(f"  🏠 En salas: cliente_{cliente_id}, clients")
+        print(f"  🏠 En salas: cliente_{cliente_id}, {sala_clientes}")
         
         # 📢 Notificar estado actualizado (solo a trabajadores)
         emit_to_workers_only('nuevo_cliente', {
             'cliente_id': cliente.id,
-            'joined_at': cliente.joined_at.strftime('%Y-%m-%d %H:%M:%S')
-        })
+            'joined_at': cliente.joined_at
+        }, local=cliente.local)
         
-        # 📊 Enviar estado de cola
-        enviar_estado_cola()
+        # 📊 Enviar su estado (posición, tiempo estimado, mesa); la fila no cambió
+        emit('estado_cliente', estados.de_cliente(cliente_id, cliente.local))
         
         # ✅ Confirmar registro exitoso
         emit('registro_confirmado', {
             'cliente_id': cliente_id,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': ahora_utc()
         })
         
         return True
@@ -1446,8 +1197,14 @@ def registrar_cliente(data):
         return False
 
 @socketio.on("registrar_trabajador")
+@limitar_socket(limite_sockets, "registrar_trabajador")
 def registrar_trabajador(data):
-    """Registra un trabajador en la sala correspondiente"""
+    """Registra un trabajador en la sala correspondiente.
+
+    Si trae `version` (la última que vio la tablet) se le responde con
+    'estado_trabajador': al día, los cambios desde entonces o un snapshot
+    compacto, así al reconectarse no tiene que recargar la página.
+    """
     try:
         sid = request.sid
         trabajador_id = data.get('trabajador_id')
@@ -1456,16 +1213,18 @@ def registrar_trabajador(data):
             emit('error', {'message': 'No autorizado'})
             return False
             
-        # Unirse a sala de trabajadores
-        join_room("workers")
+        # Unirse a sala de trabajadores del local
+        sala_trabajadores = locales.sala(locales.actual(), SALA_TRABAJADORES)
+        join_room(sala_trabajadores)
         
         # Actualizar información del socket
         if sid in sockets_activos:
             sockets_activos[sid]['worker_id'] = trabajador_id
             sockets_activos[sid]['type'] = 'worker'
         
-        print(f"👨‍💼 Trabajador {trabajador_id} registrado en sala workers")
+        print(f"👨‍💼 Trabajador {trabajador_id} registrado en sala {sala_trabajadores}")
         emit('registro_trabajador_confirmado', {'worker_id': trabajador_id})
+        emit('estado_trabajador', sincronizacion.para_trabajador(data.get('version')))
         return True
         
     except Exception as e:
@@ -1473,7 +1232,39 @@ def registrar_trabajador(data):
         emit('error', {'message': 'Error interno'})
         return False
 
+@socketio.on("registrar_cocina")
+@limitar_socket(limite_sockets, "registrar_cocina")
+def registrar_cocina(data=None):
+    """Une la pantalla de cocina a su sala y le envía los pedidos abiertos una vez"""
+    try:
+        if 'trabajador_id' not in session:
+            emit('error', {'message': 'No autorizado'})
+            return False
+
+        estacion = (data or {}).get('estacion')
+        if estacion not in cocina.ESTACIONES:
+            estacion = None
+        local = locales.actual()
+        join_room(sala_cocina(local, estacion))
+
+        if request.sid in sockets_activos:
+            sockets_activos[request.sid]['type'] = 'kitchen'
+
+        # Estado inicial; después solo llegan 'pedidos_actualizados'
+        emit('pedidos_cocina', {
+            'estacion': estacion,
+            'pedidos': [cocina.pedido_a_dict(p) for p in cocina.abiertos(estacion=estacion)]
+        })
+        print(f"🍳 Pantalla de cocina registrada en sala {sala_cocina(local, estacion)}")
+        return True
+
+    except Exception as e:
+        print(f"❌ Error registrando cocina: {e}")
+        emit('error', {'message': 'Error interno'})
+        return False
+
 @socketio.on("heartbeat")
+@limitar_socket(limite_sockets, "heartbeat")
 def manejar_heartbeat(data):
     """Sistema robusto de heartbeat con detección de conexiones zombie"""
     sid = request.sid
@@ -1579,25 +1370,34 @@ def limpieza_periodica():
                 zombie_count = limpiar_conexiones_zombie()
                 if zombie_count > 0:
                     print(f"🧺 Limpieza periódica: {zombie_count} zombies eliminados")
+                if suscripciones.purgas.toca():
+                    suscripciones.purgar()
         except Exception as e:
             print(f"❌ Error en limpieza periódica: {e}")
 
-# Iniciar hilo de limpieza
-limpieza_thread = threading.Thread(target=limpieza_periodica, daemon=True)
-limpieza_thread.start()
-print("🧺 Hilo de limpieza periódica iniciado")
+limpieza_thread = None
+
+def iniciar_tareas_en_segundo_plano():
+    """Arranca el hilo de limpieza (solo desde el punto de entrada del servidor)"""
+    global limpieza_thread
+    if limpieza_thread is not None and limpieza_thread.is_alive():
+        return
+    limpieza_thread = threading.Thread(target=limpieza_periodica, name='limpieza-periodica', daemon=True)
+    limpieza_thread.start()
+    print("🧺 Hilo de limpieza periódica iniciado")
 
 @app.route('/clientes')
 @worker_required
+@solo_lectura
 def obtener_clientes():
-    clientes = Cliente.query.filter_by(assigned_table=None).order_by(Cliente.joined_at).all()
+    clientes = Cliente.query.filter_by(local=locales.actual(), assigned_table=None).order_by(Cliente.joined_at).all()
     return jsonify([
         {
             'id': c.id,
             'nombre': c.nombre,
             'telefono': c.telefono,
             'cantidad_comensales': c.cantidad_comensales,
-            'joined_at': c.joined_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'joined_at': c.joined_at,
             'tiene_orden_previa': bool(c.orden_previa),
             'en_camino': bool(getattr(c, 'en_camino', False))
         } for c in clientes
@@ -1655,10 +1455,10 @@ def index():
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
-        client_ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
+        client_ip = ip_cliente()
         
         # Verificar rate limiting
-        if not check_rate_limit(client_ip):
+        if not limite_login.permitido(client_ip):
             flash('Demasiados intentos de login. Intenta de nuevo en 15 minutos.')
             return redirect(url_for('login'))
         
@@ -1666,14 +1466,13 @@ def login():
         password = request.form['password']
         
         # Registrar el intento
-        record_login_attempt(client_ip)
+        limite_login.registrar(client_ip)
         
         trabajador = Trabajador.query.filter_by(email=email).first()
 
         if trabajador and trabajador.check_password(password):
             # Login exitoso - limpiar intentos de este IP
-            if client_ip in login_attempts:
-                del login_attempts[client_ip]
+            limite_login.reiniciar(client_ip)
             
             session['trabajador_id'] = trabajador.id
             session.permanent = True  # Hacer la sesión permanente para usar PERMANENT_SESSION_LIFETIME
@@ -1695,10 +1494,11 @@ def logout():
 
 @app.route('/clientes_espera')
 def clientes_espera():
-    clientes = Cliente.query.filter_by(assigned_table=None).order_by(Cliente.joined_at).all()
+    clientes = Cliente.query.filter_by(local=locales.actual(), assigned_table=None).order_by(Cliente.joined_at).all()
     return render_template('clientes_espera.html', clientes=clientes)
 
 @app.route('/qr_landing', methods=['GET', 'POST'])
+@limitar(limite_qr_landing)
 def qr_landing():
     # No limpiar la sesión aquí para permitir recargas sin duplicar clientes
     
@@ -1720,8 +1520,9 @@ def qr_landing():
         if not telefono:
             return jsonify({'error': 'El teléfono es requerido'}), 400
         
-        # Validar formato del teléfono chileno
-        if not telefono.startswith('+569') or len(telefono) != 12:
+        # Validar formato del teléfono chileno (se guarda normalizado: +569XXXXXXXX)
+        telefono = normalizar_telefono(telefono)
+        if not telefono:
             return jsonify({'error': 'El teléfono debe tener formato +569xxxxxxxx'}), 400
         
         if not cantidad_comensales or int(cantidad_comensales) < 1:
@@ -1736,6 +1537,9 @@ def qr_landing():
         # Si ya hay un cliente en sesión, enviar directo a /cliente limpio
         if 'cliente_id' in session:
             redirect_url = url_for('cliente')
+        elif clientes.turno_en_espera(telefono) is not None:
+            # El turno de ese teléfono es de otra sesión: no se entrega (ver clientes.py)
+            return jsonify({'error': clientes.MENSAJE_AJENO}), 409
         else:
             # Retornar la URL de redirección con parámetros solo una vez; luego /cliente redirige a limpio
             redirect_url = url_for('cliente', nombre=nombre, telefono=telefono, cantidad_comensales=cantidad_comensales)
@@ -1743,46 +1547,44 @@ def qr_landing():
     
     return render_template('qr_landing.html')
 
+@app.route('/qr/landing.png')
+def qr_landing_png():
+    """QR de la entrada del local (lleva a /qr_landing?local=<slug>)"""
+    return codigos_qr.respuesta_png(codigos_qr.url_landing(codigos_qr.url_publica(), local=locales.actual()))
+
+@app.route('/qr/<int:mesa_id>.png')
+def qr_mesa_png(mesa_id):
+    """QR de una mesa (lleva a /qr_landing?local=<slug de la mesa>, ver codigos_qr)"""
+    fila = db.session.query(Mesa.local).filter_by(id=mesa_id).first()
+    if not fila or fila.local not in locales.configurados():
+        return jsonify({'error': 'Mesa no encontrada'}), 404
+    return codigos_qr.respuesta_png(codigos_qr.url_landing(codigos_qr.url_publica(), fila.local))
+
 @app.route('/confirmar_llegada/<int:mesa_id>', methods=['POST'])
 @worker_required
 def confirmar_llegada(mesa_id):
     try:
-        mesa = db.session.get(Mesa, mesa_id)
-        if not mesa:
-            return jsonify({"success": False, "error": "Mesa no encontrada"})
-        
-        if not mesa.is_occupied:
-            return jsonify({"success": False, "error": "Mesa no está ocupada"})
-        
-        # Confirmar llegada del comensal en TODAS las mesas de este cliente
-        mesas_actualizadas = []
-        if mesa.cliente_id:
-            mesas_cliente = Mesa.query.filter_by(cliente_id=mesa.cliente_id, is_occupied=True).all()
-            for m in mesas_cliente:
-                if not m.llego_comensal:
-                    m.llego_comensal = True
-                    mesas_actualizadas.append(m.id)
-        else:
-            # Mesa ocupada manualmente sin cliente asignado: marcar solo esta mesa
-            if not mesa.llego_comensal:
-                mesa.llego_comensal = True
-                mesas_actualizadas.append(mesa.id)
-        
-        # Hacer commit
+        resultado = mesas.confirmar_llegada(mesa_id)
+        # Con el comensal en la mesa, su orden previa pasa a cocina/bar
+        pedidos = cocina.pedidos_de_orden_previa(mesa_id)
         db.session.commit()
+        notificar_cocina(pedidos)
 
         # Si hay cliente asociado, pedir al cliente que cierre su sesión (para permitir reuso del teléfono)
-        cliente_id = mesa.cliente_id
+        cliente_id = resultado['cliente_id']
         if cliente_id:
             cliente = db.session.get(Cliente, cliente_id)
             if cliente and cliente.sid:
                 socketio.emit('cerrar_sesion_cliente', {"motivo": "llego"}, to=cliente.sid)
-        
+
         # Emitir actualizaciones después del commit exitoso
-        socketio.emit('actualizar_mesas')
-        
-        return jsonify({"success": True, "mesas_actualizadas": mesas_actualizadas})
-        
+        emit_to_workers_only('actualizar_mesas')
+
+        return jsonify({"success": True, "mesas_actualizadas": resultado['mesas']})
+
+    except TransicionInvalida as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": e.mensaje})
     except Exception as e:
         db.session.rollback()
         print(f"Error en confirmar_llegada: {e}")
@@ -1791,17 +1593,18 @@ def confirmar_llegada(mesa_id):
 @app.route('/obtener_orden/<int:mesa_id>')
 @worker_required
 def obtener_orden(mesa_id):
-    mesa = db.session.get(Mesa, mesa_id)
+    mesa = mesas.del_local(db.session.get(Mesa, mesa_id))
     if mesa:
         return jsonify({"orden": mesa.orden or ""})
     return jsonify({"orden": ""})
 
 @app.route('/obtener_info_mesa/<int:mesa_id>')
 @worker_required
+@solo_lectura
 def obtener_info_mesa(mesa_id):
     """Obtener información completa de la mesa incluyendo datos del cliente"""
     try:
-        mesa = db.session.get(Mesa, mesa_id)
+        mesa = mesas.del_local(db.session.get(Mesa, mesa_id))
         if not mesa:
             return jsonify({"success": False, "error": "Mesa no encontrada"})
         
@@ -1812,8 +1615,9 @@ def obtener_info_mesa(mesa_id):
             "is_occupied": mesa.is_occupied,
             "capacidad": mesa.capacidad,
             "reservada": mesa.reservada,
-            "start_time": mesa.start_time.isoformat() if mesa.start_time else None,
-            "orden": mesa.orden
+            "start_time": mesa.start_time,
+            "orden": mesa.orden,
+            "orden_personas": mesa.orden_personas
         }
         
         # Información del cliente si existe
@@ -1823,8 +1627,8 @@ def obtener_info_mesa(mesa_id):
                 "nombre": mesa.cliente.nombre,
                 "telefono": mesa.cliente.telefono,
                 "cantidad_comensales": mesa.cliente.cantidad_comensales,
-                "joined_at": mesa.cliente.joined_at.isoformat() if mesa.cliente.joined_at else None,
-                "mesa_asignada_at": mesa.cliente.mesa_asignada_at.isoformat() if mesa.cliente.mesa_asignada_at else None,
+                "joined_at": mesa.cliente.joined_at,
+                "mesa_asignada_at": mesa.cliente.mesa_asignada_at,
                 "en_camino": getattr(mesa.cliente, 'en_camino', False)
             }
         else:
@@ -1844,7 +1648,7 @@ def llamar_mesa(mesa_id):
     Envía una notificación push para llamar al cliente de una mesa específica
     """
     try:
-        mesa = db.session.get(Mesa, mesa_id)
+        mesa = mesas.del_local(db.session.get(Mesa, mesa_id))
         if not mesa:
             return jsonify({"success": False, "error": "Mesa no encontrada"}), 404
         
@@ -1859,8 +1663,8 @@ def llamar_mesa(mesa_id):
         print(f"📞 === LLAMANDO A MESA {mesa_id} ===")
         print(f"👤 Cliente: {cliente.nombre} (ID: {cliente.id})")
         
-        # Enviar notificación push
-        push_enviado = notificar_llamada_mesa(cliente.id, mesa_id)
+        # Encolar la notificación push (se envía desde su carril; aquí no se sabe si llega)
+        push_encolado = notificar_llamada_mesa(cliente.id, mesa_id)
         
         # También enviar por Socket.IO si está conectado
         socket_enviado = False
@@ -1880,7 +1684,7 @@ def llamar_mesa(mesa_id):
             "mensaje": f"Llamada enviada a mesa {mesa_id}",
             "cliente": cliente.nombre,
             "notificaciones": {
-                "push": push_enviado,
+                "push_encolado": push_encolado,
                 "socket": socket_enviado
             }
         })
@@ -1893,7 +1697,7 @@ def llamar_mesa(mesa_id):
 @worker_required
 def guardar_orden(mesa_id):
     try:
-        mesa = db.session.get(Mesa, mesa_id)
+        mesa = mesas.del_local(db.session.get(Mesa, mesa_id))
         if not mesa:
             return jsonify({"success": False, "error": "Mesa no encontrada"})
         
@@ -1908,7 +1712,7 @@ def guardar_orden(mesa_id):
         db.session.commit()
         
         # Emitir actualizaciones después del commit exitoso
-        socketio.emit('actualizar_mesas')
+        emit_to_workers_only('actualizar_mesas')
         
         return jsonify({"success": True})
         
@@ -1918,6 +1722,7 @@ def guardar_orden(mesa_id):
         return jsonify({"success": False, "error": f"Error interno: {str(e)}"})
 
 @app.route('/tiempo_espera_promedio')
+@solo_lectura
 def tiempo_espera_promedio():
     """Endpoint para obtener el tiempo de espera promedio"""
     promedio_segundos = calcular_tiempo_espera_promedio()
@@ -1945,15 +1750,17 @@ def marcar_en_camino():
         if cliente.assigned_table is None:
             cliente.en_camino = True
             db.session.commit()
+            estados.cambio(cliente.local)
             # Notificar a UIs (solo trabajadores)
-            emit_to_workers_only('actualizar_lista_clientes', {})
-            emit_to_workers_only('actualizar_cola', {})
+            emit_to_workers_only('actualizar_lista_clientes')
+            emit_to_workers_only('actualizar_cola')
             return jsonify({"success": True})
         else:
             # Si ya tiene mesa, también marcamos (visible en mesa recién asignada)
             cliente.en_camino = True
             db.session.commit()
-            socketio.emit('actualizar_mesas')
+            estados.cambio(cliente.local)
+            emit_to_workers_only('actualizar_mesas')
             return jsonify({"success": True})
     except Exception as e:
         db.session.rollback()
@@ -1963,19 +1770,120 @@ def marcar_en_camino():
 @worker_required
 def obtener_orden_previa(cliente_id):
     try:
-        cliente = db.session.get(Cliente, cliente_id)
+        cliente = mesas.del_local(db.session.get(Cliente, cliente_id))
         if not cliente:
             return jsonify({"success": False, "error": "Cliente no encontrado"}), 404
         return jsonify({
             "success": True,
             "orden_previa": cliente.orden_previa or None,
-            "orden_previa_texto": formatear_orden_previa(cliente.orden_previa) if cliente.orden_previa else None
+            "orden_previa_texto": cliente.orden_previa_texto,
+            "personas": cliente.orden_previa_personas
         })
     except Exception as e:
         print(f"Error en obtener_orden_previa: {e}")
         return jsonify({"success": False, "error": "Error interno"}), 500
 
+@app.route('/cocina')
+@login_required
+def pantalla_cocina():
+    estacion = request.args.get('estacion')
+    if estacion not in cocina.ESTACIONES:
+        estacion = None
+    return render_template('cocina.html', estacion=estacion, estaciones=cocina.ESTACIONES)
+
+@app.route('/api/cocina/pedidos')
+@worker_required
+def pedidos_abiertos():
+    """Pedidos pendientes o en preparación, opcionalmente por estación o mesa"""
+    try:
+        estacion = request.args.get('estacion')
+        mesa_id = request.args.get('mesa_id', type=int)
+        pedidos = cocina.abiertos(estacion=estacion, mesa_id=mesa_id)
+        return jsonify({
+            "success": True,
+            "pedidos": [cocina.pedido_a_dict(p) for p in pedidos],
+            "server_time": ahora_utc()
+        })
+    except Exception as e:
+        print(f"Error en pedidos_abiertos: {e}")
+        return jsonify({"success": False, "error": "Error interno"}), 500
+
+@app.route('/mesa/<int:mesa_id>/pedidos', methods=['POST'])
+@worker_required
+def agregar_pedidos(mesa_id):
+    """Agrega ítems (descripcion, cantidad, estacion, persona, notas) a la mesa"""
+    try:
+        data = request.get_json() or {}
+        pedidos = cocina.crear_pedidos(mesa_id, data.get('items') or [])
+        db.session.commit()
+        notificar_cocina(pedidos)
+        return jsonify({"success": True, "pedidos": [cocina.pedido_a_dict(p) for p in pedidos]})
+    except TransicionInvalida as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": e.mensaje}), e.status or 400
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error en agregar_pedidos: {e}")
+        return jsonify({"success": False, "error": f"Error interno: {str(e)}"}), 500
+
+@app.route('/pedidos/<int:pedido_id>/estado', methods=['POST'])
+@worker_required
+def cambiar_estado_pedido(pedido_id):
+    """Avanza el pedido (o lo lleva al estado indicado en 'estado')"""
+    try:
+        data = request.get_json(silent=True) or {}
+        pedido = cocina.cambiar_estado(pedido_id, data.get('estado'))
+        db.session.commit()
+        notificar_cocina([pedido])
+        return jsonify({"success": True, "pedido": cocina.pedido_a_dict(pedido)})
+    except TransicionInvalida as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": e.mensaje}), e.status or 400
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error en cambiar_estado_pedido: {e}")
+        return jsonify({"success": False, "error": f"Error interno: {str(e)}"}), 500
+
+@app.route('/estado_cliente/<int:cliente_id>')
+def estado_del_cliente(cliente_id):
+    """Estado del cliente (posición, tiempo estimado, mesa): respaldo HTTP del evento 'estado_cliente'.
+
+    Responde con ETag; si la versión no cambió devuelve 304 sin consultar la base
+    (If-None-Match). Con ?version=<arranque>-<n> espera hasta ESPERA_MAXIMA segundos a que cambie.
+    """
+    if session.get('cliente_id') != cliente_id and 'trabajador_id' not in session:
+        return jsonify({'error': 'No autorizado'}), 403
+    local = locales.actual()
+
+    # La versión incluye el arranque del proceso: una de antes de un deploy nunca coincide
+    version_cliente = request.args.get('version')
+    if version_cliente and version_cliente == estados.marca(local):
+        espera = min(max(request.args.get('espera', ESPERA_MAXIMA, type=int), 0), ESPERA_MAXIMA)
+        if not estados.esperar(version_cliente, espera, local):
+            estados.contar('no_modificado')
+            return '', 304, {'ETag': f'"{estados.etag(cliente_id, version_cliente, local)}"',
+                             'Cache-Control': 'no-cache'}
+
+    if request.if_none_match.contains(estados.etag(cliente_id, estados.marca(local), local)):
+        estados.contar('no_modificado')
+        return '', 304, {'Cache-Control': 'no-cache'}
+
+    try:
+        estado = estados.de_cliente(cliente_id, local)
+    except Exception as e:
+        print(f"Error obteniendo estado del cliente {cliente_id}: {e}")
+        return jsonify({'error': 'Error interno del servidor'}), 500
+    if estado is None:
+        return jsonify({'error': 'Cliente no encontrado'}), 404
+
+    estados.contar('respuestas')
+    respuesta = jsonify(estado)
+    respuesta.set_etag(estados.etag(cliente_id, estado['version'], local))
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
 @app.route('/verificar_estado_cliente/<int:cliente_id>')
+@solo_lectura
 def verificar_estado_cliente(cliente_id):
     """Verificar si un cliente ya tiene mesa asignada"""
     try:
@@ -1988,8 +1896,8 @@ def verificar_estado_cliente(cliente_id):
             'cliente_id': cliente_id,
             'nombre': cliente.nombre,
             'mesa_asignada': cliente.assigned_table,
-            'joined_at': cliente.joined_at.isoformat() if cliente.joined_at else None,
-            'mesa_asignada_at': cliente.mesa_asignada_at.isoformat() if cliente.mesa_asignada_at else None,
+            'joined_at': cliente.joined_at,
+            'mesa_asignada_at': cliente.mesa_asignada_at,
             'tiene_mesa': cliente.assigned_table is not None,
             'en_camino': bool(getattr(cliente, 'en_camino', False))
         }
@@ -2034,36 +1942,10 @@ def push_subscribe():
         if not cliente_id:
             return jsonify({'success': False, 'error': 'Sesión de cliente no encontrada'}), 401
         
-        # Verificar si ya existe una suscripción para este endpoint
-        suscripcion_existente = PushSubscription.query.filter_by(
-            endpoint=subscription['endpoint']
-        ).first()
-        
-        if suscripcion_existente:
-            # Actualizar la suscripción existente
-            suscripcion_existente.cliente_id = cliente_id
-            suscripcion_existente.p256dh_key = keys['p256dh']
-            suscripcion_existente.auth_key = keys['auth']
-            suscripcion_existente.user_agent = user_agent[:500] if user_agent else None
-            suscripcion_existente.is_active = True
-            suscripcion_existente.created_at = get_chile_time()
-            
-            print(f"🔄 Suscripción actualizada para cliente {cliente_id}")
-        else:
-            # Crear nueva suscripción
-            nueva_suscripcion = PushSubscription(
-                cliente_id=cliente_id,
-                endpoint=subscription['endpoint'],
-                p256dh_key=keys['p256dh'],
-                auth_key=keys['auth'],
-                user_agent=user_agent[:500] if user_agent else None,
-                created_at=get_chile_time(),
-                is_active=True
-            )
-            db.session.add(nueva_suscripcion)
-            print(f"✅ Nueva suscripción creada para cliente {cliente_id}")
-        
+        # Alta o renovación en un solo INSERT ... ON CONFLICT sobre el hash del endpoint
+        suscripciones.guardar(cliente_id, subscription, user_agent, locales.actual())
         db.session.commit()
+        print(f"✅ Suscripción registrada para cliente {cliente_id}")
         
         return jsonify({
             'success': True,
@@ -2121,10 +2003,11 @@ def test_push_notification():
             "type": "test",
             "title": "🧪 Notificación de Prueba",
             "body": "Esta es una notificación de prueba para verificar que todo funciona correctamente.",
-            "timestamp": datetime.now().isoformat()
+            "timestamp": ahora_utc()
         }
         
-        enviado = enviar_notificacion_push(cliente_id, mensaje_data)
+        # Sin carril: el resultado del envío va en la respuesta
+        enviado = avisos.enviar_ahora(cliente_id, mensaje_data) > 0
         
         return jsonify({
             'success': enviado,
@@ -2157,16 +2040,19 @@ def cancelar_turno(cliente_id):
         if cliente.assigned_table:
             return jsonify({"success": False, "error": "No puedes cancelar cuando ya tienes mesa asignada"}), 400
         
-        # Eliminar al cliente de la base de datos
+        # Eliminar al cliente de la base de datos (queda registrado en el historial)
+        # junto con sus suscripciones push, que ya no tienen a quién avisar
+        suscripciones.eliminar_de_cliente(cliente_id)
         db.session.delete(cliente)
+        eventos.registrar(eventos.CANCELACION, cliente_id=cliente_id)
         db.session.commit()
         
         # Limpiar la sesión
         session.clear()
         
         # Notificar a todos los trabajadores que la lista de clientes cambió
-        emit_to_workers_only('actualizar_lista_clientes', {})
-        emit_to_workers_only('actualizar_cola', {})
+        emit_to_workers_only('actualizar_lista_clientes')
+        emit_to_workers_only('actualizar_cola')
         enviar_estado_cola()
         
         return jsonify({
@@ -2285,8 +2171,9 @@ def logout_cliente():
             # 2. Eliminar todos los trabajadores
             Trabajador.query.delete()
             
-            # 3. Eliminar historial de uso de mesas
+            # 3. Eliminar historial de uso de mesas y pedidos
             UsoMesa.query.delete()
+            Pedidos.query.delete()
             
             # 4. Resetear estado de todas las mesas
             mesas = Mesa.query.all()
@@ -2297,6 +2184,7 @@ def logout_cliente():
                 mesa.llego_comensal = False
                 mesa.reservada = False
                 mesa.orden = None
+                mesa.orden_personas = None
             
             # 5. Confirmar cambios
             db.session.commit()
@@ -2305,8 +2193,8 @@ def logout_cliente():
             session.clear()
             
             # Emitir actualizaciones
-            socketio.emit('actualizar_mesas')
-            socketio.emit('actualizar_lista_clientes')
+            emit_to_workers_only('actualizar_mesas')
+            emit_to_workers_only('actualizar_lista_clientes')
             
             tipo_bd = "PostgreSQL (Render)" if es_produccion else "SQLite (Local)"
             
@@ -2375,12 +2263,31 @@ def logout_cliente():
             </html>
             """
 
+_servidor_preparado = False
+
+def create_app():
+    """Punto de entrada del servidor.
+
+    Importar este módulo solo registra rutas y configuración (rápido y sin
+    efectos secundarios: lo usan los comandos `flask db ...`, los scripts y
+    los benchmarks). El trabajo de arranque se hace aquí, una sola vez:
+    migraciones en producción, tablas/mesas iniciales y el hilo de limpieza.
+
+    Con un servidor WSGI: gunicorn -k gthread 'app:create_app()'
+    """
+    global _servidor_preparado
+    if not _servidor_preparado:
+        _servidor_preparado = True
+        configurar_migraciones()
+        # Ejecutar migraciones automáticamente en producción
+        run_migrations()
+        # Inicializar datos de la aplicación
+        init_app_data()
+        iniciar_tareas_en_segundo_plano()
+    return app
+
 if __name__ == "__main__":
-    # Ejecutar migraciones automáticamente en producción
-    run_migrations()
-    
-    # Inicializar datos de la aplicación
-    init_app_data()
+    create_app()
     # Configuración para desarrollo vs producción
     if os.environ.get('FLASK_ENV') == 'production':
         # Configuración para Render (producción) - permitir Werkzeug temporalmente
@@ -0,0 +1,217 @@
+"""
+Notificaciones push por carriles de prioridad.
+
+Antes cada push se enviaba dentro del request que lo originaba, en serie y
+sin cabeceras: un preaviso lento demoraba el "¡es tu turno!" siguiente y el
+servicio push guardaba cada mensaje hasta entregarlo (TTL 0 = descartar si
+el teléfono no está en línea; sin Urgency = "normal" para todos).
+
+Ahora el campo `priority` que ya traen los mensajes elige el carril:
+
+- alta (turno_listo, llamada_mesa): su propio hilo, nunca espera detrás de
+  un preaviso. Urgency: high.
+- normal (preaviso y sin prioridad) y baja: otros hilos.
+
+Cada mensaje lleva TTL (pasado ese tiempo ya no sirve: el turno venció) y
+Topic "<tipo>-<cliente>": si el teléfono está sin conexión, el servicio push
+guarda solo el último de cada tema. En la cola del carril pasa lo mismo: un
+aviso nuevo del mismo tema reemplaza al que aún no se envió, sin perder su
+lugar. En el teléfono, el service worker ya usa un tag por tipo.
+
+Los hilos se crean con el primer aviso de su carril y cada carril reutiliza
+su conexión HTTP (requests.Session) con el servicio push. Cada envío tiene
+TIMEOUT_ENVIO: un carril es un solo hilo, y un endpoint colgado sin límite
+dejaría detenidos todos los avisos que vienen detrás.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+import serializacion
+from models import db, PushSubscription
+
+# priority del mensaje -> (carril, cabecera Urgency, TTL por defecto en segundos)
+PRIORIDADES = {
+    'high': ('alta', 'high', 600),
+    'medium': ('normal', 'normal', 1800),
+    'low': ('baja', 'low', 3600),
+}
+PRIORIDAD_DEFECTO = 'medium'
+
+TIMEOUT_ENVIO = 5  # segundos por petición al servicio push
+
+# TTL por tipo de aviso: después de esto el aviso ya no le sirve al cliente
+TTL_POR_TIPO = {
+    'turno_listo': 600,   # tolerancia para llegar a la mesa
+    'llamada_mesa': 300,
+    'preaviso': 900,
+    'test': 60,
+}
+
+_NO_TOPIC = re.compile(r'[^A-Za-z0-9_-]')
+
+
+def tema(tipo, cliente_id):
+    """Topic del aviso: hasta 32 caracteres del alfabeto base64 URL"""
+    return _NO_TOPIC.sub('', f'{tipo or "aviso"}-{cliente_id}')[:32]
+
+
+def cabeceras(mensaje, cliente_id):
+    """(carril, ttl, cabeceras HTTP) de un mensaje según su priority y tipo"""
+    carril, urgencia, ttl = PRIORIDADES.get(mensaje.get('priority'), PRIORIDADES[PRIORIDAD_DEFECTO])
+    ttl = TTL_POR_TIPO.get(mensaje.get('type'), ttl)
+    return carril, ttl, {'Urgency': urgencia, 'Topic': tema(mensaje.get('type'), cliente_id)}
+
+
+class Carril:
+    """Cola con reemplazo por tema y un hilo que la envía en orden"""
+
+    def __init__(self, nombre, avisos):
+        self.nombre = nombre
+        self.avisos = avisos
+        self._pendientes = OrderedDict()  # (cliente_id, topic) -> (mensaje, ttl, cabeceras)
+        self._condicion = threading.Condition()
+        self._hilo = None
+        self._sesion = None
+        self.encolados = 0
+        self.reemplazados = 0
+        self.enviados = 0
+        self.sin_entrega = 0  # sin suscripción activa o con error
+
+    def encolar(self, cliente_id, mensaje, ttl, extra):
+        clave = (cliente_id, extra['Topic'])
+        with self._condicion:
+            if clave in self._pendientes:
+                self.reemplazados += 1  # conserva su lugar en la cola
+            self._pendientes[clave] = (mensaje, ttl, extra)
+            self.encolados += 1
+            self._condicion.notify()
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name=f'push-{self.nombre}', daemon=True)
+                self._hilo.start()
+
+    def _tomar(self, bloquear=True):
+        with self._condicion:
+            if bloquear:
+                self._condicion.wait_for(lambda: self._pendientes)
+            if not self._pendientes:
+                return None
+            (cliente_id, _), datos = self._pendientes.popitem(last=False)
+            return (cliente_id,) + datos
+
+    def _enviar(self, trabajo):
+        cliente_id, mensaje, ttl, extra = trabajo
+        if self._sesion is None:
+            import requests  # dependencia de pywebpush
+            self._sesion = requests.Session()
+        try:
+            with self.avisos.app.app_context():
+                enviadas = self.avisos.enviar_ahora(cliente_id, mensaje, ttl, extra, self._sesion)
+        except Exception as e:
+            enviadas = 0
+            print(f"❌ Error en carril push '{self.nombre}': {e}")
+        if enviadas:
+            self.enviados += 1
+        else:
+            self.sin_entrega += 1
+
+    def _bucle(self):
+        while True:
+            self._enviar(self._tomar())
+
+    def vaciar(self):
+        """Envía de inmediato lo pendiente en este hilo (pruebas, cierre)"""
+        while True:
+            trabajo = self._tomar(bloquear=False)
+            if trabajo is None:
+                return
+            self._enviar(trabajo)
+
+    def metricas(self):
+        with self._condicion:
+            return {
+                'en_cola': len(self._pendientes),
+                'encolados': self.encolados,
+                'reemplazados': self.reemplazados,
+                'enviados': self.enviados,
+                'sin_entrega': self.sin_entrega,
+            }
+
+
+class Avisos:
+    """Carriles de envío y credenciales VAPID"""
+
+    def __init__(self):
+        self.app = None
+        self.clave_privada = None
+        self.claims = None
+        self.carriles = {nombre: Carril(nombre, self) for nombre, _, _ in PRIORIDADES.values()}
+        self.desactivadas = 0
+
+    def init_app(self, app, clave_privada, email):
+        self.app = app
+        self.clave_privada = clave_privada
+        self.claims = {'sub': email}
+
+    def encolar(self, cliente_id, mensaje):
+        """Deja el aviso en el carril de su prioridad; retorna el nombre del carril"""
+        carril, ttl, extra = cabeceras(mensaje, cliente_id)
+        self.carriles[carril].encolar(cliente_id, mensaje, ttl, extra)
+        return carril
+
+    def enviar_ahora(self, cliente_id, mensaje, ttl=None, extra=None, sesion=None):
+        """Envía el aviso a las suscripciones activas del cliente en este hilo.
+        Retorna cuántas lo recibieron."""
+        # Import diferido: pywebpush arrastra cryptography/http_ece (lento al arrancar)
+        from pywebpush import webpush, WebPushException
+
+        if ttl is None or extra is None:
+            _, ttl, extra = cabeceras(mensaje, cliente_id)
+        suscripciones = PushSubscription.query.filter_by(cliente_id=cliente_id, is_active=True).all()
+        if not suscripciones:
+            print(f"⚠️ No hay suscripciones push activas para cliente {cliente_id}")
+            return 0
+
+        payload = serializacion.dumps(mensaje)
+        enviadas = 0
+        for suscripcion in suscripciones:
+            try:
+                response = webpush(
+                    subscription_info={
+                        "endpoint": suscripcion.endpoint,
+                        "keys": {"p256dh": suscripcion.p256dh_key, "auth": suscripcion.auth_key},
+                    },
+                    data=payload,
+                    vapid_private_key=self.clave_privada,
+                    vapid_claims=dict(self.claims),  # webpush le agrega 'aud' y 'exp'
+                    ttl=ttl,
+                    headers=dict(extra),
+                    timeout=TIMEOUT_ENVIO,
+                    requests_session=sesion,
+                )
+                print(f"✅ Push {mensaje.get('type')} a cliente {cliente_id} - Status: {response.status_code}")
+                enviadas += 1
+            except WebPushException as e:
+                print(f"❌ Error WebPush para suscripción {suscripcion.id}: {e}")
+                # Si el endpoint ya no es válido, desactivar la suscripción
+                if e.response is not None and e.response.status_code in (404, 410):
+                    print(f"🗑️ Desactivando suscripción inválida: {suscripcion.id}")
+                    suscripcion.is_active = False
+                    db.session.commit()
+                    self.desactivadas += 1
+            except Exception as e:
+                print(f"❌ Error general enviando push a suscripción {suscripcion.id}: {e}")
+        return enviadas
+
+    def vaciar(self):
+        for carril in self.carriles.values():
+            carril.vaciar()
+
+    def metricas(self):
+        return {
+            'carriles': {nombre: carril.metricas() for nombre, carril in self.carriles.items()},
+            'desactivadas': self.desactivadas,
+        }
+
+
+avisos = Avisos()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark de arranque: tiempo de `import app` y de arranque en frío
+(import + create_app() + primera respuesta) del árbol actual contra otra
+versión del repositorio (por defecto HEAD~1).
+
+Cada versión se copia a un directorio temporal con su propia base SQLite,
+y cada medición es un proceso Python nuevo. Para comparar en hardware
+parecido a Render, ejecutarlo en el shell del servicio (sin DATABASE_URL
+apunta a SQLite; con DATABASE_URL mide también la conexión real).
+
+Uso: python benchmarks/bench_arranque.py [ref_anterior] [repeticiones]
+"""
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Se ejecuta dentro de cada copia del repo
+MEDICION = r'''
+import json, sys, threading, time
+t0 = time.perf_counter()
+import app as m
+t_import = time.perf_counter() - t0
+hilos_import = threading.active_count()
+pywebpush_import = 'pywebpush' in sys.modules
+if hasattr(m, 'create_app'):
+    m.create_app()
+respuesta = m.app.test_client().get('/login')
+t_total = time.perf_counter() - t0
+print('@@' + json.dumps({
+    'import': t_import, 'arranque': t_total, 'status': respuesta.status_code,
+    'hilos_import': hilos_import, 'pywebpush_import': pywebpush_import,
+}))
+'''
+
+
+def copiar_arbol(ref, destino):
+    """Copia los archivos versionados de `ref` (o del árbol de trabajo si ref es None)"""
+    if ref is None:
+        archivos = subprocess.run(['git', 'ls-files', '-co', '--exclude-standard'], cwd=RAIZ,
+                                  capture_output=True, text=True, check=True).stdout.split('\n')
+        for archivo in archivos:
+            if not archivo or archivo.startswith(('node_modules/', 'instance/')):
+                continue
+            origen = os.path.join(RAIZ, archivo)
+            if os.path.isfile(origen):
+                os.makedirs(os.path.dirname(os.path.join(destino, archivo)), exist_ok=True)
+                shutil.copy2(origen, os.path.join(destino, archivo))
+    else:
+        archivo_tar = subprocess.run(['git', 'archive', ref], cwd=RAIZ, capture_output=True, check=True).stdout
+        subprocess.run(['tar', 'x', '-C', destino], input=archivo_tar, check=True)
+        shutil.rmtree(os.path.join(destino, 'instance'), ignore_errors=True)
+
+
+def medir_una_vez(directorio):
+    salida = subprocess.run([sys.executable, '-c', MEDICION], cwd=directorio,
+                            capture_output=True, text=True, timeout=120)
+    linea = [l for l in salida.stdout.splitlines() if l.startswith('@@')]
+    if not linea:
+        raise RuntimeError(salida.stderr[-2000:])
+    return json.loads(linea[0][2:])
+
+
+def medir(directorios, repeticiones):
+    """Alterna las versiones en cada vuelta para que el ruido de la máquina afecte a ambas"""
+    resultados = {d: [] for d in directorios}
+    # La primera vuelta crea las bases SQLite y se descarta
+    for vuelta in range(repeticiones + 1):
+        for directorio in directorios:
+            r = medir_una_vez(directorio)
+            if vuelta > 0:
+                resultados[directorio].append(r)
+    return resultados
+
+
+def resumen(nombre, resultados):
+    imp = statistics.median(r['import'] for r in resultados) * 1000
+    arr = statistics.median(r['arranque'] for r in resultados) * 1000
+    r = resultados[-1]
+    print(f"{nombre:10} {imp:12.0f} {arr:14.0f} {r['hilos_import']:>17} {str(r['pywebpush_import']):>20}")
+    return imp, arr
+
+
+def main():
+    ref = sys.argv[1] if len(sys.argv) > 1 else 'HEAD~1'
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with tempfile.TemporaryDirectory() as tmp:
+        antes_dir = os.path.join(tmp, 'antes')
+        despues_dir = os.path.join(tmp, 'despues')
+        os.makedirs(antes_dir)
+        os.makedirs(despues_dir)
+        copiar_arbol(ref, antes_dir)
+        copiar_arbol(None, despues_dir)
+
+        print(f"Mediana de {repeticiones} procesos (ms)  —  antes = {ref}, después = árbol actual")
+        print(f"{'versión':10} {'import app':>12} {'1ª respuesta':>14} {'hilos tras import':>17} {'pywebpush al import':>20}")
+        resultados = medir([antes_dir, despues_dir], repeticiones)
+        imp_a, arr_a = resumen('antes', resultados[antes_dir])
+        imp_d, arr_d = resumen('después', resultados[despues_dir])
+        print(f"\nimport: {imp_a / imp_d:.2f}x más rápido ({imp_a - imp_d:.0f} ms menos)")
+        print(f"arranque en frío hasta la 1ª respuesta: {arr_a:.0f} ms -> {arr_d:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark de serialización JSON de los payloads más frecuentes: el proveedor
+por defecto de Flask (json estándar + iso_utc por campo en el handler) contra
+serializacion.py (orjson si está instalado, fechas serializadas solas).
+
+Uso: python benchmarks/bench_json.py [repeticiones]
+"""
+import os
+import sys
+import timeit
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+import serializacion  # noqa: E402
+from tiempo import ahora_utc, iso_utc  # noqa: E402
+
+
+# --- Payloads (misma forma que /clientes, obtener_info_mesa, actualizar_posicion)
+
+def clientes_en_cola(n=60):
+    ahora = ahora_utc()
+    return [{
+        'id': i,
+        'nombre': f'Cliente {i}',
+        'telefono': f'+5691234{i:04d}',
+        'cantidad_comensales': 1 + i % 6,
+        'joined_at': ahora - timedelta(minutes=n - i),
+        'tiene_orden_previa': i % 3 == 0,
+        'en_camino': i % 5 == 0,
+    } for i in range(n)]
+
+
+def info_mesa():
+    ahora = ahora_utc()
+    return {
+        'success': True,
+        'mesa_id': 7,
+        'is_occupied': True,
+        'capacidad': 4,
+        'reservada': False,
+        'start_time': ahora - timedelta(minutes=35),
+        'orden': '2x Pizza Margherita, 1x Lasagna, 3x Limonada',
+        'cliente': {
+            'id': 120,
+            'nombre': 'Ana',
+            'telefono': '+56912345678',
+            'cantidad_comensales': 4,
+            'joined_at': ahora - timedelta(minutes=50),
+            'mesa_asignada_at': ahora - timedelta(minutes=40),
+            'llego_comensal': True,
+        },
+    }
+
+
+def posicion():
+    return {'primero': 120, 'posicion': 3, 'total': 14}
+
+
+def con_iso(obj):
+    """Lo que hacían los handlers antes: convertir cada fecha a texto a mano"""
+    if isinstance(obj, list):
+        return [con_iso(x) for x in obj]
+    if isinstance(obj, dict):
+        return {k: con_iso(v) for k, v in obj.items()}
+    if hasattr(obj, 'tzinfo'):
+        return iso_utc(obj)
+    return obj
+
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    app = Flask(__name__)
+    anterior = DefaultJSONProvider(app)
+    nuevo = serializacion.ProveedorJSON(app)
+
+    casos = [
+        ('/clientes (60 en cola)', clientes_en_cola()),
+        ('obtener_info_mesa', info_mesa()),
+        ('actualizar_posicion', posicion()),
+    ]
+
+    print(f"motor: {serializacion.MOTOR}")
+    print(f"{'payload':26} {'antes (µs)':>12} {'después (µs)':>14} {'mejora':>8}")
+    for nombre, payload in casos:
+        # Las salidas deben ser equivalentes antes de medir
+        assert serializacion.loads(nuevo.dumps(payload)) == anterior.loads(anterior.dumps(con_iso(payload)))
+
+        def antes():
+            anterior.dumps(con_iso(payload), separators=(',', ':')).encode('utf-8')
+
+        def despues():
+            serializacion.dumps_bytes(payload, sort_keys=nuevo.sort_keys)
+
+        t_antes = min(timeit.repeat(antes, number=repeticiones, repeat=3)) / repeticiones * 1e6
+        t_despues = min(timeit.repeat(despues, number=repeticiones, repeat=3)) / repeticiones * 1e6
+        print(f"{nombre:26} {t_antes:12.2f} {t_despues:14.2f} {t_antes / t_despues:7.1f}x")
+
+    # Paquete Socket.IO: python-socketio llama json.dumps(data, separators=...)
+    paquete = ['actualizar_posicion', posicion()]
+    import json
+    t_antes = min(timeit.repeat(lambda: json.dumps(paquete, separators=(',', ':')),
+                                number=repeticiones, repeat=3)) / repeticiones * 1e6
+    t_despues = min(timeit.repeat(lambda: serializacion.dumps(paquete, separators=(',', ':')),
+                                  number=repeticiones, repeat=3)) / repeticiones * 1e6
+    print(f"{'paquete socket.io':26} {t_antes:12.2f} {t_despues:14.2f} {t_antes / t_despues:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los caminos calientes con fila de 10 a 10.000 clientes:
+
+- enviar_estado_cola (cálculo y envío del estado a cada cliente en la fila)
+- buscar_siguiente_cliente_en_orden
+- POST /liberar_mesa de una mesa y de un grupo de 3 mesas (con reasignación)
+- calcular_tiempo_espera_promedio
+- GET /estadisticas (con tantos usos de mesa como clientes en la fila)
+- GET /trabajador (render de la página del mesero)
+- formatear_orden_previa (desde el texto JSON de la orden, una por cliente)
+
+Como bench_arranque.py, mide una copia del árbol actual o de otra versión
+(--ref) en un proceso nuevo, así se pueden medir commits anteriores con el
+mismo script. Las funciones se buscan donde estén en cada versión (app.py,
+mesas.py, estado_cliente.py, models.py); si un caso no existe en esa versión
+queda con "error" en el resultado.
+
+Base de datos: SQLite nueva dentro de la copia, o PostgreSQL si se define
+BENCH_DATABASE_URL. OJO: esa base se vacía (drop_all) en cada tamaño; usar
+una base desechable, nunca la de producción.
+
+Los resultados (mediana y mínimo en ms por caso y tamaño) se guardan en JSON
+con el commit medido, para comparar corridas:
+
+Uso:
+    python benchmarks/bench_rutas.py [--ref REF] [--tamanos 10,100,1000,10000]
+                                     [--repeticiones 5] [--salida archivo.json]
+    python benchmarks/bench_rutas.py --comparar antes.json despues.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_arranque import copiar_arbol  # noqa: E402
+
+TAMANOS = (10, 100, 1000, 10000)
+CASOS = ('enviar_estado_cola', 'buscar_siguiente_cliente_en_orden', 'liberar_mesa', 'liberar_mesa_grupo',
+         'calcular_tiempo_espera_promedio', '/estadisticas', '/trabajador', 'formatear_orden_previa')
+
+# Se ejecuta dentro de la copia del repo; escribe el JSON de resultados en la última línea
+MEDICION = r'''
+import importlib, json, os, statistics, sys, time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import insert, update
+
+import app as m
+from models import db, Cliente, Mesa, UsoMesa
+
+app = m.app
+app.config['TESTING'] = True
+tamanos = [int(t) for t in os.environ['BENCH_TAMANOS'].split(',')]
+repeticiones = int(os.environ['BENCH_REPETICIONES'])
+MESA_SOLA, MESAS_GRUPO = 1, (2, 3, 4)
+
+
+def buscar(nombre, modulos=('mesas', 'estado_cliente', 'models', 'app')):
+    """La función en el primer módulo de esta versión que la tenga"""
+    for modulo in modulos:
+        try:
+            funcion = getattr(importlib.import_module(modulo), nombre, None)
+        except ImportError:
+            continue
+        if funcion is not None:
+            return funcion
+    raise LookupError(f'{nombre} no existe en esta versión')
+
+
+def ahora():
+    return datetime.now(timezone.utc)
+
+
+def sembrar(n):
+    """Fila de n clientes (con sid y orden previa), 50 atendidos y n usos de mesa"""
+    db.drop_all()
+    db.create_all()
+    m.initialize_tables()
+    t0 = ahora()
+    orden = json.dumps({'personas': [
+        {'comida': 'Pizza Margherita', 'bebida': 'Limonada', 'notas': 'sin albahaca'},
+        {'comida': 'Lasagna', 'bebida': 'Agua', 'notas': ''},
+    ]})
+    derivados = {}
+    if hasattr(Cliente, 'orden_previa_personas'):
+        # El INSERT masivo no pasa por el @validates de orden_previa: las columnas
+        # derivadas se llenan aquí, como las dejaría el modelo
+        personas = buscar('normalizar_orden_previa', ('models',))(orden)
+        derivados = {'orden_previa_personas': personas,
+                     'orden_previa_texto': buscar('formatear_personas', ('models',))(personas) or orden}
+    db.session.execute(insert(Cliente), [{
+        'nombre': f'bench-{i}', 'cantidad_comensales': 2, 'telefono': f'+569{i:08d}',
+        'joined_at': t0 - timedelta(seconds=n - i), 'sid': f'sid-bench-{i}', 'orden_previa': orden,
+        **derivados,
+    } for i in range(n)])
+    db.session.execute(insert(Cliente), [{
+        'nombre': f'atendido-{i}', 'cantidad_comensales': 2, 'telefono': f'+568{i:08d}',
+        'joined_at': t0 - timedelta(minutes=60 + i), 'atendido_at': t0 - timedelta(minutes=40 + i),
+        'mesa_asignada_at': t0 - timedelta(minutes=40 + i), 'assigned_table': 20,
+    } for i in range(50)])
+    db.session.execute(insert(UsoMesa), [{
+        'mesa_id': 1 + i % 20, 'duracion': 1800 + i % 900, 'timestamp': t0 - timedelta(minutes=i),
+    } for i in range(n)])
+    db.session.commit()
+    grupo = Cliente(nombre='bench-grupo', cantidad_comensales=8, joined_at=t0, assigned_table=MESAS_GRUPO[0])
+    db.session.add(grupo)
+    db.session.commit()
+    return grupo.id
+
+
+def reiniciar(grupo_id):
+    """Vuelve la fila y las mesas al estado sembrado (sin medir)"""
+    db.session.execute(update(Cliente).where(Cliente.nombre.like('bench-%'), Cliente.id != grupo_id)
+                       .values(assigned_table=None, atendido_at=None, mesa_asignada_at=None))
+    db.session.execute(update(Mesa).values(is_occupied=False, reservada=False, cliente_id=None,
+                                           start_time=None, llego_comensal=False))
+    db.session.execute(update(Mesa).where(Mesa.id == MESA_SOLA)
+                       .values(is_occupied=True, start_time=ahora(), llego_comensal=True))
+    db.session.execute(update(Mesa).where(Mesa.id.in_(MESAS_GRUPO))
+                       .values(is_occupied=True, start_time=ahora(), llego_comensal=True, cliente_id=grupo_id))
+    db.session.commit()
+
+
+def medir(funcion, preparar=None):
+    tiempos = []
+    for _ in range(repeticiones + 1):  # la primera vuelta calienta cachés y se descarta
+        if preparar:
+            preparar()
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    tiempos = tiempos[1:]
+    return {'mediana_ms': round(statistics.median(tiempos), 3), 'min_ms': round(min(tiempos), 3)}
+
+
+def estado_cola():
+    enviar = getattr(m, 'enviar_estado_cola_inmediato', None) or m.enviar_estado_cola
+    try:
+        estados = importlib.import_module('estado_cliente').estados
+    except ImportError:
+        estados = None
+    local = getattr(importlib.import_module('locales'), 'principal', lambda: None)() if estados else None
+
+    def preparar():
+        if estados is not None:
+            estados.cambio(local)  # fuerza el recálculo, como tras un cambio real de la fila
+
+    def correr():
+        try:
+            enviar(local) if local else enviar()
+        except TypeError:
+            enviar()
+    return correr, preparar
+
+
+def ok(respuesta):
+    """Una respuesta de error mediría otra cosa: el caso queda con 'error'"""
+    if respuesta.status_code != 200:
+        raise RuntimeError(f'HTTP {respuesta.status_code}')
+    return respuesta
+
+
+def casos(grupo_id, trabajador):
+    ordenes = [c.orden_previa for c in Cliente.query.filter(Cliente.orden_previa.isnot(None))]
+    try:
+        formatear = buscar('formatear_orden_previa', ('app',))
+    except LookupError:
+        normalizar, personas = buscar('normalizar_orden_previa'), buscar('formatear_personas')
+        formatear = lambda texto: personas(normalizar(texto))
+    reinicio = lambda: reiniciar(grupo_id)
+    return {
+        'enviar_estado_cola': estado_cola,
+        'buscar_siguiente_cliente_en_orden': lambda: (buscar('buscar_siguiente_cliente_en_orden'), None),
+        'liberar_mesa': lambda: (lambda: ok(trabajador.post(f'/liberar_mesa/{MESA_SOLA}')), reinicio),
+        'liberar_mesa_grupo': lambda: (lambda: ok(trabajador.post(f'/liberar_mesa/{MESAS_GRUPO[0]}')), reinicio),
+        'calcular_tiempo_espera_promedio': lambda: (buscar('calcular_tiempo_espera_promedio',
+                                                           ('estado_cliente', 'app')), None),
+        '/estadisticas': lambda: (lambda: ok(trabajador.get('/estadisticas')), None),
+        '/trabajador': lambda: (lambda: ok(trabajador.get('/trabajador')), None),
+        'formatear_orden_previa': lambda: (lambda: [formatear(o) for o in ordenes], None),
+    }
+
+
+resultados = {}
+with app.app_context():
+    motor = db.engine.dialect.name
+    for n in tamanos:
+        grupo_id = sembrar(n)
+        reiniciar(grupo_id)
+        trabajador = app.test_client()
+        with trabajador.session_transaction() as sesion:
+            sesion['trabajador_id'] = 1
+        with app.test_request_context('/'):
+            for nombre, crear in casos(grupo_id, trabajador).items():
+                try:
+                    funcion, preparar = crear()
+                    resultados.setdefault(nombre, {})[str(n)] = medir(funcion, preparar)
+                except Exception as e:
+                    db.session.rollback()
+                    resultados.setdefault(nombre, {})[str(n)] = {'error': f'{type(e).__name__}: {e}'[:200]}
+        print(f'# {n} clientes listo', file=sys.stderr)
+
+print('@@' + json.dumps({'motor': motor, 'resultados': resultados}))
+'''
+
+
+def git(*args, ref_dir=RAIZ):
+    return subprocess.run(['git', *args], cwd=ref_dir, capture_output=True, text=True).stdout.strip()
+
+
+def identificar(ref):
+    """(commit corto, si el árbol tiene cambios sin commit) de lo que se mide"""
+    if ref:
+        return git('rev-parse', '--short', ref), False
+    return git('rev-parse', '--short', 'HEAD'), bool(git('status', '--porcelain', '--untracked-files=no'))
+
+
+def correr(ref, tamanos, repeticiones):
+    with tempfile.TemporaryDirectory() as directorio:
+        copiar_arbol(ref, directorio)
+        entorno = dict(os.environ, BENCH_TAMANOS=','.join(map(str, tamanos)),
+                       BENCH_REPETICIONES=str(repeticiones))
+        entorno.pop('DATABASE_URL', None)
+        if os.environ.get('BENCH_DATABASE_URL'):
+            entorno['DATABASE_URL'] = os.environ['BENCH_DATABASE_URL']
+        salida = subprocess.run([sys.executable, '-c', MEDICION], cwd=directorio, env=entorno,
+                                stdout=subprocess.PIPE, stderr=None, text=True)
+    linea = [l for l in salida.stdout.splitlines() if l.startswith('@@')]
+    if not linea:
+        raise RuntimeError('La medición no terminó (ver la salida de error arriba)')
+    return json.loads(linea[-1][2:])
+
+
+def tabla(resultados, tamanos):
+    print(f"{'caso (mediana ms)':34}" + ''.join(f'{n:>12}' for n in tamanos))
+    for caso in CASOS:
+        celdas = []
+        for n in tamanos:
+            r = resultados.get(caso, {}).get(str(n), {})
+            celdas.append(f"{r['mediana_ms']:12.2f}" if 'mediana_ms' in r else f"{'error':>12}")
+        print(f'{caso:34}' + ''.join(celdas))
+
+
+def comparar(archivo_antes, archivo_despues):
+    with open(archivo_antes) as f:
+        antes = json.load(f)
+    with open(archivo_despues) as f:
+        despues = json.load(f)
+    tamanos = sorted({int(n) for caso in despues['resultados'].values() for n in caso})
+    print(f"antes = {antes['commit']} ({antes['motor']}), después = {despues['commit']} ({despues['motor']})")
+    print(f"{'caso (antes/después)':34}" + ''.join(f'{n:>12}' for n in tamanos))
+    for caso in CASOS:
+        celdas = []
+        for n in tamanos:
+            a = antes['resultados'].get(caso, {}).get(str(n), {})
+            d = despues['resultados'].get(caso, {}).get(str(n), {})
+            if 'mediana_ms' in a and 'mediana_ms' in d and d['mediana_ms'] > 0:
+                celdas.append(f"{a['mediana_ms'] / d['mediana_ms']:11.2f}x")
+            else:
+                celdas.append(f"{'-':>12}")
+        print(f'{caso:34}' + ''.join(celdas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de los caminos calientes por tamaño de fila.')
+    parser.add_argument('--ref', default=None, help='Versión a medir (por defecto, el árbol de trabajo).')
+    parser.add_argument('--tamanos', default=','.join(map(str, TAMANOS)), help='Clientes en la fila, separados por coma.')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--salida', default=None,
+                        help='JSON de resultados (por defecto benchmarks/resultados/<commit>.json).')
+    parser.add_argument('--comparar', nargs=2, metavar=('ANTES', 'DESPUES'),
+                        help='Compara dos JSON de resultados sin medir.')
+    args = parser.parse_args()
+
+    if args.comparar:
+        comparar(*args.comparar)
+        return
+
+    tamanos = [int(t) for t in args.tamanos.split(',') if t.strip()]
+    commit, sucio = identificar(args.ref)
+    medicion = correr(args.ref, tamanos, args.repeticiones)
+    datos = {
+        'commit': commit + ('-sucio' if sucio else ''),
+        'ref': args.ref or 'árbol de trabajo',
+        'fecha': datetime.now(timezone.utc).isoformat(),
+        'motor': medicion['motor'],
+        'python': platform.python_version(),
+        'maquina': platform.machine(),
+        'repeticiones': args.repeticiones,
+        'tamanos': tamanos,
+        'resultados': medicion['resultados'],
+    }
+    salida = args.salida or os.path.join(RAIZ, 'benchmarks', 'resultados', f"{datos['commit']}.json")
+    os.makedirs(os.path.dirname(salida) or '.', exist_ok=True)
+    with open(salida, 'w') as f:
+        json.dump(datos, f, indent=2, ensure_ascii=False)
+
+    print(f"commit {datos['commit']} · {datos['motor']} · mediana de {args.repeticiones} repeticiones")
+    tabla(datos['resultados'], tamanos)
+    print(f'\n💾 {salida}')
+
+
+if __name__ == '__main__':
+    main()
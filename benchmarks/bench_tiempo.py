@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los helpers de fecha: versión anterior (pytz construido en cada
+llamada, fechas naive en hora de Chile) contra tiempo.py (UTC + zoneinfo).
+
+pytz ya no es dependencia de la app: solo lo usa la versión anterior que
+se mide aquí (pip install pytz).
+
+Uso: python benchmarks/bench_tiempo.py [repeticiones]
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tiempo  # noqa: E402
+
+try:
+    import pytz
+except ImportError:
+    sys.exit('❌ Este benchmark compara contra pytz: pip install pytz')
+
+
+# --- Implementación anterior (copiada de app.py antes del cambio) -----------
+
+def legacy_get_chile_time():
+    santiago_tz = pytz.timezone('America/Santiago')
+    return datetime.now(santiago_tz)
+
+
+def legacy_convert_to_chile_time(dt):
+    if dt is None:
+        return None
+    santiago_tz = pytz.timezone('America/Santiago')
+    if dt.tzinfo is None:
+        return santiago_tz.localize(dt)
+    return dt.astimezone(santiago_tz)
+
+
+def legacy_datetime_to_js_timestamp(dt):
+    if dt is None:
+        return None
+    return int(legacy_convert_to_chile_time(dt).timestamp() * 1000)
+
+
+def legacy_duracion(start_time):
+    return (legacy_get_chile_time() - legacy_convert_to_chile_time(start_time)).total_seconds()
+
+
+# --- Casos -----------------------------------------------------------------
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    naive_chile = datetime.now() - timedelta(minutes=42)
+    aware_utc = tiempo.ahora_utc() - timedelta(minutes=42)
+
+    casos = [
+        ('hora actual', lambda: legacy_get_chile_time(), lambda: tiempo.ahora_utc()),
+        ('a hora de Chile', lambda: legacy_convert_to_chile_time(naive_chile), lambda: tiempo.a_chile(aware_utc)),
+        ('timestamp JS (template)', lambda: legacy_datetime_to_js_timestamp(naive_chile),
+         lambda: tiempo.datetime_to_js_timestamp(aware_utc)),
+        ('duración de uso de mesa', lambda: legacy_duracion(naive_chile),
+         lambda: tiempo.segundos_entre(aware_utc, tiempo.ahora_utc())),
+    ]
+
+    print(f"{'caso':28} {'antes (µs)':>12} {'después (µs)':>14} {'mejora':>8}")
+    for nombre, antes, despues in casos:
+        t_antes = min(timeit.repeat(antes, number=repeticiones, repeat=3)) / repeticiones * 1e6
+        t_despues = min(timeit.repeat(despues, number=repeticiones, repeat=3)) / repeticiones * 1e6
+        print(f"{nombre:28} {t_antes:12.3f} {t_despues:14.3f} {t_antes / t_despues:7.1f}x")
+
+    # Duración que cruza el fin del horario de verano (primer domingo de abril 2025):
+    # 2 horas reales entre 00:30 y 01:30 hora local "repetida"
+    inicio_utc = datetime(2025, 4, 6, 2, 30, tzinfo=tiempo.UTC)
+    fin_utc = inicio_utc + timedelta(hours=2)
+    inicio_local = tiempo.a_chile(inicio_utc).replace(tzinfo=None)
+    fin_local = tiempo.a_chile(fin_utc).replace(tzinfo=None)
+    antes = (legacy_convert_to_chile_time(fin_local) - legacy_convert_to_chile_time(inicio_local)).total_seconds()
+    print(f"\nDST: duración real 7200 s -> antes {antes:.0f} s, después {tiempo.segundos_entre(inicio_utc, fin_utc):.0f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Build de imágenes responsivas: variantes WebP/AVIF en varios anchos de cada
+imagen de static/images/ y public/, en paralelo con un pool de procesos, y
+manifiesto para el helper `imagen()` de las plantillas (ver imagenes.py).
+
+Es incremental: el nombre de cada variante lleva el hash de la imagen
+original y de los parámetros de codificación, así que solo se recodifican
+las imágenes que cambiaron (o se agregaron).
+
+Uso:
+    python build_images.py              # genera static/dist/img/ e imagenes.json
+    python build_images.py --limpiar    # además borra variantes que ya no se usan
+    python build_images.py --forzar     # recodifica todo
+
+En Render va en el Build Command, antes de build_static.py:
+    pip install -r requirements.txt && python build_images.py --limpiar && python build_static.py --limpiar
+"""
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, features
+
+from imagenes import CARPETA_IMAGENES, MANIFIESTO_IMAGENES, PREFIJO_PUBLIC
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+STATIC = os.path.join(RAIZ, 'static')
+SALIDA = os.path.join(STATIC, CARPETA_IMAGENES)
+
+# (carpeta en disco, prefijo de la clave en el manifiesto)
+ORIGENES = ((os.path.join(STATIC, 'images'), 'images/'),
+            (os.path.join(RAIZ, 'public'), PREFIJO_PUBLIC))
+
+EXTENSIONES = {'.png', '.jpg', '.jpeg', '.webp'}
+ANCHOS = (160, 320, 640, 960, 1280, 1920)
+
+# Calidad pensada para fotos e íconos de la app; cambiarla invalida las variantes
+PARAMETROS = {
+    'webp': {'quality': 80, 'method': 6},
+    'avif': {'quality': 55, 'speed': 6},
+}
+
+
+def formatos_disponibles():
+    return [f for f in PARAMETROS if f == 'webp' or features.check('avif')]
+
+
+def huella(contenido, formato):
+    h = hashlib.sha256(contenido)
+    h.update(json.dumps(PARAMETROS[formato], sort_keys=True).encode())
+    return h.hexdigest()[:10]
+
+
+def fuentes():
+    """[(clave del manifiesto, ruta en disco)] de todas las imágenes de origen"""
+    encontradas = []
+    for carpeta, prefijo in ORIGENES:
+        if not os.path.isdir(carpeta):
+            continue
+        for nombre in sorted(os.listdir(carpeta)):
+            if os.path.splitext(nombre)[1].lower() in EXTENSIONES:
+                encontradas.append((prefijo + nombre, os.path.join(carpeta, nombre)))
+    return encontradas
+
+
+def anchos_para(ancho_original):
+    """Anchos a generar sin agrandar nunca la imagen (el original cuenta como el mayor)"""
+    mayor = min(ancho_original, ANCHOS[-1])
+    return [a for a in ANCHOS if a < mayor] + [mayor]
+
+
+def nombre_seguro(clave):
+    """public/logo.jpg -> public-logo; images/black-thread (1).png -> images-black-thread-1"""
+    base = os.path.splitext(clave)[0]
+    return ''.join(c if c.isalnum() or c in '-_' else '-' for c in base.replace('/', '-')).strip('-')
+
+
+def planificar(clave, ruta, formato):
+    """Ancho/alto de la imagen y [(ancho, ruta relativa)] de sus variantes en `formato`"""
+    with open(ruta, 'rb') as f:
+        sufijo = huella(f.read(), formato)
+    with Image.open(ruta) as original:  # solo lee la cabecera
+        ancho, alto = original.size
+    variantes = [[a, f"{CARPETA_IMAGENES}/{nombre_seguro(clave)}-{a}w.{sufijo}.{formato}"]
+                 for a in anchos_para(ancho)]
+    return ancho, alto, variantes
+
+
+def codificar(ruta, formato, destino_ancho, relativa):
+    """Genera una variante (se ejecuta en el pool de procesos)"""
+    destino = os.path.join(STATIC, relativa)
+    with Image.open(ruta) as original:
+        ancho, alto = original.size
+        destino_alto = max(1, round(alto * destino_ancho / ancho))
+        # En JPEG decodifica directo a 1/2, 1/4 u 1/8 si alcanza para el ancho pedido
+        original.draft('RGB', (destino_ancho, destino_alto))
+        # Paleta/escala de grises -> RGB(A), que es lo que aceptan WebP y AVIF
+        tiene_alfa = original.mode in ('RGBA', 'LA') or 'transparency' in original.info
+        imagen = original.convert('RGBA' if tiene_alfa else 'RGB')
+    if imagen.width != destino_ancho:
+        imagen = imagen.resize((destino_ancho, destino_alto), Image.LANCZOS)
+    temporal = destino + '.tmp'
+    imagen.save(temporal, format=formato.upper(), **PARAMETROS[formato])
+    os.replace(temporal, destino)  # nunca queda una variante a medio escribir
+    return relativa
+
+
+def construir(forzar=False):
+    os.makedirs(SALIDA, exist_ok=True)
+    formatos = formatos_disponibles()
+    manifiesto = {}
+    pendientes = []
+    for clave, ruta in fuentes():
+        for formato in formatos:
+            ancho, alto, variantes = planificar(clave, ruta, formato)
+            entrada = manifiesto.setdefault(clave, {'ancho': ancho, 'alto': alto})
+            entrada[formato] = variantes
+            # Incremental: una variante existente corresponde a este mismo original
+            pendientes += [(ruta, formato, a, relativa) for a, relativa in variantes
+                           if forzar or not os.path.isfile(os.path.join(STATIC, relativa))]
+
+    # Una tarea por variante: la foto grande no deja al resto del pool esperando
+    pendientes.sort(key=lambda t: -os.path.getsize(t[0]))
+    if pendientes:
+        with ProcessPoolExecutor() as pool:
+            list(pool.map(codificar, *zip(*pendientes)))
+
+    print(f"{'imagen':40} {'original':>10} {'webp mayor':>11} {'avif mayor':>11}")
+    for clave, entrada in sorted(manifiesto.items()):
+        origen = os.path.join(RAIZ, clave) if clave.startswith(PREFIJO_PUBLIC) else os.path.join(STATIC, clave)
+        tamanos = {f: os.path.getsize(os.path.join(STATIC, entrada[f][-1][1])) for f in formatos}
+        print(f"{clave:40} {os.path.getsize(origen):>10} {tamanos.get('webp', '-'):>11} {tamanos.get('avif', '-'):>11}")
+
+    with open(os.path.join(SALIDA, MANIFIESTO_IMAGENES), 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, indent=2, sort_keys=True)
+    print(f"\n✅ {len(manifiesto)} imágenes en el manifiesto ({len(pendientes)} variantes codificadas)")
+    if 'avif' not in formatos:
+        print("ℹ️ Pillow no tiene soporte AVIF: solo se generaron variantes WebP")
+    return manifiesto
+
+
+def limpiar(manifiesto):
+    """Borra de dist/img/ las variantes que ya no están en el manifiesto"""
+    vigentes = {archivo for entrada in manifiesto.values()
+                for formato in PARAMETROS for _, archivo in entrada.get(formato, [])}
+    borrados = 0
+    for nombre in os.listdir(SALIDA):
+        relativa = f"{CARPETA_IMAGENES}/{nombre}"
+        if nombre != MANIFIESTO_IMAGENES and relativa not in vigentes:
+            os.remove(os.path.join(SALIDA, nombre))
+            borrados += 1
+    print(f"🧹 {borrados} variantes antiguas eliminadas de {CARPETA_IMAGENES}/")
+
+
+if __name__ == '__main__':
+    manifiesto = construir(forzar='--forzar' in sys.argv)
+    if '--limpiar' in sys.argv:
+        limpiar(manifiesto)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Build de archivos estáticos: nombres con hash del contenido, variantes
+precomprimidas (.gz y, si está instalado Brotli, .br) y manifiesto para
+url_for (ver estaticos.py).
+
+Uso:
+    python build_static.py            # genera static/dist/ y manifest.json
+    python build_static.py --limpiar  # además borra versiones antiguas de dist/
+
+En Render va en el Build Command, después de instalar dependencias:
+    pip install -r requirements.txt && python build_images.py --limpiar && python build_static.py --limpiar
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+
+from estaticos import CARPETA_DIST, MANIFIESTO, SIN_CACHE
+from imagenes import CARPETA_IMAGENES
+
+try:
+    import brotli
+except ImportError:  # opcional: sin Brotli solo se generan .gz
+    brotli = None
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+STATIC = os.path.join(RAIZ, 'static')
+DIST = os.path.join(STATIC, CARPETA_DIST)
+
+# Solo vale la pena comprimir texto; jpg/png/webp ya vienen comprimidos
+COMPRIMIBLES = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.ico'}
+TAMANO_MINIMO = 1024
+
+URL_CSS = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def huella(contenido):
+    return hashlib.sha256(contenido).hexdigest()[:10]
+
+
+def fuentes():
+    """Archivos de static/ a procesar (rutas relativas con '/'), CSS al final"""
+    archivos = []
+    for carpeta, subcarpetas, nombres in os.walk(STATIC):
+        if os.path.abspath(carpeta) == os.path.abspath(STATIC) and CARPETA_DIST in subcarpetas:
+            subcarpetas.remove(CARPETA_DIST)
+        for nombre in nombres:
+            relativa = os.path.relpath(os.path.join(carpeta, nombre), STATIC).replace(os.sep, '/')
+            if relativa in SIN_CACHE or nombre.startswith('.'):
+                continue
+            archivos.append(relativa)
+    # Los CSS referencian imágenes: se procesan después para reescribir sus url()
+    return sorted(archivos, key=lambda r: (r.endswith('.css'), r))
+
+
+def reescribir_css(relativa, contenido, manifiesto):
+    """Cambia url(...) de recursos propios por su versión con hash"""
+    base = os.path.dirname(relativa)
+
+    def reemplazo(m):
+        url = m.group(2).strip()
+        if url.startswith(('data:', 'http:', 'https:', '//', '#')):
+            return m.group(0)
+        ruta = url.split('?')[0].split('#')[0]
+        if ruta.startswith('/static/'):
+            destino = ruta[len('/static/'):]
+        elif ruta.startswith('/'):
+            return m.group(0)
+        else:
+            destino = os.path.normpath(os.path.join(base, ruta)).replace(os.sep, '/')
+        if destino not in manifiesto:
+            return m.group(0)
+        return f"url('/static/{manifiesto[destino]}')"
+
+    texto = contenido.decode('utf-8')
+    return URL_CSS.sub(reemplazo, texto).encode('utf-8')
+
+
+def escribir_si_falta(ruta, contenido):
+    if os.path.isfile(ruta):
+        return False
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    with open(ruta, 'wb') as f:
+        f.write(contenido)
+    return True
+
+
+def precomprimir(ruta, contenido):
+    """Genera .gz (y .br) junto al archivo; devuelve {extensión: bytes}"""
+    tamanos = {}
+    gz = gzip.compress(contenido, compresslevel=9, mtime=0)  # mtime=0: salida reproducible
+    escribir_si_falta(ruta + '.gz', gz)
+    tamanos['.gz'] = len(gz)
+    if brotli is not None:
+        br = brotli.compress(contenido, quality=11)
+        escribir_si_falta(ruta + '.br', br)
+        tamanos['.br'] = len(br)
+    return tamanos
+
+
+def construir():
+    manifiesto = {}
+    nuevos = 0
+    print(f"{'archivo':40} {'original':>10} {'gzip':>10} {'brotli':>10}")
+    for relativa in fuentes():
+        with open(os.path.join(STATIC, relativa), 'rb') as f:
+            contenido = f.read()
+        if relativa.endswith('.css'):
+            contenido = reescribir_css(relativa, contenido, manifiesto)
+
+        raiz, extension = os.path.splitext(relativa)
+        con_hash = f"{CARPETA_DIST}/{raiz}.{huella(contenido)}{extension}"
+        destino = os.path.join(STATIC, con_hash)
+        if escribir_si_falta(destino, contenido):
+            nuevos += 1
+        manifiesto[relativa] = con_hash
+
+        tamanos = {}
+        if extension.lower() in COMPRIMIBLES and len(contenido) >= TAMANO_MINIMO:
+            tamanos = precomprimir(destino, contenido)
+        print(f"{relativa:40} {len(contenido):>10} {tamanos.get('.gz', '-'):>10} {tamanos.get('.br', '-'):>10}")
+
+    with open(os.path.join(DIST, MANIFIESTO), 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, indent=2, sort_keys=True)
+    print(f"\n✅ {len(manifiesto)} archivos en el manifiesto ({nuevos} nuevos)")
+    if brotli is None:
+        print("ℹ️ Brotli no está instalado: solo se generaron variantes .gz")
+    return manifiesto
+
+
+def limpiar(manifiesto):
+    """Borra de dist/ lo que ya no está en el manifiesto (builds anteriores)"""
+    vigentes = set(manifiesto.values())
+    borrados = 0
+    for carpeta, subcarpetas, nombres in os.walk(DIST):
+        # Las variantes de imágenes las administra build_images.py
+        if os.path.abspath(carpeta) == os.path.abspath(DIST):
+            subcarpetas[:] = [s for s in subcarpetas
+                              if f"{CARPETA_DIST}/{s}" != CARPETA_IMAGENES]
+        for nombre in nombres:
+            relativa = os.path.relpath(os.path.join(carpeta, nombre), STATIC).replace(os.sep, '/')
+            base = re.sub(r'\.(gz|br)$', '', relativa)
+            if nombre != MANIFIESTO and base not in vigentes:
+                os.remove(os.path.join(carpeta, nombre))
+                borrados += 1
+    print(f"🧹 {borrados} archivos antiguos eliminados de {CARPETA_DIST}/")
+
+
+if __name__ == '__main__':
+    manifiesto = construir()
+    if '--limpiar' in sys.argv:
+        limpiar(manifiesto)
@@ -0,0 +1,88 @@
+"""
+Ingreso a la fila y clientes que vuelven, por teléfono.
+
+Antes /cliente buscaba un turno reciente por nombre (sin índice, y dos
+"Juan" eran la misma persona) y si no lo encontraba insertaba otra fila:
+escanear el QR de nuevo o recargar con la URL del formulario dejaba
+turnos duplicados en la cola.
+
+Ahora la clave es el teléfono normalizado (+569XXXXXXXX, ver
+models.normalizar_telefono) dentro del local, con un índice único parcial
+(local, telefono) WHERE assigned_table IS NULL: a lo más un turno en espera
+por teléfono, y dos escaneos simultáneos no pueden crear dos.
+
+El teléfono no autentica a nadie (cualquiera puede escribir el de otro), así
+que un turno en espera solo se reutiliza si ya es de esta sesión. Si es de
+otra, ingresar() lanza TurnoAjeno: no se liga a la sesión nueva ni se le
+cambian nombre o comensales desde el formulario.
+
+Como mesas.py, no hace commit: lo hace la ruta.
+"""
+from sqlalchemy import select
+
+import eventos
+import locales
+from mesas import TransicionInvalida
+from models import db, Cliente, insert_del_dialecto, normalizar_telefono
+from tiempo import ahora_utc
+
+INTENTOS = 3  # INSERT que chocan con un turno que desaparece antes de poder leerlo
+MENSAJE_AJENO = "Ese teléfono ya tiene un turno en la fila. Ábrelo desde el navegador donde lo pediste."
+
+
+class TurnoAjeno(TransicionInvalida):
+    """El teléfono ya tiene un turno en espera que no es de esta sesión"""
+
+    def __init__(self, cliente_id):
+        super().__init__(MENSAJE_AJENO, 409)
+        self.cliente_id = cliente_id
+
+
+def turno_en_espera(telefono, local=None):
+    """Id del turno en espera del teléfono en el local, o None"""
+    telefono = normalizar_telefono(telefono) or telefono
+    if not telefono:
+        return None
+    return db.session.execute(
+        select(Cliente.id)
+        .where(Cliente.local == (local or locales.actual()), Cliente.telefono == telefono,
+               Cliente.assigned_table.is_(None))
+        .limit(1)
+    ).scalar()
+
+
+def _propio(cliente_id, propio):
+    """El turno existente solo se devuelve a la sesión que ya lo tiene"""
+    if cliente_id != propio:
+        raise TurnoAjeno(cliente_id)
+    return cliente_id, False
+
+
+def ingresar(nombre, cantidad_comensales, telefono, local=None, propio=None):
+    """Turno del cliente: el suyo en espera (`propio`, el de su sesión) o uno nuevo al final de la fila.
+
+    Retorna (cliente_id, nuevo). Si es nuevo, su INGRESO queda en el historial.
+    Lanza TurnoAjeno si el teléfono ya tiene un turno en espera de otra sesión.
+    """
+    local = local or locales.actual()
+    telefono = normalizar_telefono(telefono) or telefono
+
+    for _ in range(INTENTOS):
+        if telefono:
+            existente = turno_en_espera(telefono, local)
+            if existente is not None:
+                return _propio(existente, propio)
+
+        consulta = insert_del_dialecto()(Cliente).values(
+            joined_at=ahora_utc(), nombre=nombre, telefono=telefono,
+            cantidad_comensales=cantidad_comensales, local=local)
+        if telefono:
+            consulta = consulta.on_conflict_do_nothing(
+                index_elements=['local', 'telefono'], index_where=Cliente.assigned_table.is_(None))
+        fila = db.session.execute(consulta.returning(Cliente.id)).first()
+        if fila is not None:
+            eventos.registrar(eventos.INGRESO, cliente_id=fila.id, cantidad_comensales=cantidad_comensales)
+            return fila.id, True
+        # Otro request insertó el turno en espera de este teléfono entre la búsqueda y el
+        # INSERT; si ya no está (cancelado o con mesa), se vuelve a intentar
+    raise TransicionInvalida("No se pudo tomar el turno, intenta de nuevo", 409)
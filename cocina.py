@@ -0,0 +1,167 @@
+"""
+Pedidos de cocina y bar sobre el modelo Pedidos.
+
+Cada ítem pedido es una fila de Pedidos que avanza
+pendiente -> en_preparacion -> servido. Las consultas de pedidos abiertos
+por estación usan el índice (local, estacion, estado, timestamp), así la
+pantalla de cocina pide solo lo que está en curso en su local y luego recibe
+los cambios incrementales por Socket.IO (sala '<local>:kitchen').
+
+Igual que mesas.py, las funciones NO hacen commit ni emiten eventos: la ruta
+confirma la transacción y avisa a la sala de cocina con lo que devuelven.
+"""
+from sqlalchemy import select, update
+
+import locales
+from mesas import TransicionInvalida, del_local
+from models import db, Cliente, Mesa, Pedidos
+from tiempo import ahora_utc
+
+# Estados
+PENDIENTE = 'pendiente'
+EN_PREPARACION = 'en_preparacion'
+SERVIDO = 'servido'
+
+ABIERTOS = (PENDIENTE, EN_PREPARACION)
+
+# Transiciones permitidas: estado destino -> estados de origen válidos
+TRANSICIONES = {
+    EN_PREPARACION: {PENDIENTE},
+    SERVIDO: {PENDIENTE, EN_PREPARACION},
+}
+SIGUIENTE = {PENDIENTE: EN_PREPARACION, EN_PREPARACION: SERVIDO}
+
+# Estaciones
+COCINA = 'cocina'
+BAR = 'bar'
+ESTACIONES = (COCINA, BAR)
+
+
+def pedido_a_dict(pedido):
+    return {
+        'id': pedido.id,
+        'mesa_id': pedido.mesa_id,
+        'cliente_id': pedido.cliente_id,
+        'persona': pedido.persona,
+        'descripcion': pedido.descripcion,
+        'cantidad': pedido.cantidad,
+        'notas': pedido.notas,
+        'estacion': pedido.estacion,
+        'estado': pedido.estado,
+        'timestamp': pedido.timestamp,
+        'actualizado_at': pedido.actualizado_at,
+    }
+
+
+def _validar_item(item):
+    descripcion = (item.get('descripcion') or '').strip()
+    if not descripcion:
+        raise TransicionInvalida("Cada ítem necesita una descripción", 400)
+    estacion = item.get('estacion') or COCINA
+    if estacion not in ESTACIONES:
+        raise TransicionInvalida(f"Estación no válida: {estacion}", 400)
+    try:
+        cantidad = int(item.get('cantidad') or 1)
+    except (TypeError, ValueError):
+        raise TransicionInvalida("Cantidad no válida", 400)
+    if cantidad < 1:
+        raise TransicionInvalida("Cantidad no válida", 400)
+    return descripcion[:200], estacion, cantidad
+
+
+def crear_pedidos(mesa_id, items, cliente_id=None):
+    """Agrega los ítems como pedidos pendientes de la mesa. Devuelve las filas creadas."""
+    mesa = del_local(db.session.get(Mesa, mesa_id))
+    if not mesa:
+        raise TransicionInvalida("Mesa no encontrada", 404)
+    if not items:
+        raise TransicionInvalida("No hay ítems en el pedido", 400)
+
+    ahora = ahora_utc()
+    creados = []
+    for item in items:
+        descripcion, estacion, cantidad = _validar_item(item)
+        pedido = Pedidos(
+            mesa_id=mesa.id,
+            cliente_id=cliente_id if cliente_id is not None else mesa.cliente_id,
+            persona=item.get('persona'),
+            descripcion=descripcion,
+            cantidad=cantidad,
+            notas=item.get('notas') or None,
+            estacion=estacion,
+            estado=PENDIENTE,
+            timestamp=ahora,
+            actualizado_at=ahora,
+            local=mesa.local,
+        )
+        db.session.add(pedido)
+        creados.append(pedido)
+    db.session.flush()  # asigna los ids para el feed de cocina
+    return creados
+
+
+def pedidos_de_orden_previa(mesa_id):
+    """Convierte la orden previa del cliente de la mesa en pedidos.
+
+    La mesa puede ser cualquiera de su grupo: la orden se copia solo a la
+    principal (Cliente.assigned_table) y los pedidos quedan en esa mesa. La
+    comida va a cocina y la bebida al bar. La conversión se marca en
+    Cliente.orden_previa_enviada_at con un UPDATE condicional, así ocurre una
+    sola vez aunque la llegada se confirme dos veces o el mesero ya haya
+    agregado ítems a mano.
+    """
+    mesa = del_local(db.session.get(Mesa, mesa_id))
+    if not mesa or not mesa.cliente_id:
+        return []
+    principal_id = db.session.execute(
+        select(Cliente.assigned_table).where(Cliente.id == mesa.cliente_id)
+    ).scalar()
+    principal = mesa if principal_id in (None, mesa.id) else db.session.get(Mesa, principal_id)
+    if not principal or not principal.orden_personas:
+        return []
+
+    items = []
+    for linea in principal.orden_personas:
+        notas = linea.get('notas') or None
+        if linea.get('comida'):
+            items.append({'descripcion': linea['comida'], 'estacion': COCINA,
+                          'persona': linea.get('persona'), 'notas': notas})
+        if linea.get('bebida'):
+            items.append({'descripcion': linea['bebida'], 'estacion': BAR,
+                          'persona': linea.get('persona'), 'notas': notas})
+    if not items:
+        return []
+
+    marcada = db.session.execute(
+        update(Cliente)
+        .where(Cliente.id == mesa.cliente_id, Cliente.orden_previa_enviada_at.is_(None))
+        .values(orden_previa_enviada_at=ahora_utc())
+    ).rowcount
+    if not marcada:
+        return []
+    return crear_pedidos(principal.id, items, cliente_id=mesa.cliente_id)
+
+
+def cambiar_estado(pedido_id, estado=None):
+    """Avanza un pedido. Sin `estado` pasa al siguiente (pendiente -> en_preparacion -> servido)."""
+    pedido = del_local(db.session.get(Pedidos, pedido_id))
+    if not pedido:
+        raise TransicionInvalida("Pedido no encontrado", 404)
+    if estado is None:
+        estado = SIGUIENTE.get(pedido.estado)
+    if estado not in TRANSICIONES or pedido.estado not in TRANSICIONES[estado]:
+        raise TransicionInvalida(f"El pedido está {pedido.estado}, no puede pasar a {estado}", 409)
+    pedido.estado = estado
+    pedido.actualizado_at = ahora_utc()
+    return pedido
+
+
+def abiertos(estacion=None, mesa_id=None, local=None):
+    """Pedidos pendientes o en preparación del local, del más antiguo al más nuevo"""
+    consulta = Pedidos.query.filter(Pedidos.local == (local or locales.actual()),
+                                    Pedidos.estado.in_(ABIERTOS))
+    if estacion:
+        consulta = consulta.filter(Pedidos.estacion == estacion)
+    if mesa_id:
+        consulta = consulta.filter(Pedidos.mesa_id == mesa_id)
+    return consulta.order_by(Pedidos.timestamp, Pedidos.id).all()
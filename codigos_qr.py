@@ -0,0 +1,151 @@
+"""
+Códigos QR de las mesas, generados a pedido.
+
+- GET /qr/<mesa_id>.png  -> QR a /qr_landing?local=<local de la mesa>
+- GET /qr/landing.png    -> QR a /qr_landing?local=<local> (el de la entrada)
+  Ambos aceptan ?tamano=<px> (entre 128 y 2048; por defecto 512).
+
+Todos los QR de un local llevan a la misma fila: la mesa donde está pegado
+el código no cambia nada (la asigna la cola), así que el QR de una mesa solo
+se distingue del de otra por el local. /qr/<mesa_id>.png existe para
+imprimir el de una mesa sin saber su local.
+
+La URL codificada usa URL_PUBLICA (p. ej. https://colasrestaurant.onrender.com)
+o, si no está definida, el host de la petición. Los PNG quedan en un LRU en
+memoria por (url, tamaño): agregar mesas o cambiar de dominio no requiere
+volver a correr scripts.
+
+`flask hoja-qr` arma un PDF imprimible (A4 a 300 DPI) con el QR de la
+entrada y el de cada mesa; los QR se renderizan en paralelo con un pool de
+procesos (ver `hoja()`).
+
+qrcode y Pillow se importan recién al generar el primer QR para no sumar
+tiempo al arranque de la app.
+"""
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from urllib.parse import urlencode
+
+from flask import Response, current_app, request
+
+URL_DEFECTO = 'https://colasrestaurant.onrender.com'
+
+TAMANO_DEFECTO = 512
+TAMANO_MIN = 128
+TAMANO_MAX = 2048
+BORDE = 4          # módulos de margen blanco (mínimo recomendado por el estándar)
+CACHE_HTTP = 24 * 3600
+
+# Hoja A4 a 300 DPI
+DPI = 300
+A4 = (2480, 3508)
+MARGEN = 150
+COLUMNAS = 3
+ALTO_ETIQUETA = 90
+
+
+def url_landing(base, local=None):
+    """URL que codifica el QR: la landing, con el local como parámetro si corresponde"""
+    url = base.rstrip('/') + '/qr_landing'
+    if local:
+        url += '?' + urlencode({'local': local})
+    return url
+
+
+def url_publica():
+    """Base pública de la app: URL_PUBLICA o el host de la petición actual"""
+    return current_app.config.get('URL_PUBLICA') or request.url_root
+
+
+def normalizar_tamano(valor):
+    try:
+        tamano = int(valor)
+    except (TypeError, ValueError):
+        return TAMANO_DEFECTO
+    return max(TAMANO_MIN, min(TAMANO_MAX, tamano))
+
+
+def imagen(url, tamano=TAMANO_DEFECTO):
+    """Imagen PIL (blanco y negro) de a lo más `tamano` px por lado"""
+    import qrcode
+
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=1, border=BORDE)
+    qr.add_data(url)
+    qr.make(fit=True)
+    # Módulos de un número entero de píxeles: bordes nítidos al imprimir y escanear
+    qr.box_size = max(1, tamano // (qr.modules_count + 2 * BORDE))
+    return qr.make_image(fill_color='black', back_color='white').get_image()
+
+
+@lru_cache(maxsize=256)
+def png(url, tamano=TAMANO_DEFECTO):
+    """PNG del QR (bytes), cacheado por (url, tamaño)"""
+    buffer = io.BytesIO()
+    imagen(url, tamano).save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def respuesta_png(url):
+    """Respuesta HTTP con el PNG del QR, cacheable y con ETag (304 si no cambió)"""
+    contenido = png(url, normalizar_tamano(request.args.get('tamano')))
+    respuesta = Response(contenido, mimetype='image/png')
+    respuesta.set_etag(hashlib.sha256(contenido).hexdigest()[:16])
+    respuesta.cache_control.public = True
+    respuesta.cache_control.max_age = CACHE_HTTP
+    return respuesta.make_conditional(request)
+
+
+def metricas():
+    info = png.cache_info()
+    return {'aciertos': info.hits, 'fallos': info.misses,
+            'en_cache': info.currsize, 'maximo': info.maxsize}
+
+
+# ----------------------------------------------------------------------------
+# Hoja imprimible
+# ----------------------------------------------------------------------------
+
+def _renderizar(tarea):
+    """PNG de una URL; corre en un proceso del pool"""
+    url, tamano = tarea
+    return png(url, tamano)
+
+
+def hoja(base, mesa_ids, salida, procesos=None, local=None):
+    """PDF con el QR de la entrada y de cada mesa de un local; devuelve la cantidad de páginas"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    ancho_celda = (A4[0] - 2 * MARGEN) // COLUMNAS
+    lado = ancho_celda - 60
+    alto_celda = lado + ALTO_ETIQUETA
+    filas = (A4[1] - 2 * MARGEN) // alto_celda
+    por_pagina = filas * COLUMNAS
+
+    etiquetas = [('Entrada', url_landing(base, local=local))]
+    etiquetas += [(f'Mesa {mesa_id}', url_landing(base, local)) for mesa_id in mesa_ids]
+    # Cada URL distinta se renderiza una sola vez (hoy todas las celdas de un local comparten la suya)
+    urls = list(dict.fromkeys(url for _, url in etiquetas))
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        pngs = dict(zip(urls, pool.map(_renderizar, [(url, lado) for url in urls], chunksize=4)))
+    celdas = [(etiqueta, pngs[url]) for etiqueta, url in etiquetas]
+
+    fuente = ImageFont.load_default(size=56)
+    paginas = []
+    for i, (etiqueta, contenido) in enumerate(celdas):
+        if i % por_pagina == 0:
+            paginas.append(Image.new('L', A4, 255))
+            dibujo = ImageDraw.Draw(paginas[-1])
+        fila, columna = divmod(i % por_pagina, COLUMNAS)
+        x = MARGEN + columna * ancho_celda
+        y = MARGEN + fila * alto_celda
+        qr = Image.open(io.BytesIO(contenido))
+        paginas[-1].paste(qr, (x + (ancho_celda - qr.width) // 2, y))
+        dibujo.text((x + ancho_celda // 2, y + qr.height + 10), etiqueta,
+                    fill=0, font=fuente, anchor='mt')
+
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    paginas[0].save(salida, format='PDF', save_all=True, append_images=paginas[1:], resolution=DPI)
+    return len(paginas)
@@ -5,6 +5,7 @@ CREATE TABLE push_subscription (
     id SERIAL PRIMARY KEY,
     cliente_id INTEGER NOT NULL,
     endpoint TEXT NOT NULL,
+    endpoint_hash VARCHAR(64) NOT NULL,  -- SHA-256 del endpoint
     p256dh_key VARCHAR(255) NOT NULL,
     auth_key VARCHAR(255) NOT NULL,
     user_agent TEXT,
@@ -18,7 +19,7 @@ CREATE TABLE push_subscription (
 
 -- Índices para optimizar consultas
 CREATE INDEX idx_cliente_active ON push_subscription (cliente_id, is_active);
-CREATE INDEX idx_endpoint ON push_subscription (endpoint);
+CREATE UNIQUE INDEX uq_push_endpoint_hash ON push_subscription (endpoint_hash);
 
 -- Verificar que la tabla se creó correctamente
 SELECT * FROM push_subscription LIMIT 1;
\ No newline at end of file
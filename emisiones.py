@@ -0,0 +1,145 @@
+"""
+Capa de emisión de Socket.IO con salas y coalescencia.
+
+Los eventos de refresco que solo usan las tablets de los meseros
+(actualizar_mesas, actualizar_lista_clientes, ...) se envían a la sala
+'workers' en lugar de hacer broadcast a todos los teléfonos conectados.
+Cada sala lleva el local como prefijo ('principal:workers', ver locales.py):
+un evento de una sede no llega a las pantallas de otra.
+
+Además, las emisiones idénticas dentro de una ventana corta (75 ms por
+defecto) se agrupan en una sola: una acción como liberar_mesa que antes
+disparaba tres broadcasts más enviar_estado_cola() ahora produce un envío de
+cada tipo. Los contadores permiten ver cuántos envíos se evitaron.
+"""
+import threading
+
+import locales
+import serializacion
+
+SALA_TRABAJADORES = 'workers'
+SALA_CLIENTES = 'clients'
+SALA_COCINA = 'kitchen'  # Pantallas de cocina/bar (todas las estaciones)
+
+
+def sala_cocina(local, estacion=None):
+    """Sala de una estación ('principal:kitchen_bar', ...) o la general de cocina del local"""
+    return locales.sala(local, f'{SALA_COCINA}_{estacion}' if estacion else SALA_COCINA)
+
+# Eventos que solo escuchan las vistas de trabajadores
+EVENTOS_TRABAJADORES = frozenset({
+    'actualizar_mesas',
+    'actualizar_lista_clientes',
+    'actualizar_cola',
+    'nuevo_cliente',
+    'cliente_necesita_multiples_mesas',
+})
+
+
+def _firma(data):
+    """Representación estable del payload para detectar emisiones idénticas"""
+    if data is None:
+        return None
+    try:
+        return serializacion.dumps_bytes(data, sort_keys=True)
+    except (TypeError, ValueError):
+        return repr(data)
+
+
+class Emisor:
+    """Agrupa emisiones idénticas dentro de una ventana y las envía una vez"""
+
+    def __init__(self, ventana=0.075):
+        self.ventana = ventana
+        self.app = None
+        self.socketio = None
+        self._pendientes = {}  # {clave: (nombre, funcion)}
+        self._programado = False
+        self._lock = threading.Lock()
+        self.solicitadas = {}
+        self.enviadas = {}
+        self.evitadas = {}
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        self.ventana = app.config.get('EMISION_VENTANA_MS', self.ventana * 1000) / 1000.0
+
+    # -- API ------------------------------------------------------------------
+
+    def emitir(self, evento, data=None, room=None):
+        """Emite `evento` una sola vez por ventana; los de trabajadores van a la sala de su local"""
+        if room is None and evento in EVENTOS_TRABAJADORES:
+            room = locales.sala(locales.actual(), SALA_TRABAJADORES)
+        clave = ('emit', evento, room, _firma(data))
+        self._agendar(clave, evento, lambda: self._emitir_ahora(evento, data, room))
+
+    def programar(self, nombre, funcion, clave=None):
+        """Ejecuta `funcion` una sola vez al final de la ventana (p. ej. enviar_estado_cola).
+
+        Con `clave` (el local) las llamadas se agrupan por separado: la cola de
+        una sede no espera ni reemplaza a la de otra.
+        """
+        self._agendar(('call', nombre, clave), nombre, funcion)
+
+    def vaciar(self):
+        """Ejecuta ya todo lo pendiente (pruebas, cierre del proceso)"""
+        with self._lock:
+            pendientes = list(self._pendientes.values())
+            self._pendientes.clear()
+            self._programado = False
+        self._ejecutar(pendientes)
+
+    def metricas(self):
+        with self._lock:
+            return {
+                'ventana_ms': int(self.ventana * 1000),
+                'solicitadas': dict(self.solicitadas),
+                'enviadas': dict(self.enviadas),
+                'evitadas': dict(self.evitadas),
+                'total_evitadas': sum(self.evitadas.values()),
+            }
+
+    # -- interno --------------------------------------------------------------
+
+    def _emitir_ahora(self, evento, data, room):
+        args = () if data is None else (data,)
+        if room:
+            self.socketio.emit(evento, *args, room=room)
+        else:
+            self.socketio.emit(evento, *args)
+
+    def _agendar(self, clave, nombre, funcion):
+        iniciar = False
+        with self._lock:
+            self.solicitadas[nombre] = self.solicitadas.get(nombre, 0) + 1
+            if clave in self._pendientes:
+                self.evitadas[nombre] = self.evitadas.get(nombre, 0) + 1
+            self._pendientes[clave] = (nombre, funcion)
+            if not self._programado:
+                self._programado = True
+                iniciar = True
+        if iniciar:
+            if self.ventana <= 0 or self.socketio is None:
+                self.vaciar()
+            else:
+                self.socketio.start_background_task(self._despues_de_ventana)
+
+    def _despues_de_ventana(self):
+        self.socketio.sleep(self.ventana)
+        self.vaciar()
+
+    def _ejecutar(self, pendientes):
+        if not pendientes:
+            return
+        with self.app.app_context():
+            for nombre, funcion in pendientes:
+                try:
+                    funcion()
+                    with self._lock:
+                        self.enviadas[nombre] = self.enviadas.get(nombre, 0) + 1
+                except Exception as e:
+                    print(f"❌ Error emitiendo evento '{nombre}': {e}")
+
+
+emisor = Emisor()
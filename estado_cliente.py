@@ -0,0 +1,207 @@
+"""
+Estado del cliente en la fila: un solo canal para posición, tiempo estimado y mesa.
+
+Antes la página del cliente, además del socket, consultaba cada 30 s
+/verificar_estado_cliente y /tiempo_espera_promedio, y cada consulta iba a la
+base de datos. Ahora:
+
+- Cada local tiene una versión en memoria que sube cuando cambia la fila
+  (ingreso, cancelación, asignación, liberación, "en camino"): la sube
+  enviar_estado_cola(), que todas esas rutas ya llaman después del commit.
+- Con cada cambio el servidor empuja 'estado_cliente' (posición, tiempo
+  estimado, mesa y versión) por el socket a cada cliente en la fila.
+- Sin socket, la página usa GET /estado_cliente/<id>: responde con ETag y,
+  si la versión no cambió, 304 sin tocar la base (If-None-Match). Con
+  ?version=<la última recibida> espera hasta ESPERA_MAXIMA segundos a que
+  cambie (long-polling).
+
+La fila y el tiempo estimado se calculan una vez por versión y local, no una
+vez por cliente. La versión que ven los clientes ("<arranque>-<n>", ver
+marca()) lleva la hora de arranque del proceso: el contador vuelve a 0 en
+cada deploy, y así ni un ETag ni un ?version= de antes del reinicio coincide.
+
+Las versiones, la fila calculada y la espera viven en la memoria del
+proceso: la app debe correr en UN proceso (socketio.run, como hoy, que
+tampoco tiene message queue para Socket.IO). Con varios workers cada uno
+tendría su contador y su Condition: un cambio hecho en uno no despierta los
+long-polls ni invalida los ETag de los otros. Ver RENDER_DEPLOYMENT.md.
+"""
+import threading
+import time
+
+from sqlalchemy import select
+
+import locales
+from models import db, Cliente
+from tiempo import segundos_entre
+
+ESPERA_MAXIMA = 25  # segundos de long-polling (menos que los timeouts típicos de proxies)
+MAXIMO_ESPERANDO = 200  # long-polls simultáneos; pasado eso se responde de inmediato
+# (por proceso: versiones y esperas están en memoria, la app corre en un solo proceso)
+
+
+def calcular_tiempo_espera_promedio(local=None):
+    """Calcula el TIEMPO MÍNIMO de espera entre los últimos 6 clientes atendidos del local.
+    Mantiene el mismo contrato del endpoint (segundos), pero ahora retorna el mínimo.
+    Si hay menos de 3 clientes con datos, retorna 15 minutos por defecto.
+    Aplica límites de 2 a 60 minutos para evitar valores extremos.
+    """
+    try:
+        # Solo las dos columnas necesarias, sin construir objetos Cliente
+        clientes_recientes = (
+            db.session.query(Cliente.joined_at, Cliente.atendido_at)
+            .filter(Cliente.local == (local or locales.actual()), Cliente.atendido_at.isnot(None))
+            .order_by(Cliente.atendido_at.desc())
+            .limit(6)
+            .all()
+        )
+
+        if len(clientes_recientes) < 3:
+            return 15 * 60
+
+        tiempos_espera = []
+        for joined_at, atendido_at in clientes_recientes:
+            if joined_at and atendido_at:
+                diff = segundos_entre(joined_at, atendido_at)
+                if diff >= 0:
+                    tiempos_espera.append(diff)
+
+        if not tiempos_espera:
+            return 15 * 60
+
+        minimo = min(tiempos_espera)
+        return max(120, min(3600, minimo))
+
+    except Exception as e:
+        print(f"Error calculando tiempo de espera (mínimo): {e}")
+        return 15 * 60
+
+
+class EstadoClientes:
+    """Versiones por local, fila calculada una vez por versión y espera de long-polling"""
+
+    def __init__(self):
+        self.arranque = format(int(time.time()), 'x')
+        self._versiones = {}  # local -> int
+        self._filas = {}      # local -> (versión, foto de la fila)
+        self._condicion = threading.Condition()
+        self.esperando = 0
+        self.contadores = {'no_modificado': 0, 'long_poll': 0, 'respuestas': 0, 'calculos': 0}
+
+    # -- versiones --------------------------------------------------------------
+
+    def version(self, local=None):
+        return self._versiones.get(local or locales.actual(), 0)
+
+    def marca(self, local=None):
+        """Versión tal como la ven los clientes: "<arranque>-<n>" """
+        return f'{self.arranque}-{self.version(local)}'
+
+    def cambio(self, local=None):
+        """La fila del local cambió: nueva versión y se despiertan los long-polls"""
+        local = local or locales.actual()
+        with self._condicion:
+            self._versiones[local] = self._versiones.get(local, 0) + 1
+            self._condicion.notify_all()
+
+    def etag(self, cliente_id, marca, local=None):
+        return f'{local or locales.actual()}-{marca}-{cliente_id}'
+
+    def esperar(self, marca, segundos, local=None):
+        """Espera hasta `segundos` a que la marca del local deje de ser `marca`.
+        Devuelve False si no cambió (o si ya hay demasiados esperando)."""
+        local = local or locales.actual()
+        with self._condicion:
+            if self.esperando >= MAXIMO_ESPERANDO:
+                return self.marca(local) != marca
+            self.esperando += 1
+            self.contadores['long_poll'] += 1
+            try:
+                return self._condicion.wait_for(lambda: self.marca(local) != marca, timeout=segundos)
+            finally:
+                self.esperando -= 1
+
+    def contar(self, clave):
+        with self._condicion:
+            self.contadores[clave] += 1
+
+    # -- estado -----------------------------------------------------------------
+
+    def fila(self, local=None):
+        """Clientes en la fila del local y tiempo estimado, calculados una vez por versión"""
+        local = local or locales.actual()
+        version = self.version(local)
+        guardada = self._filas.get(local)
+        if guardada and guardada[0] == version:
+            return guardada[1]
+        filas = db.session.execute(
+            select(Cliente.id, Cliente.nombre, Cliente.joined_at, Cliente.en_camino, Cliente.sid)
+            .where(Cliente.local == local, Cliente.assigned_table.is_(None))
+            .order_by(Cliente.joined_at)
+        ).all()
+        segundos = calcular_tiempo_espera_promedio(local)
+        foto = {
+            'version': f'{self.arranque}-{version}',
+            'clientes': filas,
+            'posiciones': {fila.id: indice for indice, fila in enumerate(filas)},
+            'promedio_segundos': segundos,
+            'promedio_minutos': round(segundos / 60),
+        }
+        self._filas[local] = (version, foto)
+        self.contar('calculos')
+        return foto
+
+    def de_fila(self, foto, indice):
+        """Estado de un cliente que sigue en la fila (sin consultar la base)"""
+        fila = foto['clientes'][indice]
+        return {
+            'version': foto['version'],
+            'cliente_id': fila.id,
+            'nombre': fila.nombre,
+            'joined_at': fila.joined_at,
+            'posicion': indice + 1,
+            'total': len(foto['clientes']),
+            'primero': foto['clientes'][0].id,
+            'tiene_mesa': False,
+            'mesa_asignada': None,
+            'mesa_asignada_at': None,
+            'en_camino': bool(fila.en_camino),
+            'promedio_segundos': foto['promedio_segundos'],
+            'promedio_minutos': foto['promedio_minutos'],
+        }
+
+    def de_cliente(self, cliente_id, local=None):
+        """Estado completo de un cliente del local, o None si ya no existe"""
+        foto = self.fila(local)
+        indice = foto['posiciones'].get(cliente_id)
+        if indice is not None:
+            return self.de_fila(foto, indice)
+        cliente = db.session.get(Cliente, cliente_id)
+        if not cliente or cliente.local != (local or locales.actual()):
+            return None
+        return {
+            'version': foto['version'],
+            'cliente_id': cliente.id,
+            'nombre': cliente.nombre,
+            'joined_at': cliente.joined_at,
+            'posicion': None,
+            'total': len(foto['clientes']),
+            'primero': foto['clientes'][0].id if foto['clientes'] else None,
+            'tiene_mesa': cliente.assigned_table is not None,
+            'mesa_asignada': cliente.assigned_table,
+            'mesa_asignada_at': cliente.mesa_asignada_at,
+            'en_camino': bool(cliente.en_camino),
+            'promedio_segundos': foto['promedio_segundos'],
+            'promedio_minutos': foto['promedio_minutos'],
+        }
+
+    def metricas(self):
+        with self._condicion:
+            return {
+                'versiones': dict(self._versiones),
+                'esperando': self.esperando,
+                **self.contadores,
+            }
+
+
+estados = EstadoClientes()
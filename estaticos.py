@@ -0,0 +1,122 @@
+"""
+Archivos estáticos con huella (hash) y precomprimidos.
+
+`python build_static.py` copia cada archivo de static/ a static/dist/ con el
+hash del contenido en el nombre (styles/output.css ->
+dist/styles/output.3f2a1b9c0d.css), genera variantes .gz/.br de los archivos
+de texto y escribe static/dist/manifest.json.
+
+En tiempo de ejecución:
+- `url_for('static', filename='styles/output.css')` devuelve la versión con
+  hash si está en el manifiesto (si no hay build, la ruta original).
+- Los archivos de dist/ se sirven con Cache-Control inmutable de un año y,
+  si el navegador lo acepta, directamente la variante .br o .gz.
+- El service worker se sirve en /sw.js (scope "/") con no-cache: su URL no
+  puede cambiar. Se le antepone la versión (hash de sw.js y del manifiesto)
+  y la lista de URLs con hash del app shell que precarga al instalarse.
+"""
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import Response, request, send_from_directory, url_for
+
+CARPETA_DIST = 'dist'
+MANIFIESTO = 'manifest.json'
+UN_ANIO = 365 * 24 * 3600
+
+# Orden de preferencia: extensión del archivo precomprimido por Content-Encoding
+CODIFICACIONES = (('br', '.br'), ('gzip', '.gz'))
+
+SERVICE_WORKER = 'sw.js'
+SIN_CACHE = {SERVICE_WORKER}
+
+# Lo que necesita /cliente para mostrarse sin conexión (rutas relativas a static/)
+APP_SHELL = ('styles/output.css', 'images/logo-alleria.png')
+
+
+class Estaticos:
+    def __init__(self):
+        self.app = None
+        self.manifiesto = {}
+        self._service_worker = None
+
+    def init_app(self, app):
+        self.app = app
+        self.cargar_manifiesto()
+        app.url_defaults(self._url_con_hash)
+        app.view_functions['static'] = self.servir
+        app.add_url_rule('/' + SERVICE_WORKER, 'service_worker', self.service_worker)
+        app.jinja_env.globals['estatico'] = self.ruta
+
+    def cargar_manifiesto(self):
+        ruta = os.path.join(self.app.static_folder, CARPETA_DIST, MANIFIESTO)
+        try:
+            with open(ruta, encoding='utf-8') as f:
+                self.manifiesto = json.load(f)
+            print(f"📦 Manifiesto de estáticos: {len(self.manifiesto)} archivos con hash")
+        except FileNotFoundError:
+            self.manifiesto = {}
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Manifiesto de estáticos inválido ({e}); se usan las rutas originales")
+            self.manifiesto = {}
+
+    def ruta(self, filename):
+        """Ruta relativa a static/ que se debe servir para `filename`"""
+        return self.manifiesto.get(filename, filename)
+
+    def _url_con_hash(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = self.ruta(values['filename'])
+
+    def service_worker(self):
+        """static/sw.js con SW_VERSION y SW_PRECACHE al inicio, servido en la raíz"""
+        if self._service_worker is None or self.app.debug:
+            with open(os.path.join(self.app.static_folder, SERVICE_WORKER), 'rb') as f:
+                codigo = f.read()
+            huella = hashlib.sha256(codigo)
+            huella.update(json.dumps(self.manifiesto, sort_keys=True).encode())
+            precache = [url_for('static', filename=archivo) for archivo in APP_SHELL]
+            cabecera = (f"self.SW_VERSION = {json.dumps(huella.hexdigest()[:10])};\n"
+                        f"self.SW_PRECACHE = {json.dumps(precache)};\n")
+            self._service_worker = cabecera.encode('utf-8') + codigo
+        respuesta = Response(self._service_worker, mimetype='application/javascript')
+        respuesta.cache_control.no_cache = True
+        respuesta.cache_control.max_age = 0
+        return respuesta
+
+    def _variante(self, filename):
+        """(codificación, nombre) del precomprimido que acepta el navegador, si existe"""
+        aceptadas = request.accept_encodings
+        for codificacion, extension in CODIFICACIONES:
+            if aceptadas[codificacion] and os.path.isfile(
+                    os.path.join(self.app.static_folder, filename + extension)):
+                return codificacion, filename + extension
+        return None, filename
+
+    def servir(self, filename):
+        carpeta = self.app.static_folder
+        if not filename.startswith(CARPETA_DIST + '/'):
+            respuesta = send_from_directory(carpeta, filename)
+            if filename in SIN_CACHE:
+                respuesta.cache_control.no_cache = True
+                respuesta.cache_control.max_age = 0
+            return respuesta
+
+        codificacion, archivo = self._variante(filename)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        respuesta = send_from_directory(carpeta, archivo, mimetype=mimetype, max_age=UN_ANIO)
+        if codificacion:
+            respuesta.headers['Content-Encoding'] = codificacion
+        respuesta.vary.add('Accept-Encoding')
+        respuesta.cache_control.public = True
+        respuesta.cache_control.immutable = True
+        return respuesta
+
+
+estaticos = Estaticos()
+
+
+def init_app(app):
+    estaticos.init_app(app)
@@ -0,0 +1,264 @@
+"""
+Historial append-only de la cola y las mesas.
+
+Cada transición (ingreso, cancelación, asignación, llegada, liberación,
+reserva, cambio de capacidad) se registra como una fila de EventoCola. El
+registro no agrega trabajo al request: los eventos se acumulan en la sesión
+de la base de datos y, sólo si la transacción hace commit, pasan a una cola
+en memoria que un hilo en segundo plano escribe por lotes. Si la transacción
+hace rollback los eventos se descartan, así el historial nunca registra algo
+que no ocurrió.
+
+La API de lectura (`eventos_desde`, `ultimo_id`, `reconstruir_estado`,
+`contar_por_tipo`) lee solo esta tabla, sin recorrer cliente/mesa/uso_mesa.
+Cada evento lleva el local donde ocurrió y las lecturas son siempre de un
+local.
+"""
+import atexit
+import json
+import queue
+import threading
+
+from sqlalchemy import event, func, insert
+
+import locales
+from models import db, EventoCola
+from tiempo import ahora_utc
+
+# Tipos de evento
+INGRESO = 'ingreso'
+CANCELACION = 'cancelacion'
+ASIGNACION = 'asignacion'
+LLEGADA = 'llegada'
+LIBERACION = 'liberacion'
+RESERVA = 'reserva'
+CAPACIDAD = 'capacidad'
+
+TIPOS = (INGRESO, CANCELACION, ASIGNACION, LLEGADA, LIBERACION, RESERVA, CAPACIDAD)
+
+_CLAVE_PENDIENTES = 'eventos_pendientes'
+
+
+class RegistroEventos:
+    """Escritor por lotes en segundo plano para EventoCola"""
+
+    def __init__(self, tamano_lote=200, intervalo=0.5):
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo  # segundos máximos que espera un evento antes de escribirse
+        self.app = None
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._lock = threading.Lock()
+        # Un solo escritor a la vez: tomar y escribir un lote es atómico, así los
+        # lotes se confirman en el orden en que se tomaron (y los ids respetan ese orden)
+        self._escritor = threading.Lock()
+        self.escritos = 0
+        self.descartados = 0
+
+    def init_app(self, app):
+        self.app = app
+        event.listen(db.session, 'after_commit', self._despues_de_commit)
+        event.listen(db.session, 'after_soft_rollback', self._despues_de_rollback)
+        atexit.register(self.vaciar)
+
+    def registrar(self, tipo, cliente_id=None, mesa_id=None, **datos):
+        """Agrega un evento a la transacción actual (se escribe tras el commit)"""
+        fila = {
+            'tipo': tipo,
+            'cliente_id': cliente_id,
+            'mesa_id': mesa_id,
+            'datos': json.dumps(datos) if datos else None,
+            'created_at': ahora_utc(),
+            'local': locales.actual(),
+        }
+        db.session.info.setdefault(_CLAVE_PENDIENTES, []).append(fila)
+
+    def _despues_de_commit(self, session):
+        pendientes = session.info.pop(_CLAVE_PENDIENTES, None)
+        if pendientes:
+            for fila in pendientes:
+                self._cola.put(fila)
+            self._asegurar_hilo()
+
+    def _despues_de_rollback(self, session, previous_transaction):
+        session.info.pop(_CLAVE_PENDIENTES, None)
+
+    def _asegurar_hilo(self):
+        # El hilo se crea con el primer evento: los comandos de CLI que no
+        # tocan la cola no lo arrancan
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name='registro-eventos', daemon=True)
+                self._hilo.start()
+
+    def _tomar_lote(self, bloquear=True):
+        lote = []
+        try:
+            lote.append(self._cola.get(timeout=self.intervalo) if bloquear else self._cola.get_nowait())
+            while len(lote) < self.tamano_lote:
+                lote.append(self._cola.get_nowait())
+        except queue.Empty:
+            pass
+        return lote
+
+    def _escribir(self, lote):
+        if not lote or self.app is None:
+            return
+        with self.app.app_context():
+            try:
+                db.session.execute(insert(EventoCola), lote)
+                db.session.commit()
+                self.escritos += len(lote)
+            except Exception as e:
+                db.session.rollback()
+                self.descartados += len(lote)
+                print(f"❌ Error escribiendo {len(lote)} eventos: {e}")
+
+    def _bucle(self):
+        while True:
+            self._cola_no_vacia()
+            with self._escritor:
+                self._escribir(self._tomar_lote(bloquear=False))
+
+    def _cola_no_vacia(self):
+        """Espera (sin tomar nada) hasta que haya algo en la cola"""
+        while self._cola.empty():
+            with self._cola.not_empty:
+                self._cola.not_empty.wait(self.intervalo)
+
+    def vaciar(self):
+        """Escribe de inmediato todo lo que esté en cola (cierre del proceso, pruebas)"""
+        while True:
+            with self._escritor:
+                lote = self._tomar_lote(bloquear=False)
+                if not lote:
+                    return
+                self._escribir(lote)
+
+    def metricas(self):
+        return {
+            'en_cola': self._cola.qsize(),
+            'escritos': self.escritos,
+            'descartados': self.descartados,
+        }
+
+
+registro = RegistroEventos()
+
+
+def init_app(app):
+    registro.init_app(app)
+
+
+def registrar(tipo, cliente_id=None, mesa_id=None, **datos):
+    registro.registrar(tipo, cliente_id=cliente_id, mesa_id=mesa_id, **datos)
+
+
+# ----------------------------------------------------------------------------
+# Lectura / replay
+# ----------------------------------------------------------------------------
+
+def _como_dict(ev):
+    return {
+        'id': ev.id,
+        'tipo': ev.tipo,
+        'cliente_id': ev.cliente_id,
+        'mesa_id': ev.mesa_id,
+        'datos': json.loads(ev.datos) if ev.datos else {},
+        'created_at': ev.created_at,
+    }
+
+
+def eventos_desde(desde_id=0, hasta=None, tipos=None, limite=None, local=None):
+    """Itera los eventos del local con id > desde_id en orden, sin cargarlos todos en memoria"""
+    consulta = EventoCola.query.filter(EventoCola.local == (local or locales.actual()),
+                                       EventoCola.id > desde_id)
+    if hasta is not None:
+        consulta = consulta.filter(EventoCola.created_at <= hasta)
+    if tipos:
+        consulta = consulta.filter(EventoCola.tipo.in_(tipos))
+    consulta = consulta.order_by(EventoCola.id)
+    if limite:
+        consulta = consulta.limit(limite)
+    for ev in consulta.yield_per(500):
+        yield _como_dict(ev)
+
+
+def ultimo_id(local=None):
+    """Id del último evento escrito del local (0 si no hay): la versión del estado"""
+    return db.session.query(func.max(EventoCola.id)).filter(
+        EventoCola.local == (local or locales.actual())).scalar() or 0
+
+
+def aplicar_evento(estado, ev):
+    """Aplica un evento a un estado {'cola': {...}, 'mesas': {...}}"""
+    cola = estado['cola']
+    mesas = estado['mesas']
+    datos = ev['datos']
+    tipo = ev['tipo']
+    cliente_id = ev['cliente_id']
+    mesas_ids = datos.get('mesas') or ([ev['mesa_id']] if ev['mesa_id'] else [])
+
+    if tipo == INGRESO:
+        cola[cliente_id] = {
+            'joined_at': ev['created_at'],
+            'cantidad_comensales': datos.get('cantidad_comensales'),
+        }
+    elif tipo == CANCELACION:
+        cola.pop(cliente_id, None)
+    elif tipo == ASIGNACION:
+        cola.pop(cliente_id, None)
+        for mesa_id in mesas_ids:
+            mesas[mesa_id] = {
+                'cliente_id': cliente_id,
+                'llego_comensal': bool(datos.get('llego_comensal', False)),
+                'reservada': False,
+                'desde': ev['created_at'],
+            }
+    elif tipo == LLEGADA:
+        for mesa_id in mesas_ids:
+            mesas.setdefault(mesa_id, {'cliente_id': cliente_id, 'reservada': False})['llego_comensal'] = True
+    elif tipo == LIBERACION:
+        for mesa_id in mesas_ids:
+            anterior = mesas.get(mesa_id, {})
+            mesas[mesa_id] = {
+                'cliente_id': None,
+                'llego_comensal': False,
+                'reservada': datos.get('reservada', anterior.get('reservada', False)),
+                'desde': None,
+            }
+    elif tipo == RESERVA:
+        for mesa_id in mesas_ids:
+            mesas.setdefault(mesa_id, {'cliente_id': None, 'llego_comensal': False})['reservada'] = bool(datos.get('reservada', True))
+    elif tipo == CAPACIDAD:
+        for mesa_id in mesas_ids:
+            mesas.setdefault(mesa_id, {'cliente_id': None, 'llego_comensal': False, 'reservada': False})['capacidad'] = datos.get('capacidad')
+    return estado
+
+
+def reconstruir_estado(hasta=None, desde_estado=None, desde_id=0, local=None):
+    """Reconstruye la cola y el estado de las mesas reproduciendo el historial.
+
+    Se puede partir de un estado previo (y el id del último evento aplicado)
+    para avanzar de forma incremental.
+    """
+    estado = desde_estado or {'cola': {}, 'mesas': {}, 'ultimo_id': desde_id}
+    for ev in eventos_desde(desde_id, hasta=hasta, local=local):
+        aplicar_evento(estado, ev)
+        estado['ultimo_id'] = ev['id']
+    return estado
+
+
+def contar_por_tipo(desde=None, hasta=None, local=None):
+    """Cantidad de eventos por tipo del local en un rango de fechas (GROUP BY en la BD)"""
+    consulta = (
+        db.session.query(EventoCola.tipo, func.count(EventoCola.id))
+        .filter(EventoCola.local == (local or locales.actual()))
+    )
+    if desde is not None:
+        consulta = consulta.filter(EventoCola.created_at >= desde)
+    if hasta is not None:
+        consulta = consulta.filter(EventoCola.created_at <= hasta)
+    return dict(consulta.group_by(EventoCola.tipo).all())
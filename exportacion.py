@@ -0,0 +1,190 @@
+"""
+Exportación del historial: clientes, usos de mesa y suscripciones push.
+
+Las filas se leen por lotes con yield_per (cursor del lado del servidor en
+PostgreSQL) seleccionando columnas, no entidades: no pasan por el identity
+map de la sesión y la memoria queda constante aunque se exporten años. Cada
+lote se escribe y se entrega apenas se lee, tanto en la respuesta HTTP (un
+generador) como en el comando `flask exportar`.
+
+Formatos: csv siempre; parquet y arrow (stream IPC) si está instalado
+pyarrow, que es opcional y se importa recién al pedir uno de ellos.
+
+De las suscripciones no se exportan el endpoint ni las claves: con ellos
+cualquiera podría mandar notificaciones al navegador del cliente.
+
+En el CSV, el texto que escribe el cliente (nombre, teléfono, user agent) se
+abre en una planilla: las celdas que empiezan con =, +, -, @, tab o CR
+llevan un ' delante para que no se evalúen como fórmula.
+"""
+import csv
+import io
+from datetime import date, timedelta
+
+from sqlalchemy import Boolean, Integer, select
+
+import locales
+from models import db, Cliente, FechaUTC, PushSubscription, UsoMesa
+from tiempo import inicio_dia_utc, iso_utc
+
+LOTE = 2000
+INICIO_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+# tabla -> (modelo, columna de fecha para filtrar, columnas exportadas)
+TABLAS = {
+    'clientes': (Cliente, 'joined_at', ('id', 'nombre', 'cantidad_comensales', 'telefono', 'joined_at',
+                                        'mesa_asignada_at', 'atendido_at', 'assigned_table', 'en_camino',
+                                        'local')),
+    'usos': (UsoMesa, 'timestamp', ('id', 'mesa_id', 'duracion', 'timestamp', 'local')),
+    'suscripciones': (PushSubscription, 'created_at', ('id', 'cliente_id', 'user_agent', 'created_at',
+                                                       'is_active', 'local')),
+}
+
+# formato -> (mimetype, extensión)
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+
+def celda_csv(valor):
+    """Texto que una planilla no interpretará como fórmula (CSV injection)"""
+    if isinstance(valor, str) and valor.startswith(INICIO_FORMULA):
+        return "'" + valor
+    return valor
+
+
+def _fecha(texto):
+    try:
+        return date.fromisoformat(texto) if texto else None
+    except ValueError:
+        raise ValueError("Fecha no válida, se espera YYYY-MM-DD")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401 (registra pyarrow.parquet)
+    except ImportError:
+        raise ValueError("Los formatos parquet y arrow necesitan pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+class _Destino:
+    """Archivo en memoria que se vacía después de cada lote (para pyarrow)"""
+
+    closed = False
+
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        return datos
+
+
+class Exportacion:
+    """Iterable de trozos (str en csv, bytes en parquet/arrow) de una tabla.
+
+    La consulta se ejecuta al crearla (un error de conexión aparece en la ruta
+    y no a mitad de la descarga); las filas se leen al iterar. `filas` cuenta
+    las filas ya escritas.
+    """
+
+    def __init__(self, tabla, formato='csv', desde=None, hasta=None, local=None, lote=LOTE):
+        if tabla not in TABLAS:
+            raise ValueError(f"Tabla no válida: {tabla} (opciones: {', '.join(TABLAS)})")
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato no válido: {formato} (opciones: {', '.join(FORMATOS)})")
+        self.tabla = tabla
+        self.formato = formato
+        self.local = local or locales.actual()
+        self.pa = _pyarrow() if formato != 'csv' else None
+        self.mimetype, self.extension = FORMATOS[formato]
+        self.filas = 0
+
+        modelo, campo_fecha, nombres = TABLAS[tabla]
+        self.columnas = [getattr(modelo, nombre) for nombre in nombres]
+        consulta = select(*self.columnas).where(modelo.local == self.local).order_by(modelo.id)
+        desde, hasta = _fecha(desde), _fecha(hasta)
+        if desde:
+            consulta = consulta.where(getattr(modelo, campo_fecha) >= inicio_dia_utc(desde))
+        if hasta:
+            consulta = consulta.where(getattr(modelo, campo_fecha) < inicio_dia_utc(hasta + timedelta(days=1)))
+        self._resultado = db.session.execute(consulta.execution_options(yield_per=lote))
+
+    @property
+    def nombre_archivo(self):
+        return f'{self.tabla}_{self.local}.{self.extension}'
+
+    def __iter__(self):
+        try:
+            if self.formato == 'csv':
+                yield from self._csv()
+            else:
+                yield from self._arrow()
+        finally:
+            self._resultado.close()
+
+    def _lotes(self):
+        for filas in self._resultado.partitions():
+            self.filas += len(filas)
+            yield filas
+
+    def _csv(self):
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        escritor.writerow([c.key for c in self.columnas])
+        fechas = [i for i, c in enumerate(self.columnas) if isinstance(c.type, FechaUTC)]
+        for filas in self._lotes():
+            for fila in filas:
+                fila = [celda_csv(v) for v in fila]
+                for i in fechas:
+                    fila[i] = iso_utc(fila[i])
+                escritor.writerow(fila)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    def _tipo_arrow(self, columna):
+        pa = self.pa
+        if isinstance(columna.type, FechaUTC):
+            return pa.timestamp('us', tz='UTC')
+        if isinstance(columna.type, Boolean):
+            return pa.bool_()
+        if isinstance(columna.type, Integer):
+            return pa.int64()
+        return pa.string()
+
+    def _arrow(self):
+        pa = self.pa
+        esquema = pa.schema([(c.key, self._tipo_arrow(c)) for c in self.columnas])
+        destino = _Destino()
+        if self.formato == 'parquet':
+            escritor = pa.parquet.ParquetWriter(destino, esquema)
+        else:
+            escritor = pa.ipc.new_stream(destino, esquema)
+        with escritor:
+            for filas in self._lotes():
+                valores = list(zip(*filas))
+                tabla = pa.Table.from_arrays(
+                    [pa.array(v, type=campo.type) for v, campo in zip(valores, esquema)], schema=esquema)
+                escritor.write_table(tabla)  # un row group / record batch por lote
+                yield destino.vaciar()
+        yield destino.vaciar()  # footer (parquet) o marca de fin (arrow)
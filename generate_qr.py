@@ -2,38 +2,31 @@
 """
 Generador de código QR para el restaurante
 Genera un código QR que redirije a la página de registro de clientes
+
+Uso: python generate_qr.py [url_base]   (por defecto URL_PUBLICA o el dominio de Render)
+
+Los QR de cada mesa se sirven en /qr/<mesa_id>.png y la hoja para imprimir
+todas las mesas se genera con `flask hoja-qr` (ver codigos_qr.py).
 """
 
-import qrcode
-from PIL import Image
 import os
+import sys
+
+import codigos_qr
+
+
+def url_base():
+    if len(sys.argv) > 1:
+        return sys.argv[1]
+    return os.environ.get('URL_PUBLICA', codigos_qr.URL_DEFECTO)
+
 
 def generate_restaurant_qr():
-    # URL de tu sitio web
-    url = "https://colasrestaurant.onrender.com/qr_landing"
-    
-    # Crear instancia QR con configuración optimizada
-    qr = qrcode.QRCode(
-        version=1,  # Controla el tamaño (1 es el más pequeño)
-        error_correction=qrcode.constants.ERROR_CORRECT_M,  # ~15% corrección de errores
-        box_size=10,  # Tamaño de cada "caja" en píxeles
-        border=4,     # Grosor del borde (mínimo recomendado: 4)
-    )
-    
-    # Agregar datos al código QR
-    qr.add_data(url)
-    qr.make(fit=True)
-    
-    # Crear imagen del QR
-    # Usar colores personalizados: negro sobre blanco
-    qr_img = qr.make_image(
-        fill_color="black",
-        back_color="white"
-    )
-    
-    # Guardar en la carpeta del proyecto
+    url = codigos_qr.url_landing(url_base())
+
     output_path = "qr_code_restaurant.png"
-    qr_img.save(output_path)
+    with open(output_path, 'wb') as f:
+        f.write(codigos_qr.png(url, 370))
     
     print(f"✅ Código QR generado exitosamente!")
     print(f"📁 Archivo guardado como: {output_path}")
@@ -44,31 +37,12 @@ def generate_restaurant_qr():
 
 def generate_high_quality_qr():
     """Genera una versión de alta calidad para impresión"""
-    url = "https://colasrestaurant.onrender.com/qr_landing"
-    
-    # Configuración para alta calidad
-    qr = qrcode.QRCode(
-        version=3,  # Más grande para mejor legibilidad
-        error_correction=qrcode.constants.ERROR_CORRECT_H,  # Máxima corrección de errores
-        box_size=20,  # Cajas más grandes
-        border=6,     # Borde más ancho
-    )
-    
-    qr.add_data(url)
-    qr.make(fit=True)
-    
-    # Crear imagen de alta resolución
-    qr_img = qr.make_image(
-        fill_color="black",
-        back_color="white"
-    ).convert('RGB')
-    
-    # Redimensionar para calidad de impresión (300 DPI aproximadamente)
-    width, height = qr_img.size
-    qr_img = qr_img.resize((width * 2, height * 2), Image.Resampling.LANCZOS)
-    
+    url = codigos_qr.url_landing(url_base())
+
+    # Tamaño para impresión (300 DPI aproximadamente)
     output_path = "qr_code_restaurant_hq.png"
-    qr_img.save(output_path, "PNG", quality=100, optimize=True)
+    with open(output_path, 'wb') as f:
+        f.write(codigos_qr.png(url, codigos_qr.TAMANO_MAX))
     
     print(f"✅ Código QR de alta calidad generado!")
     print(f"📁 Archivo guardado como: {output_path}")
@@ -92,6 +66,7 @@ if __name__ == "__main__":
         print("2. Asegúrate de que el QR tenga al menos 2.5cm x 2.5cm")
         print("3. Prueba escaneando con diferentes dispositivos")
         print("4. Coloca los códigos QR en lugares visibles en cada mesa")
+        print("5. Para una hoja con el QR de cada mesa: flask hoja-qr --salida mesas_qr.pdf")
         
     except ImportError as e:
         print("❌ Error: Faltan dependencias")
@@ -0,0 +1,95 @@
+"""
+Imágenes responsivas: variantes WebP/AVIF en varios anchos con `srcset`.
+
+`python build_images.py` genera, para cada imagen de static/images/ y
+public/, versiones reducidas en static/dist/img/ (el nombre lleva el hash
+de la imagen original, así que se sirven con la caché inmutable de
+estaticos.py) y escribe static/dist/img/imagenes.json.
+
+En las plantillas:
+    {{ imagen('images/logo-alleria.png', 'Logo', sizes='100px', clase='logo') }}
+genera un <picture> con <source> AVIF y WebP y un <img> de respaldo con la
+imagen original. Sin build (o si la imagen no está en el manifiesto) sale
+un <img> normal.
+"""
+import json
+import os
+
+from flask import url_for
+from markupsafe import Markup, escape
+
+CARPETA_IMAGENES = 'dist/img'
+MANIFIESTO_IMAGENES = 'imagenes.json'
+
+# Orden de los <source>: el navegador usa el primero que soporta
+FORMATOS = (('avif', 'image/avif'), ('webp', 'image/webp'))
+
+# Las imágenes de public/ no se sirven tal cual: su clave lleva este prefijo
+PREFIJO_PUBLIC = 'public/'
+
+
+class Imagenes:
+    def __init__(self):
+        self.app = None
+        self.manifiesto = {}
+
+    def init_app(self, app):
+        self.app = app
+        self.cargar_manifiesto()
+        app.jinja_env.globals['imagen'] = self.imagen
+        app.jinja_env.globals['srcset'] = self.srcset
+
+    def cargar_manifiesto(self):
+        ruta = os.path.join(self.app.static_folder, CARPETA_IMAGENES, MANIFIESTO_IMAGENES)
+        try:
+            with open(ruta, encoding='utf-8') as f:
+                self.manifiesto = json.load(f)
+            print(f"🖼️ Manifiesto de imágenes: {len(self.manifiesto)} con variantes")
+        except FileNotFoundError:
+            self.manifiesto = {}
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Manifiesto de imágenes inválido ({e}); se usan las originales")
+            self.manifiesto = {}
+
+    def srcset(self, ruta, formato='webp'):
+        """'url 320w, url 640w, ...' de las variantes de `ruta` en `formato` ('' si no hay)"""
+        variantes = self.manifiesto.get(ruta, {}).get(formato, [])
+        return ', '.join(f"{url_for('static', filename=archivo)} {ancho}w"
+                         for ancho, archivo in variantes)
+
+    def _respaldo(self, ruta, datos):
+        """URL del <img>: la original, o la variante más grande si la imagen viene de public/"""
+        if not ruta.startswith(PREFIJO_PUBLIC):
+            return url_for('static', filename=ruta)
+        for formato, _ in reversed(FORMATOS):
+            if datos.get(formato):
+                return url_for('static', filename=datos[formato][-1][1])
+        return ''
+
+    def imagen(self, ruta, alt='', sizes='100vw', clase=None, lazy=True, **atributos):
+        """<picture> con srcset AVIF/WebP y la imagen original como respaldo"""
+        datos = self.manifiesto.get(ruta, {})
+        attrs = {'src': self._respaldo(ruta, datos), 'alt': alt}
+        if clase:
+            attrs['class'] = clase
+        if datos:
+            # Reserva el espacio antes de que cargue (evita saltos de layout)
+            attrs['width'], attrs['height'] = datos['ancho'], datos['alto']
+        if lazy:
+            attrs['loading'] = 'lazy'
+        attrs['decoding'] = 'async'
+        attrs.update(atributos)
+        img = '<img ' + ' '.join(f'{k}="{escape(v)}"' for k, v in attrs.items()) + '>'
+
+        fuentes = [f'<source type="{tipo}" srcset="{escape(self.srcset(ruta, formato))}" sizes="{escape(sizes)}">'
+                   for formato, tipo in FORMATOS if datos.get(formato)]
+        if not fuentes:
+            return Markup(img)
+        return Markup('<picture>' + ''.join(fuentes) + img + '</picture>')
+
+
+imagenes = Imagenes()
+
+
+def init_app(app):
+    imagenes.init_app(app)
@@ -0,0 +1,323 @@
+"""
+Límites de frecuencia (rate limiting) con memoria acotada.
+
+Cada clave (normalmente la IP) guarda solo los instantes de sus últimos
+`maximo` intentos en un buffer circular (deque con maxlen): la ventana es
+deslizante y exacta, y el costo por clave es fijo. El backend en memoria
+además limita la cantidad de claves con desalojo LRU, así un barrido desde
+miles de IPs no hace crecer el proceso sin límite.
+
+Para despliegues con varios procesos/instancias, RATE_LIMIT_REDIS_URL activa
+un backend compartido en Redis (sorted set por clave, recortado a `maximo`
+elementos y con expiración). Sin esa variable no se importa redis.
+
+Uso:
+    limite_login = Limitador('login', maximo=5, ventana=15 * 60)
+    if not limite_login.permitido(ip): ...
+    limite_login.registrar(ip)
+
+    @limitar(limite_qr)          # responde 429 si se excede
+    def qr_landing(): ...
+
+Los eventos de Socket.IO usan otro esquema (LimitadorSocket): una cubeta de
+fichas (token bucket) por SID y otra por la identidad de la sesión (cliente
+o trabajador), con presupuesto por evento. La de identidad ataja al teléfono
+que se reconecta en bucle, que estrena SID en cada intento. Lo que excede se
+descarta y se le avisa al socket con 'limite_excedido' y los segundos para
+reintentar; la página reintenta sola (backpressure en el cliente).
+
+    @socketio.on('heartbeat')
+    @limitar_socket(limite_sockets, 'heartbeat')
+    def manejar_heartbeat(data): ...
+"""
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import wraps
+
+from flask import jsonify, make_response, request, session
+
+
+def ip_cliente():
+    """IP real del cliente.
+
+    No se lee X-Forwarded-For aquí: su primera entrada la escribe el propio
+    cliente y bastaba cambiarla en cada request para saltarse el límite. La
+    app envuelve el WSGI en ProxyFix (ver PROXIES_CONFIABLES en app.py), que
+    pone en remote_addr la entrada agregada por el proxy de confianza.
+    """
+    return request.remote_addr or 'desconocida'
+
+
+class BackendMemoria:
+    """Buffers circulares por clave en un OrderedDict con desalojo LRU"""
+
+    def __init__(self, max_claves=10000):
+        self.max_claves = max_claves
+        self._claves = OrderedDict()  # {clave: deque(maxlen=maximo)}
+        self._lock = threading.Lock()
+        self.desalojadas = 0
+
+    def mas_antiguo(self, clave, maximo):
+        """Instante del intento número `maximo` contando desde el más reciente (o None)"""
+        with self._lock:
+            intentos = self._claves.get(clave)
+            if intentos is None or len(intentos) < maximo:
+                return None
+            self._claves.move_to_end(clave)
+            return intentos[-maximo]
+
+    def agregar(self, clave, ahora, maximo, ventana):
+        with self._lock:
+            intentos = self._claves.get(clave)
+            if intentos is None or intentos.maxlen != maximo:
+                intentos = self._claves[clave] = deque(intentos or (), maxlen=maximo)
+            intentos.append(ahora)
+            self._claves.move_to_end(clave)
+            while len(self._claves) > self.max_claves:
+                self._claves.popitem(last=False)
+                self.desalojadas += 1
+
+    def borrar(self, clave):
+        with self._lock:
+            self._claves.pop(clave, None)
+
+    def metricas(self):
+        with self._lock:
+            return {'backend': 'memoria', 'claves': len(self._claves),
+                    'max_claves': self.max_claves, 'desalojadas': self.desalojadas}
+
+
+class BackendRedis:
+    """Backend compartido: un sorted set por clave con los últimos `maximo` intentos"""
+
+    def __init__(self, url, prefijo='rl'):
+        import redis  # dependencia opcional, solo si se configura
+        self._redis = redis.Redis.from_url(url)
+        self.prefijo = prefijo
+        self._contador = itertools.count()
+
+    def _clave(self, clave):
+        return f'{self.prefijo}:{clave}'
+
+    def mas_antiguo(self, clave, maximo):
+        fila = self._redis.zrange(self._clave(clave), -maximo, -maximo, withscores=True)
+        if not fila or self._redis.zcard(self._clave(clave)) < maximo:
+            return None
+        return fila[0][1]
+
+    def agregar(self, clave, ahora, maximo, ventana):
+        k = self._clave(clave)
+        miembro = f'{ahora:.6f}:{os.getpid()}:{next(self._contador)}'
+        pipe = self._redis.pipeline()
+        pipe.zadd(k, {miembro: ahora})
+        pipe.zremrangebyrank(k, 0, -(maximo + 1))  # memoria fija: solo los últimos `maximo`
+        pipe.expire(k, int(ventana) + 1)            # las claves inactivas desaparecen solas
+        pipe.execute()
+
+    def borrar(self, clave):
+        self._redis.delete(self._clave(clave))
+
+    def metricas(self):
+        return {'backend': 'redis'}
+
+
+def backend_por_defecto():
+    """Redis si RATE_LIMIT_REDIS_URL está definida; si no, memoria del proceso"""
+    url = os.environ.get('RATE_LIMIT_REDIS_URL')
+    if url:
+        try:
+            backend = BackendRedis(url)
+            print("🛡️ Rate limiting compartido en Redis")
+            return backend
+        except Exception as e:
+            print(f"⚠️ No se pudo usar Redis para rate limiting ({e}); usando memoria local")
+    return BackendMemoria(int(os.environ.get('RATE_LIMIT_MAX_CLAVES', 10000)))
+
+
+class Limitador:
+    """Máximo `maximo` intentos por clave en cualquier ventana de `ventana` segundos"""
+
+    def __init__(self, nombre, maximo, ventana, backend=None):
+        self.nombre = nombre
+        self.maximo = maximo
+        self.ventana = ventana
+        self.backend = backend or backend_por_defecto()
+        self.bloqueados = 0
+
+    def _clave(self, clave):
+        return f'{self.nombre}:{clave}'
+
+    def reintentar_en(self, clave):
+        """Segundos hasta el próximo intento permitido (0 si ya se puede)"""
+        antiguo = self.backend.mas_antiguo(self._clave(clave), self.maximo)
+        if antiguo is None:
+            return 0
+        return max(0.0, antiguo + self.ventana - time.time())
+
+    def permitido(self, clave):
+        """Consulta sin registrar un intento"""
+        if self.reintentar_en(clave) > 0:
+            self.bloqueados += 1
+            return False
+        return True
+
+    def registrar(self, clave):
+        self.backend.agregar(self._clave(clave), time.time(), self.maximo, self.ventana)
+
+    def intentar(self, clave):
+        """Consulta y, si se permite, registra el intento"""
+        if not self.permitido(clave):
+            return False
+        self.registrar(clave)
+        return True
+
+    def reiniciar(self, clave):
+        self.backend.borrar(self._clave(clave))
+
+    def metricas(self):
+        return {'maximo': self.maximo, 'ventana_s': self.ventana,
+                'bloqueados': self.bloqueados, **self.backend.metricas()}
+
+
+def respuesta_limite(mensaje, segundos):
+    """429 con Retry-After: JSON para fetch/API, texto para un formulario HTML"""
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        respuesta = jsonify({'error': mensaje, 'reintentar_en': segundos})
+    else:
+        respuesta = make_response(mensaje)
+        respuesta.mimetype = 'text/plain'
+    respuesta.status_code = 429
+    respuesta.headers['Retry-After'] = str(segundos)
+    return respuesta
+
+
+def limitar(limitador, clave=ip_cliente, metodos=('POST',), mensaje='Demasiadas solicitudes, intenta de nuevo en un momento'):
+    """Decorador de rutas: responde 429 cuando la clave excede el límite"""
+    def decorador(f):
+        @wraps(f)
+        def envoltura(*args, **kwargs):
+            if request.method in metodos:
+                k = clave()
+                if not limitador.intentar(k):
+                    return respuesta_limite(mensaje, int(limitador.reintentar_en(k)) + 1)
+            return f(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+# evento -> (fichas de la cubeta, segundos en recargarla completa)
+PRESUPUESTOS_SOCKET = {
+    'registrar_cliente': (6, 60),
+    'registrar_trabajador': (6, 60),
+    'registrar_cocina': (6, 60),
+    'heartbeat': (8, 60),  # la página manda uno cada 15 s
+}
+
+
+def leer_presupuestos(texto, base=PRESUPUESTOS_SOCKET):
+    """'heartbeat:8/60,registrar_cliente:6/60' -> {evento: (fichas, segundos)} sobre `base`"""
+    presupuestos = dict(base)
+    for parte in (texto or '').split(','):
+        evento, _, valor = parte.partition(':')
+        fichas, _, segundos = valor.partition('/')
+        if evento.strip() and fichas.strip().isdigit() and segundos.strip().isdigit():
+            presupuestos[evento.strip()] = (int(fichas), int(segundos))
+    return presupuestos
+
+
+def identidad_sesion():
+    """Quién está detrás del socket según la sesión firmada ('cliente:5', 'trabajador:2') o None"""
+    if session.get('cliente_id') is not None:
+        return f"cliente:{session['cliente_id']}"
+    if session.get('trabajador_id') is not None:
+        return f"trabajador:{session['trabajador_id']}"
+    return None
+
+
+class LimitadorSocket:
+    """Cubetas de fichas por (evento, SID) y por (evento, identidad), en memoria del proceso"""
+
+    def __init__(self, presupuestos=None, max_claves=10000, max_infractores=20):
+        self.presupuestos = dict(presupuestos or PRESUPUESTOS_SOCKET)
+        self.max_claves = max_claves
+        self.max_infractores = max_infractores
+        self._cubetas = OrderedDict()     # (evento, clave) -> [fichas, instante]
+        self._infractores = OrderedDict()  # clave -> {evento: descartados}
+        self._lock = threading.Lock()
+        self.permitidos = {}
+        self.descartados = {}
+
+    def _cubeta(self, evento, clave, ahora):
+        fichas, segundos = self.presupuestos[evento]
+        cubeta = self._cubetas.get((evento, clave))
+        if cubeta is None:
+            cubeta = self._cubetas[(evento, clave)] = [float(fichas), ahora]
+            while len(self._cubetas) > self.max_claves:
+                self._cubetas.popitem(last=False)
+        else:
+            cubeta[0] = min(float(fichas), cubeta[0] + (ahora - cubeta[1]) * fichas / segundos)
+            cubeta[1] = ahora
+            self._cubetas.move_to_end((evento, clave))
+        return cubeta
+
+    def intentar(self, evento, sid, identidad=None):
+        """Consume una ficha de cada cubeta si todas tienen; si no, retorna los
+        segundos a esperar (0 = permitido). Eventos sin presupuesto no se limitan."""
+        if evento not in self.presupuestos:
+            return 0
+        fichas, segundos = self.presupuestos[evento]
+        claves = [f'sid:{sid}'] + ([identidad] if identidad else [])
+        ahora = time.monotonic()
+        with self._lock:
+            cubetas = [self._cubeta(evento, clave, ahora) for clave in claves]
+            faltante = max(1.0 - cubeta[0] for cubeta in cubetas)
+            if faltante <= 0:
+                for cubeta in cubetas:
+                    cubeta[0] -= 1.0
+                self.permitidos[evento] = self.permitidos.get(evento, 0) + 1
+                return 0
+            self.descartados[evento] = self.descartados.get(evento, 0) + 1
+            infractor = identidad or f'sid:{sid}'
+            cuenta = self._infractores.pop(infractor, {})
+            cuenta[evento] = cuenta.get(evento, 0) + 1
+            self._infractores[infractor] = cuenta  # el más reciente queda al final
+            while len(self._infractores) > self.max_infractores:
+                self._infractores.popitem(last=False)
+            return faltante * segundos / fichas
+
+    def olvidar(self, sid):
+        """Borra las cubetas de un SID desconectado (las de identidad siguen)"""
+        clave = f'sid:{sid}'
+        with self._lock:
+            for evento in self.presupuestos:
+                self._cubetas.pop((evento, clave), None)
+
+    def metricas(self):
+        with self._lock:
+            return {
+                'presupuestos': {evento: {'fichas': f, 'segundos': s} for evento, (f, s) in self.presupuestos.items()},
+                'permitidos': dict(self.permitidos),
+                'descartados': dict(self.descartados),
+                'cubetas': len(self._cubetas),
+                'infractores': [{'clave': clave, 'descartados': dict(cuenta)}
+                                for clave, cuenta in reversed(self._infractores.items())],
+            }
+
+
+def limitar_socket(limitador, evento, identidad=identidad_sesion):
+    """Decorador de handlers de Socket.IO: si el evento excede su presupuesto no se
+    ejecuta y el socket recibe 'limite_excedido' con los segundos para reintentar"""
+    def decorador(f):
+        @wraps(f)
+        def envoltura(*args, **kwargs):
+            from flask_socketio import emit
+            espera = limitador.intentar(evento, request.sid, identidad())
+            if espera:
+                emit('limite_excedido', {'evento': evento, 'reintentar_en': round(espera, 1)})
+                return False
+            return f(*args, **kwargs)
+        return envoltura
+    return decorador
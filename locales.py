@@ -0,0 +1,82 @@
+"""
+Locales (sucursales): varias sedes del restaurante en un mismo despliegue.
+
+Cada fila de Cliente, Mesa, UsoMesa, PushSubscription, Pedidos y EventoCola
+lleva el slug de su local en la columna `local`, y las consultas de la cola,
+las mesas, la cocina y el historial filtran por él con índices que empiezan
+por `local`: el tráfico de una sede nunca recorre las filas de otra. Las
+salas de Socket.IO llevan el local como prefijo ('centro:workers', ...), así
+que los broadcasts tampoco cruzan de sede.
+
+Configuración (variable LOCALES): los locales que atiende ESTE proceso con su
+cantidad de mesas, p. ej. "principal:26,centro:18". Sin definir, un solo
+local 'principal' con 26 mesas (lo de siempre). Para repartir locales entre
+procesos se le da a cada uno su lista y se enruta por local en el
+balanceador; un proceso responde 404 a los locales que no atiende.
+
+Local de la petición: ?local=<slug> (los QR lo llevan), después el que quedó
+en la sesión y, si no hay, el primero configurado.
+"""
+import os
+
+from flask import abort, current_app, g, has_app_context, has_request_context, request, session
+
+LOCAL_DEFECTO = 'principal'  # Mismo valor que el server_default de las columnas
+MESAS_DEFECTO = 26
+
+
+def leer_configuracion(texto):
+    """'principal:26,centro:18' -> {'principal': 26, 'centro': 18}"""
+    locales = {}
+    for parte in (texto or '').split(','):
+        slug, _, mesas = parte.partition(':')
+        slug = slug.strip().lower()
+        if slug:
+            mesas = mesas.strip()
+            locales[slug] = int(mesas) if mesas.isdigit() else MESAS_DEFECTO
+    return locales or {LOCAL_DEFECTO: MESAS_DEFECTO}
+
+
+def init_app(app):
+    app.config.setdefault('LOCALES', leer_configuracion(os.environ.get('LOCALES')))
+    app.before_request(_resolver)
+    app.jinja_env.globals['local_actual'] = actual
+    print(f"🏬 Locales atendidos: {', '.join(app.config['LOCALES'])}")
+
+
+def configurados():
+    """{slug: cantidad de mesas} de los locales de este proceso"""
+    return current_app.config['LOCALES']
+
+
+def principal():
+    if not has_app_context():
+        return LOCAL_DEFECTO
+    return next(iter(configurados()))
+
+
+def _resolver():
+    pedido = request.args.get('local')
+    if pedido:
+        if pedido not in configurados():
+            abort(404, description=f"Local no disponible en este servidor: {pedido}")
+        session['local'] = pedido
+        g.local = pedido
+
+
+def actual():
+    """Slug del local de la petición o evento de Socket.IO (fuera de ellos, el principal)"""
+    if not has_request_context():
+        return principal()
+    local = g.get('local')
+    if local is None:
+        local = session.get('local')
+        if local not in configurados():
+            local = principal()
+        g.local = local
+    return local
+
+
+def sala(local, nombre):
+    """Sala de Socket.IO de un local: sala('centro', 'workers') -> 'centro:workers'"""
+    return f'{local}:{nombre}'
@@ -0,0 +1,411 @@
+"""
+Máquina de estados de las mesas.
+
+Concentra las transiciones (ocupar, asignar, confirmar llegada, liberar,
+reservar, cancelar reserva) que antes estaban copiadas en cada ruta. Las
+operaciones de grupo se hacen con UPDATE por conjunto (WHERE cliente_id = :id)
+e inserciones masivas de UsoMesa, usando una sola marca de tiempo por acción.
+
+Las funciones NO hacen commit: la ruta que las llama decide cuándo confirmar
+la transacción (y hace rollback si algo falla). Tampoco emiten eventos de
+Socket.IO; el resultado indica qué clientes fueron asignados para que la ruta
+notifique. Cada transición queda en el historial (eventos.py) al hacer commit.
+
+Todo ocurre dentro del local de la petición (locales.actual()): una mesa o un
+cliente de otra sede se tratan como inexistentes, y la fila que se ofrece al
+liberar una mesa es la del local de esa mesa.
+"""
+from sqlalchemy import insert, update
+
+import eventos
+import locales
+from models import db, Cliente, Mesa, UsoMesa
+from tiempo import ahora_utc, segundos_entre
+
+# Estados derivados de las columnas is_occupied / llego_comensal / reservada
+LIBRE = 'libre'
+RESERVADA = 'reservada'
+ASIGNADA = 'asignada'    # ocupada, esperando que llegue el comensal
+OCUPADA = 'ocupada'      # ocupada con el comensal presente
+
+# Transiciones permitidas: acción -> estados de origen válidos
+TRANSICIONES = {
+    'ocupar': {LIBRE, RESERVADA},
+    'asignar': {LIBRE, RESERVADA},
+    'confirmar_llegada': {ASIGNADA, OCUPADA},
+    'liberar': {ASIGNADA, OCUPADA},
+    'desocupar': {ASIGNADA, OCUPADA},
+    'reservar': {LIBRE, ASIGNADA, OCUPADA},
+    'cancelar_reserva': {RESERVADA},
+    'cambiar_capacidad': {LIBRE, RESERVADA},
+}
+
+CAPACIDAD_MINIMA = 1
+CAPACIDAD_MAXIMA = 20
+
+
+class TransicionInvalida(Exception):
+    """La mesa no existe o su estado actual no permite la acción pedida"""
+
+    def __init__(self, mensaje, status=None):
+        super().__init__(mensaje)
+        self.mensaje = mensaje
+        self.status = status
+
+
+def estado_mesa(mesa):
+    """Estado lógico de una mesa a partir de sus columnas"""
+    if mesa.is_occupied:
+        return OCUPADA if mesa.llego_comensal else ASIGNADA
+    return RESERVADA if mesa.reservada else LIBRE
+
+
+def del_local(fila):
+    """La fila (Mesa, Cliente o Pedidos) si pertenece al local actual; si no, None"""
+    if fila is None or fila.local != locales.actual():
+        return None
+    return fila
+
+
+def _mesa_para(accion, mesa_id, error, status=None):
+    """Obtiene la mesa del local y valida que la acción sea posible desde su estado"""
+    mesa = del_local(db.session.get(Mesa, mesa_id))
+    if not mesa or estado_mesa(mesa) not in TRANSICIONES[accion]:
+        raise TransicionInvalida(error, status)
+    return mesa
+
+
+def buscar_siguiente_cliente_en_orden(local=None):
+    """Busca al PRIMER cliente en la fila del local (sin saltar a nadie por capacidad)"""
+    try:
+        return (
+            Cliente.query
+            .filter_by(local=local or locales.actual(), assigned_table=None)
+            .order_by(Cliente.joined_at)
+            .first()
+        )
+    except Exception as e:
+        print(f"Error buscando primer cliente: {e}")
+        return None
+
+
+def primeros_en_cola(limite, local=None):
+    """Los primeros `limite` clientes en espera del local, en orden de llegada (una sola consulta)"""
+    if limite <= 0:
+        return []
+    return (
+        Cliente.query
+        .filter_by(local=local or locales.actual(), assigned_table=None)
+        .order_by(Cliente.joined_at)
+        .limit(limite)
+        .all()
+    )
+
+
+def puede_asignar_cliente_a_mesa(cliente, mesa):
+    """Verifica si un cliente específico puede ser asignado a una mesa específica"""
+    if not cliente or not mesa or not cliente.cantidad_comensales:
+        return False
+    return cliente.cantidad_comensales <= mesa.capacidad
+
+
+def _registrar_usos(filas, ahora, local):
+    """Inserta en bloque un UsoMesa por cada (mesa_id, start_time) liberada"""
+    usos = []
+    for mesa_id, start_time in filas:
+        duracion = segundos_entre(start_time, ahora) if start_time else 0
+        usos.append({'mesa_id': mesa_id, 'duracion': int(duracion), 'timestamp': ahora, 'local': local})
+    if usos:
+        db.session.execute(insert(UsoMesa), usos)
+
+
+def _vaciar(condicion, **extra):
+    """UPDATE por conjunto que deja libres las mesas que cumplen la condición"""
+    valores = dict(is_occupied=False, start_time=None, cliente_id=None,
+                   llego_comensal=False, orden=None, orden_personas=None)
+    valores.update(extra)
+    db.session.execute(update(Mesa).where(condicion).values(**valores))
+
+
+def _asignar(cliente, mesas_ids, ahora):
+    """Asigna el cliente a las mesas dadas; la primera es la principal"""
+    principal = mesas_ids[0]
+    cliente.assigned_table = principal
+    cliente.atendido_at = ahora
+    cliente.mesa_asignada_at = ahora  # Timestamp para cronómetro
+    db.session.execute(
+        update(Mesa)
+        .where(Mesa.id.in_(mesas_ids))
+        .values(is_occupied=True, reservada=False, start_time=ahora,
+                cliente_id=cliente.id, llego_comensal=False)
+    )
+    # La orden previa ya está formateada en el cliente: solo se copia
+    if cliente.orden_previa_texto:
+        db.session.execute(
+            update(Mesa).where(Mesa.id == principal)
+            .values(orden=cliente.orden_previa_texto, orden_personas=cliente.orden_previa_personas)
+        )
+    eventos.registrar(eventos.ASIGNACION, cliente_id=cliente.id, mesa_id=principal, mesas=list(mesas_ids))
+
+
+def _reasignar(libres, ahora, local, reservar_si_no_cabe=True):
+    """Ofrece cada mesa liberada al primer cliente de la fila de su local.
+
+    `libres` es una lista de (mesa_id, capacidad). Si el primero cabe se le
+    asigna la mesa; si no cabe, la mesa queda reservada para asignación manual
+    (o libre, si reservar_si_no_cabe es False). Retorna (asignaciones, reservadas).
+    """
+    cola = primeros_en_cola(len(libres), local)
+    asignaciones = []
+    reservadas = []
+    for mesa_id, capacidad in libres:
+        siguiente = cola[0] if cola else None
+        if siguiente and siguiente.cantidad_comensales and siguiente.cantidad_comensales <= capacidad:
+            _asignar(siguiente, [mesa_id], ahora)
+            cola.pop(0)
+            asignaciones.append((mesa_id, siguiente))
+            print(f"Mesa {mesa_id} (capacidad {capacidad}) reasignada automáticamente a primer cliente {siguiente.id} ({siguiente.cantidad_comensales} comensales)")
+        elif siguiente and reservar_si_no_cabe:
+            reservadas.append(mesa_id)
+            print(f"Mesa {mesa_id} (capacidad {capacidad}) - primer cliente {siguiente.id} ({siguiente.cantidad_comensales} comensales) no cabe. Mesa queda RESERVADA para asignación manual")
+        else:
+            print(f"Mesa {mesa_id} (capacidad {capacidad}) - sin cliente asignable. Mesa queda disponible")
+    if reservadas:
+        db.session.execute(update(Mesa).where(Mesa.id.in_(reservadas)).values(reservada=True))
+        eventos.registrar(eventos.RESERVA, mesa_id=reservadas[0], mesas=reservadas, reservada=True)
+    return asignaciones, reservadas
+
+
+# ----------------------------------------------------------------------------
+# Transiciones públicas
+# ----------------------------------------------------------------------------
+
+def ocupar(mesa_id):
+    """Ocupación manual de una mesa libre: el comensal ya está presente"""
+    mesa = _mesa_para('ocupar', mesa_id, "Mesa no encontrada o ya ocupada")
+    mesa.is_occupied = True
+    mesa.start_time = ahora_utc()
+    mesa.cliente_id = None
+    mesa.llego_comensal = True
+    eventos.registrar(eventos.ASIGNACION, mesa_id=mesa.id, mesas=[mesa.id], llego_comensal=True)
+    return {'mesa': mesa.id}
+
+
+def ocupar_grupo_manual(mesa_principal_id, adicionales):
+    """Ocupa varias mesas libres como un grupo manual (sin cliente en cola).
+
+    Crea un cliente 'manual' efímero para linkear las mesas bajo un mismo
+    cliente_id, de modo que liberar y confirmar llegada propaguen en el grupo.
+    """
+    local = locales.actual()
+    todas_ids = [mesa_principal_id] + [mid for mid in adicionales if mid != mesa_principal_id]
+    filas = (
+        db.session.query(Mesa.id, Mesa.capacidad, Mesa.is_occupied, Mesa.reservada)
+        .filter(Mesa.local == local, Mesa.id.in_(todas_ids))
+        .with_for_update()
+        .all()
+    )
+    encontradas = {f.id for f in filas}
+    faltantes = [mid for mid in todas_ids if mid not in encontradas]
+    if faltantes:
+        raise TransicionInvalida(f"Mesas inexistentes: {faltantes}", 404)
+    no_libres = [f.id for f in filas if f.is_occupied or f.reservada]
+    if no_libres:
+        raise TransicionInvalida(f"Mesas no disponibles: {no_libres}", 409)
+
+    ahora = ahora_utc()
+    cliente_manual = Cliente(
+        nombre='Manual',
+        telefono='manual',
+        cantidad_comensales=sum(f.capacidad for f in filas),
+        joined_at=ahora,
+        assigned_table=mesa_principal_id,  # ya asignado: no aparece en la cola
+        atendido_at=ahora,
+        mesa_asignada_at=ahora,
+        sid=None,
+        local=local
+    )
+    db.session.add(cliente_manual)
+    db.session.flush()  # para obtener cliente_manual.id
+
+    db.session.execute(
+        update(Mesa)
+        .where(Mesa.id.in_(todas_ids))
+        .values(is_occupied=True, start_time=ahora, cliente_id=cliente_manual.id,
+                llego_comensal=True, reservada=False)
+    )
+    eventos.registrar(eventos.ASIGNACION, cliente_id=cliente_manual.id, mesa_id=mesa_principal_id,
+                      mesas=todas_ids, llego_comensal=True)
+    return {'mesas': todas_ids, 'cliente_manual_id': cliente_manual.id}
+
+
+def asignar_cliente_a_mesas(cliente_id, mesas_ids):
+    """Asigna un cliente en espera a mesas elegidas por el mesero"""
+    cliente = del_local(db.session.get(Cliente, cliente_id))
+    if not cliente or cliente.assigned_table is not None:
+        raise TransicionInvalida("Cliente no encontrado o ya asignado")
+
+    filas = (
+        db.session.query(Mesa.id, Mesa.capacidad, Mesa.is_occupied)
+        .filter(Mesa.local == cliente.local, Mesa.id.in_(mesas_ids))
+        .all()
+    )
+    if len(filas) != len(mesas_ids):
+        raise TransicionInvalida("Algunas mesas no fueron encontradas")
+    por_id = {f.id: f for f in filas}
+    for mesa_id in mesas_ids:
+        if por_id[mesa_id].is_occupied:
+            raise TransicionInvalida(f"Mesa {mesa_id} ya está ocupada")
+
+    capacidad_total = sum(f.capacidad for f in filas)
+    if capacidad_total < cliente.cantidad_comensales:
+        raise TransicionInvalida(
+            f"Capacidad insuficiente. Necesitas {cliente.cantidad_comensales} personas, tienes {capacidad_total}"
+        )
+
+    _asignar(cliente, list(mesas_ids), ahora_utc())
+    return {'cliente': cliente, 'mesas': list(mesas_ids)}
+
+
+def asignar_a_reservadas(cliente_id):
+    """Asigna un cliente a todas las mesas reservadas libres de su local"""
+    cliente = del_local(db.session.get(Cliente, cliente_id))
+    if not cliente or cliente.assigned_table is not None:
+        raise TransicionInvalida("Cliente no encontrado o ya asignado")
+
+    filas = (
+        db.session.query(Mesa.id, Mesa.capacidad)
+        .filter_by(local=cliente.local, reservada=True, is_occupied=False)
+        .order_by(Mesa.id)
+        .all()
+    )
+    if not filas:
+        raise TransicionInvalida("No hay mesas reservadas disponibles")
+    if sum(f.capacidad for f in filas) < cliente.cantidad_comensales:
+        raise TransicionInvalida("Las mesas reservadas no tienen capacidad suficiente")
+
+    mesas_ids = [f.id for f in filas]
+    _asignar(cliente, mesas_ids, ahora_utc())
+    return {'cliente': cliente, 'mesas': mesas_ids}
+
+
+def confirmar_llegada(mesa_id):
+    """Marca la llegada del comensal en todas las mesas de su grupo"""
+    mesa = del_local(db.session.get(Mesa, mesa_id))
+    if not mesa:
+        raise TransicionInvalida("Mesa no encontrada")
+    if estado_mesa(mesa) not in TRANSICIONES['confirmar_llegada']:
+        raise TransicionInvalida("Mesa no está ocupada")
+
+    if mesa.cliente_id:
+        condicion = (Mesa.cliente_id == mesa.cliente_id) & Mesa.is_occupied.is_(True)
+    else:
+        # Mesa ocupada manualmente sin cliente asignado: marcar solo esta mesa
+        condicion = Mesa.id == mesa.id
+    condicion = condicion & Mesa.llego_comensal.isnot(True)
+
+    actualizadas = [fila.id for fila in db.session.query(Mesa.id).filter(condicion).all()]
+    if actualizadas:
+        db.session.execute(update(Mesa).where(Mesa.id.in_(actualizadas)).values(llego_comensal=True))
+        eventos.registrar(eventos.LLEGADA, cliente_id=mesa.cliente_id, mesa_id=mesa.id, mesas=actualizadas)
+    return {'mesas': actualizadas, 'cliente_id': mesa.cliente_id}
+
+
+def liberar(mesa_id):
+    """Libera la mesa y todas las de su grupo, y ofrece cada una a la fila.
+
+    Si la mesa fue ocupada manualmente (cliente_id None) solo se libera esa
+    mesa; nunca todas las que tengan cliente_id NULL.
+    """
+    mesa = _mesa_para('liberar', mesa_id, "Mesa no encontrada o no está ocupada")
+    cliente_id = mesa.cliente_id
+    ahora = ahora_utc()
+
+    if cliente_id is None:
+        condicion = Mesa.id == mesa.id
+    else:
+        condicion = (Mesa.cliente_id == cliente_id) & Mesa.is_occupied.is_(True)
+    filas = (
+        db.session.query(Mesa.id, Mesa.start_time, Mesa.capacidad, Mesa.reservada)
+        .filter(condicion)
+        .order_by(Mesa.id)
+        .all()
+    )
+    print(f"Liberando mesa {mesa_id} (cliente {cliente_id}). Total mesas del grupo: {len(filas)}")
+
+    _registrar_usos([(f.id, f.start_time) for f in filas], ahora, mesa.local)
+    _vaciar(Mesa.id.in_([f.id for f in filas]))
+    eventos.registrar(eventos.LIBERACION, cliente_id=cliente_id, mesa_id=mesa.id, mesas=[f.id for f in filas])
+
+    # Solo se reasignan las mesas que no estaban reservadas
+    libres = [(f.id, f.capacidad) for f in filas if not f.reservada]
+    asignaciones, reservadas = _reasignar(libres, ahora, mesa.local)
+    return {
+        'cliente_id': cliente_id,
+        'mesas': [f.id for f in filas],
+        'asignaciones': asignaciones,
+        'reservadas': reservadas,
+    }
+
+
+def desocupar(mesa_id, reservar=False):
+    """Desocupa una sola mesa.
+
+    Con reservar=True queda reservada (evita la auto-asignación). Si no, se
+    cancela cualquier reserva y, si el primer cliente de la fila cabe, se le
+    asigna; si no cabe la mesa queda libre.
+    """
+    mesa = _mesa_para('desocupar', mesa_id, "Mesa no encontrada o no está ocupada", 400)
+    cliente_id = mesa.cliente_id
+    ahora = ahora_utc()
+    _registrar_usos([(mesa.id, mesa.start_time)], ahora, mesa.local)
+    _vaciar(Mesa.id == mesa.id, reservada=bool(reservar))
+    eventos.registrar(eventos.LIBERACION, cliente_id=cliente_id, mesa_id=mesa.id, mesas=[mesa.id],
+                      reservada=bool(reservar))
+
+    asignaciones = []
+    if not reservar:
+        asignaciones, _ = _reasignar([(mesa.id, mesa.capacidad)], ahora, mesa.local, reservar_si_no_cabe=False)
+    return {'mesas': [mesa.id], 'asignaciones': asignaciones}
+
+
+def reservar(mesa_id):
+    """Marca una mesa como reservada"""
+    mesa = _mesa_para('reservar', mesa_id, "Mesa no encontrada o ya reservada")
+    if mesa.reservada:
+        # Una mesa ocupada puede estar además reservada (estado reservada-ocupada)
+        raise TransicionInvalida("Mesa no encontrada o ya reservada")
+    mesa.reservada = True
+    eventos.registrar(eventos.RESERVA, mesa_id=mesa.id, mesas=[mesa.id], reservada=True)
+    return {'mesa': mesa.id}
+
+
+def cancelar_reserva(mesa_id):
+    """Cancela la reserva y ofrece la mesa al primer cliente de la fila.
+
+    Si el primero no cabe, la mesa vuelve a quedar reservada.
+    """
+    mesa = _mesa_para('cancelar_reserva', mesa_id, "Mesa no encontrada o no está reservada")
+    mesa.reservada = False
+    eventos.registrar(eventos.RESERVA, mesa_id=mesa.id, mesas=[mesa.id], reservada=False)
+    asignaciones, reservadas = _reasignar([(mesa.id, mesa.capacidad)], ahora_utc(), mesa.local)
+    return {'mesas': [mesa.id], 'asignaciones': asignaciones, 'reservadas': reservadas}
+
+
+def cambiar_capacidad(mesa_id, capacidad):
+    """Cambia la capacidad de una mesa que no está ocupada"""
+    try:
+        capacidad = int(capacidad)
+    except (TypeError, ValueError):
+        raise TransicionInvalida("Capacidad inválida", 400)
+    if not CAPACIDAD_MINIMA <= capacidad <= CAPACIDAD_MAXIMA:
+        raise TransicionInvalida(
+            f"La capacidad debe estar entre {CAPACIDAD_MINIMA} y {CAPACIDAD_MAXIMA} personas", 400)
+    mesa = del_local(db.session.get(Mesa, mesa_id))
+    if not mesa:
+        raise TransicionInvalida("Mesa no encontrada", 404)
+    if estado_mesa(mesa) not in TRANSICIONES['cambiar_capacidad']:
+        raise TransicionInvalida("No se puede cambiar la capacidad de una mesa ocupada", 409)
+    mesa.capacidad = capacidad
+    eventos.registrar(eventos.CAPACIDAD, mesa_id=mesa.id, mesas=[mesa.id], capacidad=capacidad)
+    return {'mesa': mesa.id, 'capacidad': capacidad}
@@ -0,0 +1,52 @@
+"""Locales: columna local en cola, mesas, usos, push, pedidos y eventos con índices por local
+
+Revision ID: a7d4e9c2f1b8
+Revises: f3c8d1a5b2e9
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d4e9c2f1b8'
+down_revision = 'f3c8d1a5b2e9'
+branch_labels = None
+depends_on = None
+
+# Las filas existentes quedan en el local por defecto (server_default)
+LOCAL_DEFECTO = 'principal'
+
+# tabla -> [(nombre del índice, columnas)]
+INDICES = {
+    'cliente': [('idx_cliente_local_cola', ['local', 'assigned_table', 'joined_at']),
+                ('idx_cliente_local_atendido', ['local', 'atendido_at'])],
+    'mesa': [('idx_mesa_local_estado', ['local', 'reservada', 'is_occupied'])],
+    'uso_mesa': [('idx_uso_mesa_local_fecha', ['local', 'timestamp'])],
+    'push_subscription': [('idx_push_local_activa', ['local', 'is_active'])],
+    'pedidos': [('idx_pedidos_local_estacion_estado', ['local', 'estacion', 'estado', 'timestamp'])],
+    'evento_cola': [('idx_evento_local_id', ['local', 'id'])],
+}
+
+
+def upgrade():
+    for tabla, indices in INDICES.items():
+        with op.batch_alter_table(tabla, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('local', sa.String(length=40), nullable=False,
+                                          server_default=LOCAL_DEFECTO))
+            if tabla == 'pedidos':
+                # Reemplazado por el índice que empieza por local
+                batch_op.drop_index('idx_pedidos_estacion_estado')
+            for nombre, columnas in indices:
+                batch_op.create_index(nombre, columnas, unique=False)
+
+
+def downgrade():
+    for tabla, indices in INDICES.items():
+        with op.batch_alter_table(tabla, schema=None) as batch_op:
+            for nombre, _ in indices:
+                batch_op.drop_index(nombre)
+            if tabla == 'pedidos':
+                batch_op.create_index('idx_pedidos_estacion_estado', ['estacion', 'estado', 'timestamp'], unique=False)
+            batch_op.drop_column('local')
@@ -0,0 +1,66 @@
+"""Suscripciones push: endpoint_hash con índice único en vez de indexar el endpoint
+
+Agrega push_subscription.endpoint_hash (SHA-256 del endpoint, 64
+caracteres), lo rellena, deja una sola fila por endpoint (la más nueva),
+crea el índice único y borra idx_endpoint, que indexaba el texto completo.
+
+Revision ID: b4e1c7d9a2f5
+Revises: a7d4e9c2f1b8
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e1c7d9a2f5'
+down_revision = 'a7d4e9c2f1b8'
+branch_labels = None
+depends_on = None
+
+
+def hash_endpoint(endpoint):
+    """Copia congelada de models.hash_endpoint en esta revisión"""
+    return hashlib.sha256(endpoint.encode('utf-8')).hexdigest()
+
+
+def upgrade():
+    with op.batch_alter_table('push_subscription', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('endpoint_hash', sa.String(length=64), nullable=True))
+
+    bind = op.get_bind()
+    push = sa.table(
+        'push_subscription',
+        sa.column('id', sa.Integer),
+        sa.column('endpoint', sa.Text),
+        sa.column('endpoint_hash', sa.String),
+    )
+    vistos = set()
+    repetidas = []
+    # De la más nueva a la más vieja: la primera de cada endpoint se queda
+    for suscripcion_id, endpoint in bind.execute(
+        sa.select(push.c.id, push.c.endpoint).order_by(push.c.id.desc())
+    ).all():
+        valor = hash_endpoint(endpoint)
+        if valor in vistos:
+            repetidas.append(suscripcion_id)
+            continue
+        vistos.add(valor)
+        bind.execute(push.update().where(push.c.id == suscripcion_id).values(endpoint_hash=valor))
+    if repetidas:
+        bind.execute(push.delete().where(push.c.id.in_(repetidas)))
+
+    with op.batch_alter_table('push_subscription', schema=None) as batch_op:
+        batch_op.alter_column('endpoint_hash', existing_type=sa.String(length=64), nullable=False)
+        batch_op.drop_index('idx_endpoint')
+        batch_op.create_index('uq_push_endpoint_hash', ['endpoint_hash'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('push_subscription', schema=None) as batch_op:
+        batch_op.drop_index('uq_push_endpoint_hash')
+        batch_op.create_index('idx_endpoint', ['endpoint'], unique=False)
+        batch_op.drop_column('endpoint_hash')
@@ -0,0 +1,39 @@
+"""Agregar tabla evento_cola (historial append-only de cola y mesas)
+
+Revision ID: c41e7a9d2b10
+Revises: b348d6079c10
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41e7a9d2b10'
+down_revision = 'b348d6079c10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('evento_cola',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('tipo', sa.String(length=20), nullable=False),
+    sa.Column('cliente_id', sa.Integer(), nullable=True),
+    sa.Column('mesa_id', sa.Integer(), nullable=True),
+    sa.Column('datos', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('evento_cola', schema=None) as batch_op:
+        batch_op.create_index('idx_evento_tipo_fecha', ['tipo', 'created_at'], unique=False)
+        batch_op.create_index('idx_evento_cliente', ['cliente_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('evento_cola', schema=None) as batch_op:
+        batch_op.drop_index('idx_evento_cliente')
+        batch_op.drop_index('idx_evento_tipo_fecha')
+
+    op.drop_table('evento_cola')
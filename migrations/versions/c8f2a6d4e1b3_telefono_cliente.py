@@ -0,0 +1,74 @@
+"""Clientes por teléfono: teléfono normalizado, índice y un solo turno en espera por teléfono
+
+Normaliza cliente.telefono (+569XXXXXXXX), crea idx_cliente_local_telefono y
+el índice único parcial uq_cliente_telefono_en_cola (local, telefono) WHERE
+assigned_table IS NULL. Si un teléfono ya tenía varios turnos en espera, el
+más antiguo conserva el teléfono y a los demás se les deja en NULL (siguen en
+la fila, el personal los ve y puede cancelarlos).
+
+Revision ID: c8f2a6d4e1b3
+Revises: b4e1c7d9a2f5
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8f2a6d4e1b3'
+down_revision = 'b4e1c7d9a2f5'
+branch_labels = None
+depends_on = None
+
+EN_COLA = sa.text('assigned_table IS NULL')
+
+
+def normalizar_telefono(texto):
+    """Copia congelada de models.normalizar_telefono en esta revisión"""
+    if not texto:
+        return None
+    digitos = re.sub(r'\D', '', str(texto))
+    if len(digitos) == 9 and digitos.startswith('9'):
+        digitos = '56' + digitos
+    if len(digitos) == 11 and digitos.startswith('569'):
+        return '+' + digitos
+    return None
+
+
+def upgrade():
+    bind = op.get_bind()
+    cliente = sa.table(
+        'cliente',
+        sa.column('id', sa.Integer),
+        sa.column('telefono', sa.String),
+        sa.column('local', sa.String),
+        sa.column('assigned_table', sa.Integer),
+    )
+    en_espera = set()
+    for cliente_id, telefono, local, mesa in bind.execute(
+        sa.select(cliente.c.id, cliente.c.telefono, cliente.c.local, cliente.c.assigned_table)
+        .where(cliente.c.telefono.isnot(None))
+        .order_by(cliente.c.id)
+    ).all():
+        normalizado = normalizar_telefono(telefono) or telefono
+        if mesa is None:
+            if (local, normalizado) in en_espera:
+                normalizado = None  # turno repetido: no puede quedar en el índice único
+            else:
+                en_espera.add((local, normalizado))
+        if normalizado != telefono:
+            bind.execute(cliente.update().where(cliente.c.id == cliente_id).values(telefono=normalizado))
+
+    with op.batch_alter_table('cliente', schema=None) as batch_op:
+        batch_op.create_index('idx_cliente_local_telefono', ['local', 'telefono'], unique=False)
+        batch_op.create_index('uq_cliente_telefono_en_cola', ['local', 'telefono'], unique=True,
+                              postgresql_where=EN_COLA, sqlite_where=EN_COLA)
+
+
+def downgrade():
+    with op.batch_alter_table('cliente', schema=None) as batch_op:
+        batch_op.drop_index('uq_cliente_telefono_en_cola')
+        batch_op.drop_index('idx_cliente_local_telefono')
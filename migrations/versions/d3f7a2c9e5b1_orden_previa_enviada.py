@@ -0,0 +1,38 @@
+"""Orden previa enviada: marca explícita de su paso a cocina/bar
+
+Agrega cliente.orden_previa_enviada_at. Antes la conversión se deducía de
+"el cliente ya tiene pedidos en esta mesa"; los clientes que ya tienen algún
+pedido quedan marcados para no volver a enviar su orden previa.
+
+Revision ID: d3f7a2c9e5b1
+Revises: c8f2a6d4e1b3
+Create Date: 2026-10-20 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f7a2c9e5b1'
+down_revision = 'c8f2a6d4e1b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cliente', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('orden_previa_enviada_at', sa.DateTime(timezone=True), nullable=True))
+
+    cliente = sa.table('cliente', sa.column('id', sa.Integer), sa.column('orden_previa_enviada_at', sa.DateTime))
+    pedidos = sa.table('pedidos', sa.column('cliente_id', sa.Integer))
+    op.execute(
+        cliente.update()
+        .where(sa.exists().where(pedidos.c.cliente_id == cliente.c.id))
+        .values(orden_previa_enviada_at=sa.func.current_timestamp())
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('cliente', schema=None) as batch_op:
+        batch_op.drop_column('orden_previa_enviada_at')
@@ -0,0 +1,87 @@
+"""Guardar fechas como TIMESTAMP WITH TIME ZONE en UTC
+
+Las columnas guardaban la hora local de Chile sin zona. Se convierten a
+instantes UTC: en PostgreSQL con AT TIME ZONE y en SQLite reescribiendo
+cada valor (SQLite no guarda la zona; la aplicación asume UTC al leer).
+
+Revision ID: d5a8f3c2e7b4
+Revises: c41e7a9d2b10
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from datetime import timezone
+from zoneinfo import ZoneInfo
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a8f3c2e7b4'
+down_revision = 'c41e7a9d2b10'
+branch_labels = None
+depends_on = None
+
+ZONA_CHILE = ZoneInfo('America/Santiago')
+
+COLUMNAS = {
+    'cliente': ['joined_at', 'atendido_at', 'mesa_asignada_at'],
+    'mesa': ['start_time'],
+    'uso_mesa': ['timestamp'],
+    'pedidos': ['timestamp'],
+    'push_subscription': ['created_at'],
+    'evento_cola': ['created_at'],
+}
+
+
+def _chile_a_utc(valor):
+    return valor.replace(tzinfo=ZONA_CHILE).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _utc_a_chile(valor):
+    return valor.replace(tzinfo=timezone.utc).astimezone(ZONA_CHILE).replace(tzinfo=None)
+
+
+def _reescribir_sqlite(bind, convertir):
+    """SQLite: recalcula cada fecha en Python (no hay AT TIME ZONE)"""
+    for nombre, columnas in COLUMNAS.items():
+        tabla = sa.table(nombre, sa.column('id', sa.Integer), *[sa.column(c, sa.DateTime) for c in columnas])
+        filas = bind.execute(sa.select(tabla)).mappings().all()
+        for fila in filas:
+            valores = {c: convertir(fila[c]) for c in columnas if fila[c] is not None}
+            if valores:
+                bind.execute(tabla.update().where(tabla.c.id == fila['id']).values(**valores))
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        for tabla, columnas in COLUMNAS.items():
+            for columna in columnas:
+                op.execute(
+                    f'ALTER TABLE {tabla} ALTER COLUMN "{columna}" TYPE TIMESTAMP WITH TIME ZONE '
+                    f"USING \"{columna}\" AT TIME ZONE 'America/Santiago'"
+                )
+    else:
+        _reescribir_sqlite(bind, _chile_a_utc)
+        for tabla, columnas in COLUMNAS.items():
+            with op.batch_alter_table(tabla, schema=None) as batch_op:
+                for columna in columnas:
+                    batch_op.alter_column(columna, type_=sa.DateTime(timezone=True), existing_nullable=True)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        for tabla, columnas in COLUMNAS.items():
+            for columna in columnas:
+                op.execute(
+                    f'ALTER TABLE {tabla} ALTER COLUMN "{columna}" TYPE TIMESTAMP WITHOUT TIME ZONE '
+                    f"USING \"{columna}\" AT TIME ZONE 'America/Santiago'"
+                )
+    else:
+        for tabla, columnas in COLUMNAS.items():
+            with op.batch_alter_table(tabla, schema=None) as batch_op:
+                for columna in columnas:
+                    batch_op.alter_column(columna, type_=sa.DateTime(), existing_nullable=True)
+        _reescribir_sqlite(bind, _utc_a_chile)
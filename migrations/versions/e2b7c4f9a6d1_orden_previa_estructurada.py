@@ -0,0 +1,114 @@
+"""Orden previa estructurada: líneas por persona y texto ya formateado
+
+Agrega cliente.orden_previa_personas (JSONB en PostgreSQL), el texto
+cacheado cliente.orden_previa_texto y mesa.orden_personas, y rellena los
+clientes que ya tenían una orden previa en texto.
+
+Revision ID: e2b7c4f9a6d1
+Revises: d5a8f3c2e7b4
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7c4f9a6d1'
+down_revision = 'd5a8f3c2e7b4'
+branch_labels = None
+depends_on = None
+
+
+# Copias congeladas de models.normalizar_orden_previa/formatear_personas tal
+# como estaban en esta revisión: la migración debe hacer siempre lo mismo
+# aunque esos helpers cambien después.
+def normalizar_orden_previa(valor):
+    if not valor:
+        return None
+    data = valor
+    if isinstance(valor, (str, bytes)):
+        try:
+            data = json.loads(valor)
+        except ValueError:
+            return None
+    if isinstance(data, dict) and isinstance(data.get('personas'), list):
+        personas = data['personas']
+    elif isinstance(data, list):
+        personas = data
+    else:
+        return None
+    lineas = []
+    for idx, p in enumerate(personas, start=1):
+        if not isinstance(p, dict):
+            continue
+        lineas.append({
+            'persona': idx,
+            'comida': p.get('comida') or p.get('plato') or '',
+            'bebida': p.get('bebida') or p.get('trago') or '',
+            'notas': p.get('notas') or p.get('comentarios') or '',
+        })
+    return lineas or None
+
+
+def formatear_personas(personas):
+    if not personas:
+        return None
+    lineas = []
+    for p in personas:
+        partes = []
+        if p.get('comida'):
+            partes.append(f"Comida: {p['comida']}")
+        if p.get('bebida'):
+            partes.append(f"Bebida: {p['bebida']}")
+        if p.get('notas'):
+            partes.append(f"Notas: {p['notas']}")
+        contenido = ' | '.join(partes) if partes else '(sin detalles)'
+        lineas.append(f"Persona {p['persona']}: {contenido}")
+    return "Orden previa ingresada por el cliente:\n" + "\n".join(lineas)
+
+
+def _json():
+    return sa.JSON(none_as_null=True).with_variant(postgresql.JSONB(none_as_null=True), 'postgresql')
+
+
+def upgrade():
+    with op.batch_alter_table('cliente', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('orden_previa_personas', _json(), nullable=True))
+        batch_op.add_column(sa.Column('orden_previa_texto', sa.Text(), nullable=True))
+
+    with op.batch_alter_table('mesa', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('orden_personas', _json(), nullable=True))
+
+    # Rellenar lo existente: se parsea una sola vez aquí y nunca más al leer
+    bind = op.get_bind()
+    cliente = sa.table(
+        'cliente',
+        sa.column('id', sa.Integer),
+        sa.column('orden_previa', sa.Text),
+        sa.column('orden_previa_personas', _json()),
+        sa.column('orden_previa_texto', sa.Text),
+    )
+    filas = bind.execute(
+        sa.select(cliente.c.id, cliente.c.orden_previa).where(cliente.c.orden_previa.isnot(None))
+    ).all()
+    for cliente_id, orden_previa in filas:
+        personas = normalizar_orden_previa(orden_previa)
+        bind.execute(
+            cliente.update().where(cliente.c.id == cliente_id).values(
+                orden_previa_personas=personas,
+                orden_previa_texto=formatear_personas(personas) or orden_previa or None,
+            )
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('mesa', schema=None) as batch_op:
+        batch_op.drop_column('orden_personas')
+
+    with op.batch_alter_table('cliente', schema=None) as batch_op:
+        batch_op.drop_column('orden_previa_texto')
+        batch_op.drop_column('orden_previa_personas')
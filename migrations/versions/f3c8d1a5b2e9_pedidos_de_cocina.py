@@ -0,0 +1,46 @@
+"""Pedidos de cocina: ítems, estación, estado e índices de pedidos abiertos
+
+Revision ID: f3c8d1a5b2e9
+Revises: e2b7c4f9a6d1
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8d1a5b2e9'
+down_revision = 'e2b7c4f9a6d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('pedidos', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cliente_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('persona', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('descripcion', sa.String(length=200), nullable=True))
+        batch_op.add_column(sa.Column('cantidad', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('notas', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('estacion', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('actualizado_at', sa.DateTime(timezone=True), nullable=True))
+        batch_op.create_index('idx_pedidos_estacion_estado', ['estacion', 'estado', 'timestamp'], unique=False)
+        batch_op.create_index('idx_pedidos_mesa_estado', ['mesa_id', 'estado'], unique=False)
+
+    pedidos = sa.table('pedidos', sa.column('estacion', sa.String), sa.column('cantidad', sa.Integer))
+    op.execute(pedidos.update().where(pedidos.c.estacion.is_(None)).values(estacion='cocina'))
+    op.execute(pedidos.update().where(pedidos.c.cantidad.is_(None)).values(cantidad=1))
+
+
+def downgrade():
+    with op.batch_alter_table('pedidos', schema=None) as batch_op:
+        batch_op.drop_index('idx_pedidos_mesa_estado')
+        batch_op.drop_index('idx_pedidos_estacion_estado')
+        batch_op.drop_column('actualizado_at')
+        batch_op.drop_column('estacion')
+        batch_op.drop_column('notas')
+        batch_op.drop_column('cantidad')
+        batch_op.drop_column('descripcion')
+        batch_op.drop_column('persona')
+        batch_op.drop_column('cliente_id')
@@ -1,47 +1,199 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+import hashlib
+import json
+import re
+from sqlalchemy.orm import validates
+from sqlalchemy.types import TypeDecorator
 from werkzeug.security import generate_password_hash, check_password_hash
-import pytz
+from tiempo import ahora_utc, a_utc
+from locales import LOCAL_DEFECTO
+from replicas import SesionEnrutada
 
-db = SQLAlchemy()
+# La sesión manda los SELECT de las rutas @solo_lectura a la réplica, si hay una (ver replicas.py)
+db = SQLAlchemy(session_options={'class_': SesionEnrutada})
+
+class FechaUTC(TypeDecorator):
+    """DateTime que siempre guarda y devuelve instantes UTC con tzinfo.
+
+    En PostgreSQL es TIMESTAMP WITH TIME ZONE; SQLite no guarda la zona, así
+    que ahí se escribe la hora UTC sin offset y se le agrega UTC al leer.
+    """
+    impl = db.DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        value = a_utc(value)
+        if value is not None and dialect.name == 'sqlite':
+            value = value.replace(tzinfo=None)
+        return value
+
+    def process_result_value(self, value, dialect):
+        return a_utc(value)
+
+class JSONNativo(TypeDecorator):
+    """JSON: JSONB nativo en PostgreSQL, texto JSON en SQLite.
+
+    El dialecto de PostgreSQL se importa recién al conectarse a uno, así el
+    arranque con SQLite (desarrollo, scripts) no lo carga.
+    """
+    impl = db.JSON
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import JSONB
+            return dialect.type_descriptor(JSONB(none_as_null=True))
+        return dialect.type_descriptor(db.JSON(none_as_null=True))
+
+
+def insert_del_dialecto():
+    """insert() del dialecto en uso: PostgreSQL y SQLite soportan ON CONFLICT"""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def normalizar_telefono(texto):
+    """'+56 9 1234 5678', '56912345678' o '912345678' -> '+56912345678'.
+    Devuelve None si no es un celular chileno."""
+    if not texto:
+        return None
+    digitos = re.sub(r'\D', '', str(texto))
+    if len(digitos) == 9 and digitos.startswith('9'):
+        digitos = '56' + digitos
+    if len(digitos) == 11 and digitos.startswith('569'):
+        return '+' + digitos
+    return None
+
+
+def hash_endpoint(endpoint):
+    """SHA-256 (hex, 64 caracteres) del endpoint push: clave de largo fijo para el índice único"""
+    return hashlib.sha256(endpoint.encode('utf-8')).hexdigest()
+
+
+def normalizar_orden_previa(valor):
+    """Convierte una orden previa (JSON en texto, lista de personas o dict con
+    clave 'personas') a una lista de líneas {'persona', 'comida', 'bebida', 'notas'}.
+    Devuelve None si el valor no tiene esa forma.
+    """
+    if not valor:
+        return None
+    data = valor
+    if isinstance(valor, (str, bytes)):
+        try:
+            data = json.loads(valor)
+        except ValueError:
+            return None
+    if isinstance(data, dict) and isinstance(data.get('personas'), list):
+        personas = data['personas']
+    elif isinstance(data, list):
+        personas = data
+    else:
+        return None
+    lineas = []
+    for idx, p in enumerate(personas, start=1):
+        if not isinstance(p, dict):
+            continue
+        lineas.append({
+            'persona': idx,
+            'comida': p.get('comida') or p.get('plato') or '',
+            'bebida': p.get('bebida') or p.get('trago') or '',
+            'notas': p.get('notas') or p.get('comentarios') or '',
+        })
+    return lineas or None
+
+
+def formatear_personas(personas):
+    """Texto legible para Mesa.orden a partir de las líneas normalizadas"""
+    if not personas:
+        return None
+    lineas = []
+    for p in personas:
+        partes = []
+        if p.get('comida'):
+            partes.append(f"Comida: {p['comida']}")
+        if p.get('bebida'):
+            partes.append(f"Bebida: {p['bebida']}")
+        if p.get('notas'):
+            partes.append(f"Notas: {p['notas']}")
+        contenido = ' | '.join(partes) if partes else '(sin detalles)'
+        lineas.append(f"Persona {p['persona']}: {contenido}")
+    return "Orden previa ingresada por el cliente:\n" + "\n".join(lineas)
 
-def get_chile_time():
-    """Función para obtener la hora actual de Chile"""
-    santiago_tz = pytz.timezone('America/Santiago')
-    return datetime.now(santiago_tz).replace(tzinfo=None)  # Remover tzinfo para compatibilidad con SQLAlchemy
 
 class Cliente(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(100), nullable=True)
     cantidad_comensales = db.Column(db.Integer, nullable=True)
     telefono = db.Column(db.String(20), nullable=True)  # Número de teléfono chileno (+569XXXXXXXX)
-    joined_at = db.Column(db.DateTime, default=get_chile_time)  # Usar función de hora de Chile
+    joined_at = db.Column(FechaUTC, default=ahora_utc)  # Instante en UTC
     assigned_table = db.Column(db.Integer, nullable=True)
     sid = db.Column(db.String, nullable=True)  # Socket session ID
-    atendido_at = db.Column(db.DateTime, nullable=True)  # Cuándo fue atendido
-    mesa_asignada_at = db.Column(db.DateTime, nullable=True)  # Cuándo se le asignó la mesa (para cronómetro)
-    # Nueva: orden previa ingresada por el cliente (JSON en texto)
+    atendido_at = db.Column(FechaUTC, nullable=True)  # Cuándo fue atendido
+    mesa_asignada_at = db.Column(FechaUTC, nullable=True)  # Cuándo se le asignó la mesa (para cronómetro)
+    # Orden previa ingresada por el cliente (JSON en texto, tal como llegó)
     orden_previa = db.Column(db.Text, nullable=True)
+    # Derivados de orden_previa, calculados una sola vez al asignarla (ver _al_asignar_orden_previa)
+    orden_previa_personas = db.Column(JSONNativo(), nullable=True)  # [{'persona', 'comida', 'bebida', 'notas'}]
+    orden_previa_texto = db.Column(db.Text, nullable=True)  # Texto ya formateado para Mesa.orden
+    # Cuándo la orden previa pasó a cocina/bar (una sola vez, ver cocina.pedidos_de_orden_previa)
+    orden_previa_enviada_at = db.Column(FechaUTC, nullable=True)
     # Indicador: el cliente marcó que viene en camino
     en_camino = db.Column(db.Boolean, default=False)
+    local = db.Column(db.String(40), nullable=False, default=LOCAL_DEFECTO, server_default=LOCAL_DEFECTO)
+
+    # Cola de un local (en espera, por orden de llegada), últimos atendidos y
+    # clientes que vuelven (por teléfono; a lo más un turno en espera por teléfono)
+    __table_args__ = (
+        db.Index('idx_cliente_local_cola', 'local', 'assigned_table', 'joined_at'),
+        db.Index('idx_cliente_local_atendido', 'local', 'atendido_at'),
+        db.Index('idx_cliente_local_telefono', 'local', 'telefono'),
+        db.Index('uq_cliente_telefono_en_cola', 'local', 'telefono', unique=True,
+                 postgresql_where=db.text('assigned_table IS NULL'),
+                 sqlite_where=db.text('assigned_table IS NULL')),
+    )
+
+    @validates('orden_previa')
+    def _al_asignar_orden_previa(self, key, valor):
+        # Se normaliza y formatea al guardar, no en cada lectura.
+        # (Los UPDATE masivos no pasan por aquí: deben setear los tres campos.)
+        if valor is not None and not isinstance(valor, str):
+            valor = json.dumps(valor, ensure_ascii=False)
+        self.orden_previa_personas = normalizar_orden_previa(valor)
+        self.orden_previa_texto = formatear_personas(self.orden_previa_personas) or valor or None
+        return valor
 
 class Mesa(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     is_occupied = db.Column(db.Boolean, default=False)
-    start_time = db.Column(db.DateTime, nullable=True)
+    start_time = db.Column(FechaUTC, nullable=True)
     cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'), nullable=True)
     cliente = db.relationship('Cliente', backref='mesa')
     llego_comensal = db.Column(db.Boolean, default=False)
     reservada = db.Column(db.Boolean, default=False)
     capacidad = db.Column(db.Integer, default=4)  # Capacidad de la mesa
     orden = db.Column(db.Text, nullable=True)  # Orden de los comensales
+    orden_personas = db.Column(JSONNativo(), nullable=True)  # Orden previa por persona copiada al asignar
+    local = db.Column(db.String(40), nullable=False, default=LOCAL_DEFECTO, server_default=LOCAL_DEFECTO)
+
+    # Plano de mesas de un local y mesas reservadas libres
+    __table_args__ = (
+        db.Index('idx_mesa_local_estado', 'local', 'reservada', 'is_occupied'),
+    )
 
 class UsoMesa(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     mesa_id = db.Column(db.Integer, db.ForeignKey('mesa.id'), nullable=False)
     duracion = db.Column(db.Integer)  # duración en segundos
-    timestamp = db.Column(db.DateTime, default=get_chile_time)  # Usar función de hora de Chile
-    
+    timestamp = db.Column(FechaUTC, default=ahora_utc)  # Instante en UTC
+    local = db.Column(db.String(40), nullable=False, default=LOCAL_DEFECTO, server_default=LOCAL_DEFECTO)
+
+    __table_args__ = (
+        db.Index('idx_uso_mesa_local_fecha', 'local', 'timestamp'),
+    )
+
 class Trabajador(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), nullable=False)
@@ -68,29 +220,70 @@ class Trabajador(db.Model):
     
 
 class Pedidos(db.Model):
+    """Un ítem pedido por una mesa (ver cocina.py para las transiciones)"""
     id = db.Column(db.Integer, primary_key=True)
     mesa_id = db.Column(db.Integer, db.ForeignKey('mesa.id'), nullable=False)
-    timestamp = db.Column(db.DateTime, default=get_chile_time)  # Usar función de hora de Chile
-    estado = db.Column(db.String(20), default='pendiente')
-    
+    timestamp = db.Column(FechaUTC, default=ahora_utc)  # Instante en UTC
+    estado = db.Column(db.String(20), default='pendiente')  # pendiente, en_preparacion, servido
+    cliente_id = db.Column(db.Integer, nullable=True)  # Cliente de la mesa al pedir (sin FK, como EventoCola)
+    persona = db.Column(db.Integer, nullable=True)  # Comensal (1..n) si se conoce
+    descripcion = db.Column(db.String(200), nullable=True)
+    cantidad = db.Column(db.Integer, default=1)
+    notas = db.Column(db.Text, nullable=True)
+    estacion = db.Column(db.String(20), default='cocina')  # cocina, bar
+    actualizado_at = db.Column(FechaUTC, default=ahora_utc)  # Último cambio de estado
+    local = db.Column(db.String(40), nullable=False, default=LOCAL_DEFECTO, server_default=LOCAL_DEFECTO)
+
     mesa = db.relationship('Mesa', backref='pedidos')
 
+    # Pedidos abiertos por local y estación (pantalla de cocina) y por mesa
+    __table_args__ = (
+        db.Index('idx_pedidos_local_estacion_estado', 'local', 'estacion', 'estado', 'timestamp'),
+        db.Index('idx_pedidos_mesa_estado', 'mesa_id', 'estado'),
+    )
+
 class PushSubscription(db.Model):
     """Modelo para almacenar suscripciones de notificaciones push"""
     id = db.Column(db.Integer, primary_key=True)
     cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'), nullable=False)
     endpoint = db.Column(db.Text, nullable=False)  # URL del endpoint del navegador
+    endpoint_hash = db.Column(db.String(64), nullable=False)  # hash_endpoint(endpoint), único
     p256dh_key = db.Column(db.String(255), nullable=False)  # Clave pública del cliente
     auth_key = db.Column(db.String(255), nullable=False)  # Clave de autenticación
     user_agent = db.Column(db.Text, nullable=True)  # Info del navegador/dispositivo
-    created_at = db.Column(db.DateTime, default=get_chile_time)
+    created_at = db.Column(FechaUTC, default=ahora_utc)
     is_active = db.Column(db.Boolean, default=True)  # Para desactivar suscripciones inválidas
+    local = db.Column(db.String(40), nullable=False, default=LOCAL_DEFECTO, server_default=LOCAL_DEFECTO)
     
     # Relación con el cliente
     cliente = db.relationship('Cliente', backref='push_subscriptions')
     
-    # Índices para optimizar búsquedas
+    # Índices para optimizar búsquedas (el endpoint se busca por su hash, no por el texto)
     __table_args__ = (
         db.Index('idx_cliente_active', 'cliente_id', 'is_active'),
-        db.Index('idx_endpoint', 'endpoint'),
+        db.Index('uq_push_endpoint_hash', 'endpoint_hash', unique=True),
+        db.Index('idx_push_local_activa', 'local', 'is_active'),
+    )
+
+    @validates('endpoint')
+    def _al_asignar_endpoint(self, key, valor):
+        # (Los INSERT/UPDATE masivos no pasan por aquí: deben setear endpoint_hash.)
+        self.endpoint_hash = hash_endpoint(valor)
+        return valor
+
+class EventoCola(db.Model):
+    """Registro append-only de las transiciones de la cola y de las mesas"""
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False)  # ingreso, cancelacion, asignacion, llegada, liberacion, reserva, capacidad
+    cliente_id = db.Column(db.Integer, nullable=True)  # Sin FK: los turnos cancelados se eliminan de cliente
+    mesa_id = db.Column(db.Integer, nullable=True)  # Mesa principal afectada
+    datos = db.Column(db.Text, nullable=True)  # Detalle del evento (JSON en texto)
+    created_at = db.Column(FechaUTC, default=ahora_utc)
+    local = db.Column(db.String(40), nullable=False, default=LOCAL_DEFECTO, server_default=LOCAL_DEFECTO)
+
+    # Índices para leer el historial de un local (por id o por fecha/tipo) o por cliente
+    __table_args__ = (
+        db.Index('idx_evento_tipo_fecha', 'tipo', 'created_at'),
+        db.Index('idx_evento_cliente', 'cliente_id'),
+        db.Index('idx_evento_local_id', 'local', 'id'),
     )
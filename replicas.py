@@ -0,0 +1,172 @@
+"""
+Réplica de lectura para las rutas de solo lectura.
+
+Con DATABASE_REPLICA_URL definida, las rutas marcadas con @solo_lectura
+(/clientes, /tiempo_espera_promedio, /verificar_estado_cliente,
+/estadisticas, /obtener_info_mesa) hacen sus SELECT en la réplica y dejan
+el pool del primario para las escrituras. Sin la variable todo va al
+primario, como siempre. Un flush o un UPDATE/INSERT dentro de esas rutas
+sigue yendo al primario.
+
+Leer lo propio (read-your-writes): la réplica va unos instantes atrasada.
+Cuando una petición confirma una escritura, la sesión de ese navegador queda
+marcada por LECTURA_PRIMARIA_SEGUNDOS y mientras tanto sus lecturas van al
+primario: el cliente que acaba de tomar turno o marcar que viene en camino,
+o el mesero que acaba de asignar una mesa, ven su propio cambio. El resto
+lee de la réplica.
+
+Si la réplica falla al conectarse, la petición se repite en el primario y la
+réplica se deja de usar por PAUSA_REPLICA segundos.
+
+Para probarlo con dos bases locales (la "replicación" es copiar el archivo):
+    cp instance/db.sqlite3 instance/replica.sqlite3
+    DATABASE_REPLICA_URL=sqlite:///replica.sqlite3 python app.py
+"""
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+
+CLAVE_SESION = 'lectura_primaria_hasta'
+LECTURA_PRIMARIA_SEGUNDOS = 5
+PAUSA_REPLICA = 30
+
+
+def url_replica():
+    """DATABASE_REPLICA_URL con el esquema que espera SQLAlchemy (o None)"""
+    url = os.environ.get('DATABASE_REPLICA_URL')
+    if url and url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    return url or None
+
+
+class SesionEnrutada(Session):
+    """Sesión que manda los SELECT de las rutas @solo_lectura a la réplica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and replicas.engine is not None and not self._flushing
+                and not isinstance(clause, UpdateBase)
+                and has_request_context() and g.get('leer_de_replica')):
+            return replicas.engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class Replicas:
+    """Engine de la réplica (fuera de SQLALCHEMY_BINDS: create_all y las
+    migraciones nunca la tocan) y contadores de lecturas"""
+
+    def __init__(self):
+        self.app = None
+        self.db = None
+        self.engine = None
+        self.ventana = LECTURA_PRIMARIA_SEGUNDOS
+        self.pausada_hasta = 0.0
+        self._lock = threading.Lock()
+        self.lecturas = {'replica': 0, 'primario': 0, 'leer_lo_propio': 0}
+        self.fallos = 0
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        self.ventana = app.config.get('LECTURA_PRIMARIA_SEGUNDOS', self.ventana)
+        url = app.config.get('DATABASE_REPLICA_URL') or url_replica()
+        if not url:
+            return
+        self.engine = create_engine(self._resolver_url(app, url),
+                                    **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        event.listen(self.engine, 'handle_error', self._error_en_replica)
+        app.after_request(self._marcar_escritura)
+        event.listen(db.session, 'after_commit', self._despues_de_commit)
+        print("📖 Réplica de lectura configurada para las rutas de solo lectura")
+
+    @staticmethod
+    def _resolver_url(app, url):
+        """Igual que Flask-SQLAlchemy: un SQLite relativo vive en instance/"""
+        url = make_url(url)
+        if url.drivername.startswith('sqlite') and url.database and url.database != ':memory:' \
+                and not os.path.isabs(url.database):
+            url = url.set(database=os.path.join(app.instance_path, url.database))
+        return url
+
+    # -- leer lo propio -------------------------------------------------------
+
+    def _despues_de_commit(self, sesion):
+        if has_request_context():
+            g.escritura_confirmada = True
+
+    def _marcar_escritura(self, respuesta):
+        if g.get('escritura_confirmada'):
+            session[CLAVE_SESION] = int(time.time()) + self.ventana
+        return respuesta
+
+    # -- enrutamiento ---------------------------------------------------------
+
+    def disponible(self):
+        """True si esta petición puede leer de la réplica"""
+        if self.engine is None or time.time() < self.pausada_hasta:
+            return False
+        if session.get(CLAVE_SESION, 0) > time.time():
+            self._contar('leer_lo_propio')
+            return False
+        return True
+
+    def _error_en_replica(self, contexto):
+        if contexto.is_disconnect or contexto.connection is None:
+            with self._lock:
+                self.fallos += 1
+                self.pausada_hasta = time.time() + PAUSA_REPLICA
+            if has_request_context():
+                g.replica_fallo = True
+            print(f"⚠️ Réplica no disponible ({contexto.original_exception}); "
+                  f"se lee del primario por {PAUSA_REPLICA}s")
+
+    def _contar(self, clave):
+        with self._lock:
+            self.lecturas[clave] += 1
+
+    def solo_lectura(self, f):
+        """Decorador: la ruta lee de la réplica (salvo leer lo propio o réplica caída)"""
+        @wraps(f)
+        def envoltura(*args, **kwargs):
+            g.leer_de_replica = self.disponible()
+            self._contar('replica' if g.leer_de_replica else 'primario')
+            try:
+                respuesta = f(*args, **kwargs)
+            except Exception:
+                if not g.get('replica_fallo'):
+                    raise
+            if g.pop('replica_fallo', False):
+                # Falló la conexión a la réplica (la ruta haya atrapado el error o no):
+                # se repite completa en el primario
+                self.db.session.rollback()
+                g.leer_de_replica = False
+                self._contar('primario')
+                respuesta = f(*args, **kwargs)
+            return respuesta
+        return envoltura
+
+    def metricas(self):
+        with self._lock:
+            return {
+                'activa': self.engine is not None,
+                'pausada': time.time() < self.pausada_hasta,
+                'lecturas': dict(self.lecturas),
+                'fallos': self.fallos,
+                'ventana_leer_lo_propio_s': self.ventana,
+            }
+
+
+replicas = Replicas()
+
+
+def init_app(app, db):
+    replicas.init_app(app, db)
+
+
+solo_lectura = replicas.solo_lectura
@@ -0,0 +1,111 @@
+"""
+Serialización JSON rápida para respuestas Flask y paquetes Socket.IO.
+
+Se usa orjson cuando está instalado y, si no, el módulo json estándar con el
+mismo manejo de tipos. En ambos casos los datetime se serializan solos como
+ISO 8601 en UTC (los valores sin zona se asumen UTC, igual que tiempo.a_utc),
+así los handlers pueden devolver las columnas de fecha directamente sin
+llamar a iso_utc()/isoformat() campo por campo.
+
+- `ProveedorJSON` se registra como `app.json` (jsonify, request.get_json).
+- El módulo mismo expone `dumps`/`loads` compatibles con la librería estándar
+  y se pasa como `json=` a SocketIO (python-socketio y engineio).
+"""
+import dataclasses
+import decimal
+import json as _json_std
+import uuid
+from datetime import date, datetime
+
+from flask.json.provider import DefaultJSONProvider
+
+from tiempo import iso_utc
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+MOTOR = 'orjson' if orjson is not None else 'json'
+
+if orjson is not None:
+    # OPT_PASSTHROUGH_DATETIME: los datetime pasan por por_defecto (iso_utc), así
+    # los que traen otra zona también salen en UTC y no con su propio offset
+    # OPT_NON_STR_KEYS: permite dicts con claves int (p. ej. {mesa_id: ...})
+    _OPCIONES = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    _OPCIONES_ORDENADAS = _OPCIONES | orjson.OPT_SORT_KEYS
+
+
+def por_defecto(obj):
+    """Tipos que ni orjson ni json saben serializar por sí mismos"""
+    if isinstance(obj, datetime):
+        return iso_utc(obj)
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Objeto de tipo {type(obj).__name__} no es serializable a JSON")
+
+
+def dumps_bytes(obj, sort_keys=False):
+    """Serializa a bytes UTF-8 (lo que necesita el cuerpo de una respuesta)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=por_defecto,
+                                option=_OPCIONES_ORDENADAS if sort_keys else _OPCIONES)
+        except TypeError:
+            # p. ej. enteros de más de 64 bits: la librería estándar sí los acepta
+            pass
+    return _json_std.dumps(obj, default=por_defecto, sort_keys=sort_keys,
+                           ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumps(obj, sort_keys=False, **kwargs):
+    """Igual que json.dumps (devuelve str). Acepta y omite separators/indent/etc.:
+    la salida siempre es compacta."""
+    return dumps_bytes(obj, sort_keys=sort_keys).decode('utf-8')
+
+
+def loads(s, **kwargs):
+    if orjson is not None:
+        return orjson.loads(s)
+    return _json_std.loads(s)
+
+
+class ProveedorJSON(DefaultJSONProvider):
+    """Proveedor de Flask que usa dumps_bytes/loads de este módulo.
+
+    Respeta `app.json.sort_keys`; el modo con sangría (`compact=False` o
+    debug) se delega al proveedor por defecto para no cambiar esa salida.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.get('indent'):
+            kwargs.setdefault('default', por_defecto)
+            return super().dumps(obj, **kwargs)
+        return dumps(obj, sort_keys=kwargs.get('sort_keys', self.sort_keys))
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(obj)
+        # Se arma el cuerpo en bytes directamente, sin pasar por str
+        return self._app.response_class(
+            dumps_bytes(obj, sort_keys=self.sort_keys), mimetype=self.mimetype
+        )
+
+
+def init_app(app):
+    app.json = ProveedorJSON(app)
+    print(f"⚡ Serialización JSON con {MOTOR}")
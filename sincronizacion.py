@@ -0,0 +1,116 @@
+"""
+Puesta al día de las tablets de los meseros al (re)conectarse.
+
+La versión del estado de un local es el id de su último EventoCola. La
+tablet guarda la versión que vio (la trae la página /trabajador y cada
+respuesta) y la envía en `registrar_trabajador`; el servidor contesta con:
+
+- al_dia: no cambió nada, no hay que pedir nada.
+- delta: el estado actual de las mesas que tocaron los eventos posteriores
+  (y la fila completa si alguno la cambió: es corta).
+- snapshot: todas las mesas y la fila, si la tablet no trae versión, la
+  versión no es de esta base o se perdió más de MAXIMO_DELTA eventos.
+
+Mesas y fila van compactas: nombres de columna una vez y filas como listas.
+El delta se arma con el estado actual (no repitiendo los eventos), así que
+aplicarlo dos veces da lo mismo.
+
+La versión se lee ANTES que el estado: todo evento con id <= versión ya se
+confirmó y está incluido; lo que se confirme después tendrá un id mayor y
+llegará en la próxima puesta al día.
+
+La versión es solo lo ya escrito en EventoCola: los eventos que el hilo de
+eventos.py aún no escribe (a lo más ~intervalo segundos) quedan fuera de la
+versión aunque su cambio ya esté en el estado enviado. Esa tablet los
+recibe de nuevo en el próximo delta, lo que no hace daño (el delta es
+idempotente); y una tablet que se reconecta justo en esa ventana puede
+recibir al_dia sin ese cambio, que le llega con el próximo aviso o
+reconexión. No se vacía la cola aquí: sería un INSERT + COMMIT en una ruta
+de lectura, y desde otro hilo que el escritor.
+"""
+import json
+
+from sqlalchemy import select
+
+import eventos
+import locales
+from mesas import estado_mesa
+from models import db, Cliente, EventoCola, Mesa
+from tiempo import datetime_to_js_timestamp
+
+MAXIMO_DELTA = 200
+
+AL_DIA = 'al_dia'
+DELTA = 'delta'
+SNAPSHOT = 'snapshot'
+
+COLUMNAS_MESA = ['id', 'estado', 'capacidad', 'cliente_id', 'desde']
+COLUMNAS_COLA = ['id', 'nombre', 'cantidad_comensales', 'joined_at']
+
+# Eventos que cambian la fila de espera
+_TIPOS_COLA = {eventos.INGRESO, eventos.CANCELACION, eventos.ASIGNACION}
+
+
+def version(local=None):
+    """Versión actual del estado del local: id del último evento ya escrito"""
+    return eventos.ultimo_id(local)
+
+
+def _mesas(local, ids=None):
+    consulta = Mesa.query.filter(Mesa.local == local)
+    if ids is not None:
+        consulta = consulta.filter(Mesa.id.in_(ids))
+    return {
+        'columnas': COLUMNAS_MESA,
+        'filas': [[m.id, estado_mesa(m), m.capacidad, m.cliente_id, datetime_to_js_timestamp(m.start_time)]
+                  for m in consulta.order_by(Mesa.id)],
+    }
+
+
+def _cola(local):
+    filas = db.session.execute(
+        select(Cliente.id, Cliente.nombre, Cliente.cantidad_comensales, Cliente.joined_at)
+        .where(Cliente.local == local, Cliente.assigned_table.is_(None))
+        .order_by(Cliente.joined_at)
+    ).all()
+    return {
+        'columnas': COLUMNAS_COLA,
+        'filas': [[f.id, f.nombre, f.cantidad_comensales, datetime_to_js_timestamp(f.joined_at)] for f in filas],
+    }
+
+
+def _cambios(local, desde, hasta):
+    """Mesas tocadas y si cambió la fila entre dos versiones (None si son demasiados eventos)"""
+    filas = db.session.execute(
+        select(EventoCola.tipo, EventoCola.mesa_id, EventoCola.datos)
+        .where(EventoCola.local == local, EventoCola.id > desde, EventoCola.id <= hasta)
+        .order_by(EventoCola.id)
+        .limit(MAXIMO_DELTA + 1)
+    ).all()
+    if len(filas) > MAXIMO_DELTA:
+        return None
+    mesas_ids = set()
+    cola = False
+    for fila in filas:
+        datos = json.loads(fila.datos) if fila.datos else {}
+        mesas_ids.update(datos.get('mesas') or ([fila.mesa_id] if fila.mesa_id else []))
+        cola = cola or fila.tipo in _TIPOS_COLA
+    return mesas_ids, cola
+
+
+def para_trabajador(version_tablet=None, local=None):
+    """Respuesta para una tablet que vio `version_tablet`: al día, delta o snapshot"""
+    local = local or locales.actual()
+    actual = version(local)
+    if isinstance(version_tablet, int) and not isinstance(version_tablet, bool) and 0 <= version_tablet <= actual:
+        if version_tablet == actual:
+            return {'tipo': AL_DIA, 'version': actual}
+        cambios = _cambios(local, version_tablet, actual)
+        if cambios is not None:
+            mesas_ids, cola = cambios
+            respuesta = {'tipo': DELTA, 'version': actual, 'desde': version_tablet,
+                         'mesas': _mesas(local, mesas_ids)}
+            if cola:
+                respuesta['cola'] = _cola(local)
+            return respuesta
+    return {'tipo': SNAPSHOT, 'version': actual, 'mesas': _mesas(local), 'cola': _cola(local)}
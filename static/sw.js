@@ -1,22 +1,170 @@
-// 🔔 SERVICE WORKER PARA NOTIFICACIONES PUSH REALES
-// Versión del cache para forzar actualizaciones
-const CACHE_VERSION = 'v1.2.0';
-const CACHE_NAME = `restaurant-sw-${CACHE_VERSION}`;
+// 🔔 SERVICE WORKER: NOTIFICACIONES PUSH + CACHÉ OFFLINE
+// Se sirve desde /sw.js (scope "/"): el servidor antepone SW_VERSION (hash de
+// este archivo y del manifiesto de estáticos) y SW_PRECACHE (URLs con hash
+// del app shell). Un deploy nuevo cambia la versión y renueva las cachés.
+const CACHE_VERSION = self.SW_VERSION || 'dev';
+const PRECACHE = self.SW_PRECACHE || [];
+const CACHE_ESTATICOS = `alleria-estaticos-${CACHE_VERSION}`;
+const CACHE_PAGINAS = `alleria-paginas-${CACHE_VERSION}`;
+const CACHE_ESTADO = `alleria-estado-${CACHE_VERSION}`;
+const CACHES_VIGENTES = [CACHE_ESTATICOS, CACHE_PAGINAS, CACHE_ESTADO];
+
+// Estado de la cola: se responde desde caché y se revalida en segundo plano.
+// Dentro de `frescura` ms ni siquiera se consulta al servidor, salvo que la
+// página pida { cache: 'no-cache' } o 'reload': entonces va directo a la red.
+// (/estado_cliente/<id> no pasa por aquí: trae ETag y long-polling propios)
+const RUTAS_ESTADO = [
+  { prefijo: '/tiempo_espera_promedio', frescura: 30000 },
+];
+
+// Recursos externos versionados en la URL (socket.io) o inmutables (fuentes)
+const ORIGENES_EXTERNOS = ['cdn.socket.io', 'fonts.googleapis.com', 'fonts.gstatic.com'];
+
+// Al salir de la cola se borra el estado y la página guardada del cliente
+const RUTAS_FIN_SESION = ['/logout_cliente', '/cancelar_turno/'];
 
 // 📦 INSTALACIÓN DEL SERVICE WORKER
 self.addEventListener('install', (event) => {
   console.log('🔧 Service Worker: Instalando versión', CACHE_VERSION);
-  self.skipWaiting(); // Forzar activación inmediata
+  event.waitUntil(
+    caches.open(CACHE_ESTATICOS)
+      .then(cache => cache.addAll(PRECACHE))
+      .catch(error => console.error('❌ Error precargando app shell:', error))
+      .then(() => self.skipWaiting()) // Forzar activación inmediata
+  );
 });
 
 // ⚡ ACTIVACIÓN DEL SERVICE WORKER
 self.addEventListener('activate', (event) => {
   console.log('🚀 Service Worker: Activado versión', CACHE_VERSION);
   event.waitUntil(
-    self.clients.claim() // Tomar control inmediatamente
+    caches.keys()
+      .then(nombres => Promise.all(nombres
+        .filter(nombre => !CACHES_VIGENTES.includes(nombre))
+        .map(nombre => caches.delete(nombre)))) // cachés de versiones anteriores
+      .then(() => self.clients.claim()) // Tomar control inmediatamente
   );
 });
 
+// 🌐 PETICIONES: qué se sirve desde caché
+self.addEventListener('fetch', (event) => {
+  const request = event.request;
+  const url = new URL(request.url);
+  const mismoOrigen = url.origin === self.location.origin;
+
+  if (request.method !== 'GET') {
+    if (mismoOrigen && RUTAS_FIN_SESION.some(ruta => url.pathname.startsWith(ruta))) {
+      event.waitUntil(Promise.all([caches.delete(CACHE_ESTADO), caches.delete(CACHE_PAGINAS)]));
+    }
+    return; // la red se encarga
+  }
+
+  if (!mismoOrigen) {
+    if (ORIGENES_EXTERNOS.includes(url.host)) {
+      event.respondWith(cacheFirst(request, CACHE_ESTATICOS));
+    }
+    return;
+  }
+
+  if (url.pathname.startsWith('/static/dist/')) {
+    // Nombre con hash del contenido: nunca cambia
+    event.respondWith(cacheFirst(request, CACHE_ESTATICOS));
+  } else if (url.pathname.startsWith('/static/')) {
+    // Sin build de estáticos la URL no cambia con el contenido
+    event.respondWith(staleWhileRevalidate(event, CACHE_ESTATICOS, 0, false));
+  } else if (request.mode === 'navigate' && url.pathname === '/cliente') {
+    // El HTML depende de la sesión (y puede redirigir): red primero, caché si no hay conexión
+    event.respondWith(networkFirst(request, CACHE_PAGINAS, '/cliente'));
+  } else {
+    const ruta = RUTAS_ESTADO.find(r => url.pathname.startsWith(r.prefijo));
+    if (ruta) {
+      event.respondWith(staleWhileRevalidate(event, CACHE_ESTADO, ruta.frescura, true));
+    }
+  }
+});
+
+function guardable(respuesta) {
+  return respuesta && (respuesta.ok || respuesta.type === 'opaque');
+}
+
+async function cacheFirst(request, nombreCache) {
+  const cache = await caches.open(nombreCache);
+  const cacheada = await cache.match(request);
+  if (cacheada) return cacheada;
+  const respuesta = await fetch(request);
+  if (guardable(respuesta)) {
+    await cache.put(request, respuesta.clone());
+  }
+  return respuesta;
+}
+
+async function networkFirst(request, nombreCache, clave) {
+  const cache = await caches.open(nombreCache);
+  try {
+    const respuesta = await fetch(request);
+    if (respuesta.ok && !respuesta.redirected) {
+      await cache.put(clave, respuesta.clone());
+    }
+    return respuesta;
+  } catch (error) {
+    const cacheada = await cache.match(clave);
+    if (cacheada) {
+      console.log('📴 Sin conexión: sirviendo', clave, 'desde caché');
+      return cacheada;
+    }
+    throw error;
+  }
+}
+
+// Copia de la respuesta con la hora en que se guardó (para la frescura)
+async function conMarcaDeTiempo(respuesta) {
+  const headers = new Headers(respuesta.headers);
+  headers.set('sw-guardado', String(Date.now()));
+  return new Response(await respuesta.blob(), {
+    status: respuesta.status, statusText: respuesta.statusText, headers
+  });
+}
+
+async function staleWhileRevalidate(event, nombreCache, frescura, avisar) {
+  const request = event.request;
+  const cache = await caches.open(nombreCache);
+  // La página pidió explícitamente un dato nuevo: ni la copia fresca ni la vieja sirven
+  const forzada = request.cache === 'no-cache' || request.cache === 'reload';
+  const cacheada = forzada ? null : await cache.match(request);
+  if (cacheada && Date.now() - Number(cacheada.headers.get('sw-guardado') || 0) < frescura) {
+    return cacheada;
+  }
+
+  // La página consume el cuerpo de `cacheada`: se guarda una copia para comparar
+  const anterior = avisar && cacheada ? cacheada.clone() : null;
+  const red = fetch(request).then(async (respuesta) => {
+    if (!respuesta.ok) {
+      await cache.delete(request);
+      return respuesta;
+    }
+    await cache.put(request, await conMarcaDeTiempo(respuesta.clone()));
+    if (anterior) {
+      // La página ya recibió la versión vieja: si cambió, se le envía la nueva
+      const [antes, ahora] = await Promise.all([anterior.text(), respuesta.clone().text()]);
+      if (antes !== ahora) {
+        const clientes = await self.clients.matchAll({ type: 'window' });
+        clientes.forEach(cliente => cliente.postMessage({
+          type: 'ESTADO_ACTUALIZADO',
+          url: new URL(request.url).pathname,
+          data: JSON.parse(ahora)
+        }));
+      }
+    }
+    return respuesta;
+  });
+
+  if (cacheada) {
+    event.waitUntil(red.catch(error => console.log('📴 Revalidación fallida:', request.url, error)));
+    return cacheada;
+  }
+  return red;
+}
+
 // 🔔 RECIBIR NOTIFICACIONES PUSH DEL SERVIDOR
 self.addEventListener('push', (event) => {
   console.log('🔔 === PUSH NOTIFICATION RECIBIDA ===');
@@ -0,0 +1,138 @@
+"""
+Suscripciones push: alta por hash del endpoint y limpieza periódica.
+
+El endpoint es una URL larga (Text); indexarlo tal cual hacía crecer el
+índice con cada suscripción. Ahora se busca por endpoint_hash (SHA-256, 64
+caracteres) con índice único, y el alta es un solo INSERT ... ON CONFLICT
+DO UPDATE: si el navegador ya estaba suscrito (otro turno, mismo teléfono)
+la fila se reutiliza sin un SELECT previo.
+
+Antes las suscripciones solo se desactivaban cuando el servicio push
+respondía 404/410, así que las de clientes ya atendidos quedaban para
+siempre. purgar() las borra en bloque (un DELETE por tipo):
+
+- de clientes atendidos hace más de RETENCION_ATENDIDOS (ya no se les avisa
+  nada),
+- las inactivas hace más de RETENCION_INACTIVAS,
+- las de clientes que ya no existen (turnos cancelados).
+
+La corre el hilo de limpieza cada INTERVALO_PURGA y también `flask
+purgar-suscripciones`. Cancelar un turno borra sus suscripciones al tiro.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from sqlalchemy import case, delete, exists, func, select
+
+from models import db, Cliente, PushSubscription, hash_endpoint, insert_del_dialecto
+from tiempo import ahora_utc, iso_utc
+
+RETENCION_ATENDIDOS = timedelta(hours=3)
+RETENCION_INACTIVAS = timedelta(days=1)
+INTERVALO_PURGA = 30 * 60  # segundos entre purgas del hilo de limpieza
+
+
+def guardar(cliente_id, subscription, user_agent, local):
+    """Alta o renovación de la suscripción del endpoint (sin commit)"""
+    valores = {
+        'cliente_id': cliente_id,
+        'endpoint': subscription['endpoint'],
+        'endpoint_hash': hash_endpoint(subscription['endpoint']),
+        'p256dh_key': subscription['keys']['p256dh'],
+        'auth_key': subscription['keys']['auth'],
+        'user_agent': user_agent[:500] if user_agent else None,
+        'created_at': ahora_utc(),
+        'is_active': True,
+        'local': local,
+    }
+    consulta = insert_del_dialecto()(PushSubscription).values(**valores)
+    actualizar = {k: consulta.excluded[k] for k in valores if k not in ('endpoint', 'endpoint_hash')}
+    db.session.execute(consulta.on_conflict_do_update(index_elements=['endpoint_hash'], set_=actualizar))
+
+
+def eliminar_de_cliente(cliente_id):
+    """Borra las suscripciones de un cliente (antes de borrar el cliente)"""
+    return db.session.execute(
+        delete(PushSubscription).where(PushSubscription.cliente_id == cliente_id)
+    ).rowcount
+
+
+def _condiciones(ahora):
+    """tipo de suscripción obsoleta -> condición sobre PushSubscription"""
+    atendido = select(Cliente.id).where(Cliente.atendido_at.isnot(None),
+                                        Cliente.atendido_at < ahora - RETENCION_ATENDIDOS)
+    return {
+        'atendidos': PushSubscription.cliente_id.in_(atendido),
+        'inactivas': PushSubscription.is_active.is_(False) & (PushSubscription.created_at < ahora - RETENCION_INACTIVAS),
+        'huerfanas': ~exists().where(Cliente.id == PushSubscription.cliente_id),
+    }
+
+
+class Purgas:
+    """Contadores de las purgas hechas por este proceso"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totales = {tipo: 0 for tipo in ('atendidos', 'inactivas', 'huerfanas')}
+        self.ejecuciones = 0
+        self.ultima = None
+        self._siguiente = 0.0
+
+    def toca(self):
+        """True si ya pasó INTERVALO_PURGA desde la última purga del hilo"""
+        with self._lock:
+            if time.monotonic() < self._siguiente:
+                return False
+            self._siguiente = time.monotonic() + INTERVALO_PURGA
+            return True
+
+    def anotar(self, borradas):
+        with self._lock:
+            for tipo, cantidad in borradas.items():
+                self.totales[tipo] += cantidad
+            self.ejecuciones += 1
+            self.ultima = ahora_utc()
+
+
+purgas = Purgas()
+
+
+def purgar():
+    """Borra en bloque las suscripciones obsoletas de todos los locales y hace commit.
+    Devuelve cuántas se borraron por tipo."""
+    borradas = {}
+    try:
+        for tipo, condicion in _condiciones(ahora_utc()).items():
+            borradas[tipo] = db.session.execute(
+                delete(PushSubscription).where(condicion).execution_options(synchronize_session=False)
+            ).rowcount
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    purgas.anotar(borradas)
+    if any(borradas.values()):
+        print(f"🗑️ Suscripciones push purgadas: {borradas}")
+    return borradas
+
+
+def metricas():
+    """Activas, inactivas y obsoletas (se borrarán en la próxima purga), más lo ya purgado"""
+    condiciones = _condiciones(ahora_utc())
+    obsoleta = condiciones['atendidos'] | condiciones['inactivas'] | condiciones['huerfanas']
+    fila = db.session.execute(select(
+        func.count(PushSubscription.id),
+        func.coalesce(func.sum(case((PushSubscription.is_active.is_(True), 1), else_=0)), 0),
+        func.coalesce(func.sum(case((obsoleta, 1), else_=0)), 0),
+    )).one()
+    total, activas, obsoletas = fila
+    return {
+        'total': total,
+        'activas': activas,
+        'inactivas': total - activas,
+        'obsoletas': obsoletas,
+        'purgadas': dict(purgas.totales),
+        'purgas': purgas.ejecuciones,
+        'ultima_purga': iso_utc(purgas.ultima) if purgas.ultima else None,
+    }
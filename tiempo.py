@@ -0,0 +1,64 @@
+"""
+Manejo de fechas: se guarda todo en UTC y se convierte a hora de Chile
+solo al mostrar (templates, textos legibles).
+
+La zona America/Santiago se construye una sola vez al importar el módulo
+(zoneinfo además mantiene su propio caché), en lugar de crear un objeto
+pytz en cada llamada como hacían get_chile_time()/convert_to_chile_time().
+Como las diferencias se calculan entre instantes UTC, las duraciones que
+cruzan un cambio de horario (DST) ya no quedan corridas en una hora.
+"""
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+UTC = timezone.utc
+ZONA_CHILE = ZoneInfo('America/Santiago')
+
+
+def ahora_utc():
+    """Instante actual en UTC (con tzinfo); es lo que se guarda en la BD"""
+    return datetime.now(UTC)
+
+
+def a_utc(dt):
+    """Normaliza a UTC con tzinfo. Un datetime sin zona se asume ya en UTC."""
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=UTC)
+    return dt.astimezone(UTC)
+
+
+def a_chile(dt):
+    """Convierte a hora de Chile para mostrar"""
+    if dt is None:
+        return None
+    return a_utc(dt).astimezone(ZONA_CHILE)
+
+
+def ahora_chile():
+    return datetime.now(ZONA_CHILE)
+
+
+def inicio_dia_utc(dia):
+    """Medianoche de Chile de una fecha (date), como instante UTC"""
+    return datetime(dia.year, dia.month, dia.day, tzinfo=ZONA_CHILE).astimezone(UTC)
+
+
+def iso_utc(dt):
+    """ISO 8601 con offset (+00:00), que JavaScript interpreta sin ambigüedad"""
+    if dt is None:
+        return None
+    return a_utc(dt).isoformat()
+
+
+def segundos_entre(inicio, fin):
+    """Segundos transcurridos entre dos instantes (correcto a través de cambios de horario)"""
+    return (a_utc(fin) - a_utc(inicio)).total_seconds()
+
+
+def datetime_to_js_timestamp(dt):
+    """Convierte un datetime a timestamp compatible con JavaScript (milisegundos)"""
+    if dt is None:
+        return None
+    return int(a_utc(dt).timestamp() * 1000)